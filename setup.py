@@ -58,6 +58,7 @@ setup(
         'bin/swift-container-auditor',
         'bin/swift-container-replicator',
         'bin/swift-container-server',
+        'bin/swift-container-sharder',
         'bin/swift-container-sync',
         'bin/swift-container-updater',
         'bin/swift-dispersion-populate',
@@ -26,7 +26,7 @@ import swift.common.db
 from swift.common.db import AccountBroker
 from swift.common.utils import get_logger, get_param, hash_path, public, \
     normalize_timestamp, storage_directory, config_true_value, \
-    validate_device_partition, json, timing_stats
+    validate_device_partition, json, timing_stats, coalesce_chunks
 from swift.common.constraints import ACCOUNT_LISTING_LIMIT, \
     check_mount, check_float, check_utf8, FORMAT2CONTENT_TYPE
 from swift.common.db_replicator import ReplicatorRpc
@@ -231,37 +231,55 @@ class AccountController(object):
         account_list = broker.list_containers_iter(limit, marker, end_marker,
                                                    prefix, delimiter)
         if out_content_type == 'application/json':
-            data = []
-            for (name, object_count, bytes_used, is_subdir) in account_list:
-                if is_subdir:
-                    data.append({'subdir': name})
-                else:
-                    data.append({'name': name, 'count': object_count,
-                                'bytes': bytes_used})
-            account_list = json.dumps(data)
+            app_iter = self._json_listing_iter(account_list)
         elif out_content_type.endswith('/xml'):
-            output_list = ['<?xml version="1.0" encoding="UTF-8"?>',
-                           '<account name="%s">' % account]
-            for (name, object_count, bytes_used, is_subdir) in account_list:
-                name = saxutils.escape(name)
-                if is_subdir:
-                    output_list.append('<subdir name="%s" />' % name)
-                else:
-                    item = '<container><name>%s</name><count>%s</count>' \
-                           '<bytes>%s</bytes></container>' % \
-                           (name, object_count, bytes_used)
-                    output_list.append(item)
-            output_list.append('</account>')
-            account_list = '\n'.join(output_list)
+            app_iter = self._xml_listing_iter(account, account_list)
         else:
             if not account_list:
                 return HTTPNoContent(request=req, headers=resp_headers)
-            account_list = '\n'.join(r[0] for r in account_list) + '\n'
-        ret = Response(body=account_list, request=req, headers=resp_headers)
+            app_iter = ('%s\n' % r[0] for r in account_list)
+        ret = Response(app_iter=coalesce_chunks(app_iter), request=req,
+                       headers=resp_headers)
         ret.content_type = out_content_type
         ret.charset = 'utf-8'
         return ret
 
+    def _json_listing_iter(self, account_list):
+        """
+        Serializes listing rows as a JSON array, one row at a time.
+
+        :param account_list: rows from AccountBroker.list_containers_iter
+        """
+        yield '['
+        separator = ''
+        for (name, object_count, bytes_used, is_subdir) in account_list:
+            if is_subdir:
+                yield '%s{"subdir": %s}' % (separator, json.dumps(name))
+            else:
+                yield '%s{"name": %s, "count": %d, "bytes": %d}' % (
+                    separator, json.dumps(name), object_count, bytes_used)
+            separator = ', '
+        yield ']'
+
+    def _xml_listing_iter(self, account, account_list):
+        """
+        Serializes listing rows as an XML document, one row at a time.
+
+        :param account: account name
+        :param account_list: rows from AccountBroker.list_containers_iter
+        """
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n<account name="%s">' % \
+            account
+        for (name, object_count, bytes_used, is_subdir) in account_list:
+            name = saxutils.escape(name)
+            if is_subdir:
+                yield '\n<subdir name="%s" />' % name
+            else:
+                yield '\n<container><name>%s</name><count>%s</count>' \
+                    '<bytes>%s</bytes></container>' % \
+                    (name, object_count, bytes_used)
+        yield '\n</account>'
+
     @public
     @timing_stats()
     def REPLICATE(self, req):
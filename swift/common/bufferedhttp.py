@@ -27,11 +27,14 @@ BufferedHTTPResponse.
 """
 
 from urllib import quote
+import errno
 import logging
+import select
+import socket
 import time
 
-from eventlet.green.httplib import CONTINUE, HTTPConnection, HTTPMessage, \
-    HTTPResponse, HTTPSConnection, _UNKNOWN
+from eventlet.green.httplib import BadStatusLine, CONTINUE, HTTPConnection, \
+    HTTPMessage, HTTPResponse, HTTPSConnection, _UNKNOWN
 
 
 class BufferedHTTPResponse(HTTPResponse):
@@ -56,6 +59,7 @@ class BufferedHTTPResponse(HTTPResponse):
         self.chunk_left = _UNKNOWN      # bytes left to read in current chunk
         self.length = _UNKNOWN          # number of bytes left in response
         self.will_close = _UNKNOWN      # conn will close at end of response
+        self.pooled_conn = None         # conn to release once all is read
 
     def expect_response(self):
         if self.fp:
@@ -74,13 +78,28 @@ class BufferedHTTPResponse(HTTPResponse):
             self.msg.fp = None
 
     def close(self):
+        # The response is complete if it was not cut short and nothing of its
+        # body is left unread; only then can its connection be used again.
+        complete = self.fp is not None and not self.will_close and \
+            not self.chunked and self.length == 0
         HTTPResponse.close(self)
         self.sock = None
+        conn = self.pooled_conn
+        self.pooled_conn = None
+        if complete and conn:
+            conn.release()
 
 
 class BufferedHTTPConnection(HTTPConnection):
     """HTTPConnection class that uses BufferedHTTPResponse"""
     response_class = BufferedHTTPResponse
+    #: HTTPConnectionPool to give the connection back to after its response
+    pool = None
+    #: True for a kept-alive connection taken out of a pool
+    reused = False
+    #: (method, path, headers) of the request on a reused connection, to send
+    #: again on a new connection if the server closed the old one meanwhile
+    _resend = None
 
     def connect(self):
         self._connected_time = time.time()
@@ -89,9 +108,31 @@ class BufferedHTTPConnection(HTTPConnection):
     def putrequest(self, method, url, skip_host=0, skip_accept_encoding=0):
         self._method = method
         self._path = url
+        if self.sock:
+            # reusing a kept-alive connection
+            self._connected_time = time.time()
         return HTTPConnection.putrequest(self, method, url, skip_host,
                                          skip_accept_encoding)
 
+    def send(self, data):
+        # once a request body goes out the request can't be sent again
+        self._resend = None
+        return HTTPConnection.send(self, data)
+
+    def release(self):
+        """
+        Hands the socket of this connection over to its pool, once the last
+        response on it has been read completely.  The socket moves to a new
+        connection object so that anything still holding on to this one, and
+        maybe closing it later, cannot disturb the next user of the socket.
+        """
+        if not self.pool or not self.sock:
+            return
+        conn = BufferedHTTPConnection(self.host, self.port)
+        conn.sock = self.sock
+        self.sock = None
+        self.pool.put(conn)
+
     def getexpect(self):
         response = BufferedHTTPResponse(self.sock, strict=self.strict,
                                         method=self._method)
@@ -99,7 +140,21 @@ class BufferedHTTPConnection(HTTPConnection):
         return response
 
     def getresponse(self):
-        response = HTTPConnection.getresponse(self)
+        try:
+            response = HTTPConnection.getresponse(self)
+        except (BadStatusLine, socket.error), err:
+            resend = self._resend
+            if not resend or not _closed_before_response(err):
+                raise
+            # The server closed the kept-alive connection just as the request
+            # went out; nothing of it was handled, so it's safe to send again.
+            self.close()
+            self.reused = False
+            _send_request_headers(self, *resend)
+            response = HTTPConnection.getresponse(self)
+        self._resend = None
+        if self.pool:
+            response.pooled_conn = self
         logging.debug(_("HTTP PERF: %(time).5f seconds to %(method)s "
                         "%(host)s:%(port)s %(path)s)"),
                       {'time': time.time() - self._connected_time,
@@ -108,8 +163,121 @@ class BufferedHTTPConnection(HTTPConnection):
         return response
 
 
+class HTTPConnectionPool(object):
+    """
+    Pool of idle, persistent HTTP/1.1 connections to backend servers, kept
+    per server process so requests to the same storage node can skip the
+    TCP handshake.
+
+    Connections come back to the pool when the response on them has been read
+    completely and the server did not ask to close them.  At most
+    max_idle_per_node idle connections are kept for each node; connections idle
+    for idle_timeout seconds are closed, as are connections found readable
+    when they are taken out, which means the server closed them (or sent
+    something it shouldn't have) in the meantime.
+
+    idle_timeout has to be clearly shorter than the time the backend servers
+    keep idle connections open (keep_alive_timeout), or connections would be
+    reused just as the servers close them.  A request that finds its reused
+    connection closed before any of the response arrives is sent once more on
+    a new connection.
+
+    :param max_idle_per_node: max number of idle connections kept per node
+    :param idle_timeout: seconds after which idle connections are closed
+    """
+
+    def __init__(self, max_idle_per_node=4, idle_timeout=15):
+        self.max_idle_per_node = max_idle_per_node
+        self.idle_timeout = idle_timeout
+        self.idle = {}
+        self.last_sweep = time.time()
+
+    def get(self, host, port):
+        """
+        Takes an idle connection to the given server out of the pool.
+
+        :param host: IP address of the server
+        :param port: port of the server
+        :returns: a connected BufferedHTTPConnection, or None if there is no
+                  usable idle connection to the server
+        """
+        now = time.time()
+        self._sweep(now)
+        idle = self.idle.get((host, int(port)))
+        while idle:
+            idle_since, conn = idle.pop()
+            if now - idle_since < self.idle_timeout and self._usable(conn):
+                conn.pool = self
+                conn.reused = True
+                return conn
+            conn.close()
+        return None
+
+    def put(self, conn):
+        """
+        Puts an idle connection into the pool, or closes it if there are
+        enough idle connections to its server already.
+
+        :param conn: connected BufferedHTTPConnection
+        """
+        now = time.time()
+        self._sweep(now)
+        idle = self.idle.setdefault((conn.host, int(conn.port)), [])
+        if len(idle) >= self.max_idle_per_node:
+            conn.close()
+        else:
+            idle.append((now, conn))
+
+    def close(self):
+        """Closes all idle connections."""
+        for idle in self.idle.values():
+            for idle_since, conn in idle:
+                conn.close()
+        self.idle.clear()
+
+    def _sweep(self, now):
+        if now - self.last_sweep < self.idle_timeout:
+            return
+        self.last_sweep = now
+        for key, idle in self.idle.items():
+            while idle and now - idle[0][0] >= self.idle_timeout:
+                idle.pop(0)[1].close()
+            if not idle:
+                del self.idle[key]
+
+    def _usable(self, conn):
+        # There is nothing to read from an idle connection unless the server
+        # closed it; poll without blocking to catch those before reuse.
+        if not conn.sock:
+            return False
+        try:
+            return not select.select([conn.sock], [], [], 0)[0]
+        except (select.error, ValueError):
+            return False
+
+
+def _closed_before_response(err):
+    """
+    Tells whether an error getting a response means the server closed the
+    connection without sending anything of a response.
+    """
+    if isinstance(err, BadStatusLine):
+        # older Pythons give the empty status line, newer ones say so
+        return err.line in ('', "''") or \
+            err.line.startswith('No status line received')
+    return err.errno in (errno.ECONNRESET, errno.EPIPE)
+
+
+def _send_request_headers(conn, method, path, headers):
+    conn.putrequest(method, path, skip_host=(headers and 'Host' in headers))
+    if headers:
+        for header, value in headers.iteritems():
+            conn.putheader(header, str(value))
+    conn.endheaders()
+
+
 def http_connect(ipaddr, port, device, partition, method, path,
-                 headers=None, query_string=None, ssl=False):
+                 headers=None, query_string=None, ssl=False, pool=None):
     """
     Helper function to create an HTTPConnection object. If ssl is set True,
     HTTPSConnection will be used. However, if ssl=False, BufferedHTTPConnection
@@ -124,6 +292,8 @@ def http_connect(ipaddr, port, device, partition, method, path,
     :param headers: dictionary of headers
     :param query_string: request query string
     :param ssl: set True if SSL should be used (default: False)
+    :param pool: HTTPConnectionPool to take a kept-alive connection from, and
+                 to return the connection to after the response
     :returns: HTTPConnection object
     """
     if isinstance(path, unicode):
@@ -133,11 +303,11 @@ def http_connect(ipaddr, port, device, partition, method, path,
             logging.exception(_('Error encoding to UTF-8: %s'), e.message)
     path = quote('/' + device + '/' + str(partition) + path)
     return http_connect_raw(
-        ipaddr, port, method, path, headers, query_string, ssl)
+        ipaddr, port, method, path, headers, query_string, ssl, pool)
 
 
 def http_connect_raw(ipaddr, port, method, path, headers=None,
-                     query_string=None, ssl=False):
+                     query_string=None, ssl=False, pool=None):
     """
     Helper function to create an HTTPConnection object. If ssl is set True,
     HTTPSConnection will be used. However, if ssl=False, BufferedHTTPConnection
@@ -150,20 +320,35 @@ def http_connect_raw(ipaddr, port, method, path, headers=None,
     :param headers: dictionary of headers
     :param query_string: request query string
     :param ssl: set True if SSL should be used (default: False)
+    :param pool: HTTPConnectionPool to take a kept-alive connection from, and
+                 to return the connection to after the response; not used
+                 with SSL
     :returns: HTTPConnection object
     """
     if not port:
         port = 443 if ssl else 80
     if ssl:
         conn = HTTPSConnection('%s:%s' % (ipaddr, port))
+    elif pool:
+        conn = pool.get(ipaddr, port)
+        if not conn:
+            conn = BufferedHTTPConnection('%s:%s' % (ipaddr, port))
+            conn.pool = pool
     else:
         conn = BufferedHTTPConnection('%s:%s' % (ipaddr, port))
     if query_string:
         path += '?' + query_string
     conn.path = path
-    conn.putrequest(method, path, skip_host=(headers and 'Host' in headers))
-    if headers:
-        for header, value in headers.iteritems():
-            conn.putheader(header, str(value))
-    conn.endheaders()
+    try:
+        _send_request_headers(conn, method, path, headers)
+    except socket.error, err:
+        if not getattr(conn, 'reused', False) or \
+                not _closed_before_response(err):
+            raise
+        # the server closed the kept-alive connection meanwhile
+        conn.close()
+        conn.reused = False
+        _send_request_headers(conn, method, path, headers)
+    if getattr(conn, 'reused', False):
+        conn._resend = (method, path, headers)
     return conn
@@ -21,6 +21,7 @@ from re import sub
 import eventlet.debug
 
 from swift.common import utils
+from swift.common.profiler import start_sampling_profiler
 
 
 class Daemon(object):
@@ -50,10 +51,16 @@ class Daemon(object):
             sys.exit()
 
         signal.signal(signal.SIGTERM, kill_children)
-        if once:
-            self.run_once(**kwargs)
-        else:
-            self.run_forever(**kwargs)
+        profiler = start_sampling_profiler(
+            self.conf, self.conf.get('log_name', 'daemon'), self.logger)
+        try:
+            if once:
+                self.run_once(**kwargs)
+            else:
+                self.run_forever(**kwargs)
+        finally:
+            if profiler:
+                profiler.stop()
 
 
 def run_daemon(klass, conf_file, section_name='', once=False, **kwargs):
@@ -43,6 +43,14 @@ BROKER_TIMEOUT = 25
 PICKLE_PROTOCOL = 2
 #: Max number of pending entries
 PENDING_CAP = 131072
+#: Max number of deleted rows examined per transaction when reclaiming
+RECLAIM_BATCH_SIZE = 1000
+#: Max number of names looked up per query when merging rows
+MERGE_QUERY_SIZE = 500
+#: Container metadata key holding the shard range upper bounds
+SHARD_POINTS_KEY = 'X-Container-Shard-Points'
+#: Container metadata key holding the object count and bytes used of shards
+SHARD_STATS_KEY = 'X-Container-Shard-Stats'
 
 
 def utf8encode(*args):
@@ -349,6 +357,87 @@ class DatabaseBroker(object):
                 _('Broker error trying to rollback locked connection'))
             conn.close()
 
+    @contextmanager
+    def batched_chexor(self, conn):
+        """
+        Use with the "with" statement around bulk changes to the contained
+        rows on the given connection; the database's hash is then updated
+        once at the end rather than by the triggers calling chexor for every
+        inserted or deleted row.
+
+        For the duration of the block, the insert and delete triggers of the
+        contained table are swapped, within the same transaction, for
+        temporary ones that keep the counts up to date and only note the
+        changed rows; those are hashed and XORed into the stored hash in one
+        go at the end, and the original triggers put back.  As XOR is order
+        independent, the resulting hash is the same as with the per-row
+        triggers, which are still what hashes changes made outside a batch.
+
+        The block runs in a transaction of its own, so whatever the
+        connection had pending is committed first, and its changes are
+        rolled back if it raises.  They are not committed otherwise.
+
+        :param conn: DB connection object
+        """
+        trigger_names = ('%s_insert' % self.db_contains_type,
+                         '%s_delete' % self.db_contains_type)
+        curs = conn.execute('''
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'trigger' AND name IN (?, ?)
+        ''', trigger_names)
+        curs.row_factory = None
+        triggers = curs.fetchall()
+        if len(triggers) != len(trigger_names):
+            # not a schema we know how to batch; leave it to the triggers
+            yield
+            return
+        orig_isolation_level = conn.isolation_level
+        # DDL is only part of the transaction if it is begun explicitly.
+        conn.isolation_level = None
+        conn.execute('BEGIN')
+        try:
+            for name, sql in triggers:
+                conn.execute('DROP TRIGGER %s' % name)
+            conn.execute('''
+                CREATE TEMP TABLE chexor_batch (name TEXT, value TEXT)
+            ''')
+            self._create_batch_triggers(conn)
+            yield
+            curs = conn.execute('SELECT name, value FROM chexor_batch')
+            curs.row_factory = None
+            # the same as chexor, as names and values are read back as UTF-8
+            new = 0
+            for name, value in curs:
+                new ^= int(hashlib.md5('%s-%s' % (name, value)).hexdigest(),
+                           16)
+            conn.execute('DROP TRIGGER chexor_batch_insert')
+            conn.execute('DROP TRIGGER chexor_batch_delete')
+            conn.execute('DROP TABLE chexor_batch')
+            for name, sql in triggers:
+                conn.execute(sql)
+            if new:
+                old = conn.execute(
+                    'SELECT hash FROM %s_stat' % self.db_type).fetchone()[0]
+                conn.execute('UPDATE %s_stat SET hash = ?' % self.db_type,
+                             ('%032x' % (int(old, 16) ^ new),))
+        except (Exception, Timeout):
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.isolation_level = orig_isolation_level
+
+    def _create_batch_triggers(self, conn):
+        """
+        Create the temporary chexor_batch_insert and chexor_batch_delete
+        triggers used by batched_chexor in place of the insert and delete
+        triggers of the contained table; they must do the same but for
+        calling chexor, adding the rows' names and hashed values to the
+        chexor_batch table instead.
+
+        :param conn: DB connection object
+        """
+        raise NotImplementedError()
+
     def newid(self, remote_id):
         """
         Re-id the database.  This should be called after an rsync.
@@ -598,6 +687,46 @@ class DatabaseBroker(object):
             if self._reclaim(conn, timestamp):
                 conn.commit()
 
+    def _reclaim_deleted_rows(self, table, timestamp_column, timestamp):
+        """
+        Deletes the rows of the given table that are marked deleted and whose
+        timestamp_column is < timestamp.
+
+        Rows are handled in batches of RECLAIM_BATCH_SIZE deleted rows, each
+        committed on its own with a sleep in between, so updates to the
+        database are not held up for the whole reclaim.  Each batch walks the
+        (deleted, name) index from where the previous one left off.
+
+        :param table: table to reclaim rows from
+        :param timestamp_column: column holding the time of deletion
+        :param timestamp: max timestamp of rows to delete
+        :returns: number of rows deleted
+        """
+        reclaimed = 0
+        marker = ''
+        while True:
+            with self.get() as conn:
+                rows = conn.execute('''
+                    SELECT name FROM %s WHERE deleted = 1 AND name > ?
+                    ORDER BY name LIMIT ?
+                ''' % table, (marker, RECLAIM_BATCH_SIZE)).fetchall()
+                if not rows:
+                    break
+                end_marker = rows[-1][0]
+                with self.batched_chexor(conn):
+                    curs = conn.execute('''
+                        DELETE FROM %s WHERE deleted = 1 AND %s < ?
+                        AND name > ? AND name <= ?
+                    ''' % (table, timestamp_column),
+                        (timestamp, marker, end_marker))
+                reclaimed += curs.rowcount
+                conn.commit()
+            if len(rows) < RECLAIM_BATCH_SIZE:
+                break
+            marker = end_marker
+            sleep()
+        return reclaimed
+
     def _reclaim(self, conn, timestamp):
         """
         Removes any empty metadata values older than the timestamp using the
@@ -689,6 +818,30 @@ class ContainerBroker(DatabaseBroker):
             END;
         """)
 
+    def _create_batch_triggers(self, conn):
+        conn.execute('''
+            CREATE TEMP TRIGGER chexor_batch_insert
+            AFTER INSERT ON main.object
+            BEGIN
+                UPDATE container_stat
+                SET object_count = object_count + (1 - new.deleted),
+                    bytes_used = bytes_used + new.size;
+                INSERT INTO chexor_batch (name, value)
+                VALUES (new.name, new.created_at);
+            END
+        ''')
+        conn.execute('''
+            CREATE TEMP TRIGGER chexor_batch_delete
+            AFTER DELETE ON main.object
+            BEGIN
+                UPDATE container_stat
+                SET object_count = object_count - (1 - old.deleted),
+                    bytes_used = bytes_used - old.size;
+                INSERT INTO chexor_batch (name, value)
+                VALUES (old.name, old.created_at);
+            END
+        ''')
+
     def create_container_stat_table(self, conn, put_timestamp=None):
         """
         Create the container_stat table which is specific to the container DB.
@@ -786,7 +939,15 @@ class ContainerBroker(DatabaseBroker):
         with self.get() as conn:
             row = conn.execute(
                 'SELECT object_count from container_stat').fetchone()
-            return (row[0] == 0)
+            if row[0] != 0:
+                return False
+        return self.get_shard_stats()[0] == 0
+
+    def commit_pending(self):
+        """
+        Merges the rows queued in the .pending file into the database.
+        """
+        self._commit_puts()
 
     def _commit_puts(self, item_list=None):
         """Handles committing rows in .pending files."""
@@ -833,16 +994,17 @@ class ContainerBroker(DatabaseBroker):
 
         In addition, this calls the DatabaseBroker's :func:_reclaim method.
 
+        Object rows are deleted in batches; see :func:_reclaim_deleted_rows.
+
         :param object_timestamp: max created_at timestamp of object rows to
                                  delete
         :param sync_timestamp: max update_at timestamp of sync rows to delete
+        :returns: number of object rows deleted
         """
         self._commit_puts()
+        reclaimed = self._reclaim_deleted_rows('object', 'created_at',
+                                               object_timestamp)
         with self.get() as conn:
-            conn.execute("""
-                    DELETE FROM object
-                    WHERE deleted = 1
-                    AND created_at < ?""", (object_timestamp,))
             try:
                 conn.execute('''
                     DELETE FROM outgoing_sync WHERE updated_at < ?
@@ -856,6 +1018,7 @@ class ContainerBroker(DatabaseBroker):
                     raise
             DatabaseBroker._reclaim(self, conn, object_timestamp)
             conn.commit()
+        return reclaimed
 
     def delete_object(self, name, timestamp):
         """
@@ -972,15 +1135,147 @@ class ContainerBroker(DatabaseBroker):
                     else:
                         raise
             data = dict(data)
-            if include_metadata:
+            metadata = data.pop('metadata', '') or ''
+            if include_metadata or SHARD_STATS_KEY in metadata:
                 try:
-                    data['metadata'] = json.loads(data.get('metadata', ''))
+                    metadata = json.loads(metadata)
                 except ValueError:
-                    data['metadata'] = {}
-            elif 'metadata' in data:
-                del data['metadata']
+                    metadata = {}
+                if include_metadata:
+                    data['metadata'] = metadata
+                object_count, bytes_used = self._parse_shard_stats(metadata)
+                data['object_count'] += object_count
+                data['bytes_used'] += bytes_used
             return data
 
+    def _parse_shard_stats(self, metadata):
+        stats = metadata.get(SHARD_STATS_KEY, ('', None))[0]
+        if not stats:
+            return 0, 0
+        stats = json.loads(stats)
+        return stats['object_count'], stats['bytes_used']
+
+    def get_shard_stats(self):
+        """
+        Get the object count and bytes used last gathered from the shards of
+        this container.
+
+        :returns: tuple of (object_count, bytes_used); zeros if the
+                  container is not sharded
+        """
+        return self._parse_shard_stats(self.metadata)
+
+    def set_shard_stats(self, object_count, bytes_used, timestamp):
+        """
+        Record the object count and bytes used of the shards of this
+        container, to be added to the container's own stats.
+
+        :param object_count: total object count of the shards
+        :param bytes_used: total bytes used of the shards
+        :param timestamp: timestamp of the update
+        """
+        stats = json.dumps({'object_count': object_count,
+                            'bytes_used': bytes_used})
+        self.update_metadata(
+            {SHARD_STATS_KEY: (stats, normalize_timestamp(timestamp))})
+
+    def get_shard_points(self):
+        """
+        Get the shard points of this container: the sorted names bounding
+        its shard ranges.  Shard range i holds the names greater than
+        point i - 1 and less than or equal to point i; the last range is
+        unbounded.
+
+        :returns: list of names; empty if the container is not sharded
+        """
+        points = self.metadata.get(SHARD_POINTS_KEY, ('', None))[0]
+        if not points:
+            return []
+        return utf8encode(*json.loads(points))
+
+    def set_shard_points(self, shard_points, timestamp):
+        """
+        Mark this container as sharded at the given shard points.
+
+        :param shard_points: sorted list of shard range upper bounds
+        :param timestamp: timestamp of the update
+        """
+        self.update_metadata(
+            {SHARD_POINTS_KEY: (json.dumps(shard_points),
+                                normalize_timestamp(timestamp))})
+
+    def find_shard_points(self, rows_per_shard):
+        """
+        Find shard points splitting the undeleted objects of this container
+        into ranges of rows_per_shard objects.
+
+        :param rows_per_shard: number of objects per shard range
+        :returns: sorted list of shard range upper bounds
+        """
+        self._commit_puts()
+        shard_points = []
+        with self.get() as conn:
+            offset = rows_per_shard - 1
+            while True:
+                row = conn.execute('''
+                    SELECT name FROM object WHERE deleted = 0
+                    ORDER BY name LIMIT 1 OFFSET ?
+                ''', (offset,)).fetchone()
+                if not row:
+                    break
+                shard_points.append(row[0])
+                offset += rows_per_shard
+        return shard_points
+
+    def get_objects_in_range(self, lower, upper, limit):
+        """
+        Get the object rows, including deleted ones, whose names are greater
+        than lower and less than or equal to upper.
+
+        :param lower: exclusive lower bound, or None for no lower bound
+        :param upper: inclusive upper bound, or None for no upper bound
+        :param limit: maximum number of rows to return
+        :returns: list of dicts of {'name', 'created_at', 'size',
+                  'content_type', 'etag', 'deleted'} as used by merge_items
+        """
+        self._commit_puts()
+        query = '''SELECT name, created_at, size, content_type, etag, deleted
+                   FROM object'''
+        conditions = []
+        query_args = []
+        if lower is not None:
+            conditions.append('name > ?')
+            query_args.append(lower)
+        if upper is not None:
+            conditions.append('name <= ?')
+            query_args.append(upper)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY name LIMIT ?'
+        query_args.append(limit)
+        with self.get() as conn:
+            curs = conn.execute(query, query_args)
+            curs.row_factory = None
+            return [{'name': r[0], 'created_at': r[1], 'size': r[2],
+                     'content_type': r[3], 'etag': r[4], 'deleted': r[5]}
+                    for r in curs]
+
+    def remove_objects(self, item_list):
+        """
+        Remove object rows from this container without leaving tombstones,
+        e.g. once they have been moved to a shard container.  Only rows with
+        the exact name and created_at of an item are removed, so newer rows
+        for the same names are kept.
+
+        :param item_list: list of dicts with at least 'name' and 'created_at'
+        """
+        with self.get() as conn:
+            with self.batched_chexor(conn):
+                conn.executemany(
+                    'DELETE FROM object WHERE name = ? AND created_at = ?',
+                    ((rec['name'], rec['created_at']) for rec in item_list))
+            conn.commit()
+
     def set_x_container_sync_points(self, sync_point1, sync_point2):
         with self.get() as conn:
             orig_isolation_level = conn.isolation_level
@@ -1047,7 +1342,7 @@ class ContainerBroker(DatabaseBroker):
             conn.commit()
 
     def list_objects_iter(self, limit, marker, end_marker, prefix, delimiter,
-                          path=None):
+                          path=None, include_deleted=False):
         """
         Get a list of objects sorted by name starting at marker onward, up
         to limit entries.  Entries will begin with the prefix and will not
@@ -1060,10 +1355,88 @@ class ContainerBroker(DatabaseBroker):
         :param delimiter: delimiter for query
         :param path: if defined, will set the prefix and delimter based on
                      the path
+        :param include_deleted: if True, the deleted objects whose names fall
+                                within the entries listed are listed too,
+                                without counting towards limit; each tuple
+                                then ends with a deleted flag
+
+        :returns: list of tuples of (name, created_at, size, content_type,
+                  etag), or of (name, created_at, size, content_type, etag,
+                  deleted) with include_deleted
+        """
+        results = self._list_objects(limit, marker, end_marker, prefix,
+                                     delimiter, path)
+        if not include_deleted:
+            return results
+        # Rows beyond a full page's last entry may not be listed; neither
+        # are the deleted ones among them.
+        upto = results[-1][0] if len(results) >= limit else None
+        results = [tuple(row) + (0,) for row in results]
+        results.extend(row + (1,) for row in self._list_deleted_objects(
+            marker, end_marker, prefix, delimiter, path, upto))
+        results.sort()
+        return results
+
+    def _list_deleted_objects(self, marker, end_marker, prefix, delimiter,
+                              path, upto):
+        """
+        Get the deleted objects _list_objects would list if they weren't
+        deleted, up to and including the name upto if given; like
+        subdirectories, they are gone with the objects in them.
 
         :returns: list of tuples of (name, created_at, size, content_type,
                   etag)
         """
+        (marker, end_marker, prefix, delimiter, path, upto) = utf8encode(
+            marker, end_marker, prefix, delimiter, path, upto)
+        if path is not None:
+            prefix = path
+            if path:
+                prefix = path = path.rstrip('/') + '/'
+            delimiter = '/'
+        with self.get() as conn:
+            query = '''SELECT name, created_at, size, content_type, etag
+                       FROM object WHERE'''
+            query_args = []
+            if end_marker:
+                query += ' name < ? AND'
+                query_args.append(end_marker)
+            if upto:
+                query += ' name <= ? AND'
+                query_args.append(upto)
+            if marker and (not prefix or marker >= prefix):
+                query += ' name > ? AND'
+                query_args.append(marker)
+            elif prefix:
+                query += ' name >= ? AND'
+                query_args.append(prefix)
+            if self.get_db_version(conn) < 1:
+                query += ' +deleted = 1'
+            else:
+                query += ' deleted = 1'
+            query += ' ORDER BY name'
+            curs = conn.execute(query, query_args)
+            curs.row_factory = None
+            results = []
+            for row in curs:
+                name = row[0]
+                if prefix:
+                    if not name.startswith(prefix):
+                        break
+                    if name == path:
+                        continue
+                if delimiter:
+                    end = name.find(delimiter, len(prefix or ''))
+                    if path is not None:
+                        if end >= 0 and len(name) > end + len(delimiter):
+                            continue
+                    elif end > 0:
+                        continue
+                results.append(tuple(row))
+            return results
+
+    def _list_objects(self, limit, marker, end_marker, prefix, delimiter,
+                      path):
         (marker, end_marker, prefix, delimiter, path) = utf8encode(
             marker, end_marker, prefix, delimiter, path)
         try:
@@ -1144,26 +1517,52 @@ class ContainerBroker(DatabaseBroker):
         """
         with self.get() as conn:
             max_rowid = -1
-            for rec in item_list:
-                query = '''
-                    DELETE FROM object
-                    WHERE name = ? AND (created_at < ?)
-                '''
-                if self.get_db_version(conn) >= 1:
-                    query += ' AND deleted IN (0, 1)'
-                conn.execute(query, (rec['name'], rec['created_at']))
-                query = 'SELECT 1 FROM object WHERE name = ?'
-                if self.get_db_version(conn) >= 1:
-                    query += ' AND deleted IN (0, 1)'
-                if not conn.execute(query, (rec['name'],)).fetchall():
-                    conn.execute('''
-                        INSERT INTO object (name, created_at, size,
-                            content_type, etag, deleted)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', ([rec['name'], rec['created_at'], rec['size'],
-                          rec['content_type'], rec['etag'], rec['deleted']]))
+            deleted_filter = ''
+            if self.get_db_version(conn) >= 1:
+                deleted_filter = ' AND deleted IN (0, 1)'
+            # Look up the existing rows for the whole batch up front so the
+            # deletes and inserts can each be done in one go.
+            existing = {}
+            names = list(set(utf8encode(*[rec['name'] for rec in item_list])))
+            for offset in xrange(0, len(names), MERGE_QUERY_SIZE):
+                chunk = names[offset:offset + MERGE_QUERY_SIZE]
+                curs = conn.execute('''
+                    SELECT name, created_at FROM object
+                    WHERE name IN (%s)%s
+                ''' % (','.join('?' * len(chunk)), deleted_filter), chunk)
+                curs.row_factory = None
+                for name, created_at in curs:
+                    existing.setdefault(name, []).append(created_at)
+            to_delete = []
+            to_add = {}
+            for index, rec in enumerate(item_list):
+                name = utf8encode(rec['name'])[0]
+                created_ats = existing.get(name, [])
+                if [c for c in created_ats if c < rec['created_at']]:
+                    to_delete.append((name, rec['created_at']))
+                    created_ats = [c for c in created_ats
+                                   if c >= rec['created_at']]
+                    if name in to_add and \
+                            to_add[name][1][1] < rec['created_at']:
+                        del to_add[name]
+                if not created_ats:
+                    created_ats = [rec['created_at']]
+                    to_add[name] = (index, [name, rec['created_at'],
+                                            rec['size'], rec['content_type'],
+                                            rec['etag'], rec['deleted']])
+                existing[name] = created_ats
                 if source:
                     max_rowid = max(max_rowid, rec['ROWID'])
+            with self.batched_chexor(conn):
+                conn.executemany('''
+                    DELETE FROM object
+                    WHERE name = ? AND (created_at < ?)
+                ''' + deleted_filter, to_delete)
+                conn.executemany('''
+                    INSERT INTO object (name, created_at, size,
+                        content_type, etag, deleted)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (record for index, record in sorted(to_add.values())))
             if source:
                 try:
                     conn.execute('''
@@ -1247,6 +1646,38 @@ class AccountBroker(DatabaseBroker):
             END;
         """)
 
+    def _create_batch_triggers(self, conn):
+        conn.execute('''
+            CREATE TEMP TRIGGER chexor_batch_insert
+            AFTER INSERT ON main.container
+            BEGIN
+                UPDATE account_stat
+                SET container_count = container_count + (1 - new.deleted),
+                    object_count = object_count + new.object_count,
+                    bytes_used = bytes_used + new.bytes_used;
+                INSERT INTO chexor_batch (name, value)
+                VALUES (new.name,
+                        new.put_timestamp || '-' ||
+                          new.delete_timestamp || '-' ||
+                          new.object_count || '-' || new.bytes_used);
+            END
+        ''')
+        conn.execute('''
+            CREATE TEMP TRIGGER chexor_batch_delete
+            AFTER DELETE ON main.container
+            BEGIN
+                UPDATE account_stat
+                SET container_count = container_count - (1 - old.deleted),
+                    object_count = object_count - old.object_count,
+                    bytes_used = bytes_used - old.bytes_used;
+                INSERT INTO chexor_batch (name, value)
+                VALUES (old.name,
+                        old.put_timestamp || '-' ||
+                          old.delete_timestamp || '-' ||
+                          old.object_count || '-' || old.bytes_used);
+            END
+        ''')
+
     def create_account_stat_table(self, conn, put_timestamp):
         """
         Create account_stat table which is specific to the account DB.
@@ -1378,17 +1809,19 @@ class AccountBroker(DatabaseBroker):
 
         In addition, this calls the DatabaseBroker's :func:_reclaim method.
 
+        Container rows are deleted in batches; see
+        :func:_reclaim_deleted_rows.
+
         :param container_timestamp: max created_at timestamp of container rows
                                     to delete
         :param sync_timestamp: max update_at timestamp of sync rows to delete
+        :returns: number of container rows deleted
         """
 
         self._commit_puts()
+        reclaimed = self._reclaim_deleted_rows('container', 'delete_timestamp',
+                                               container_timestamp)
         with self.get() as conn:
-            conn.execute('''
-                DELETE FROM container WHERE
-                deleted = 1 AND delete_timestamp < ?
-            ''', (container_timestamp,))
             try:
                 conn.execute('''
                     DELETE FROM outgoing_sync WHERE updated_at < ?
@@ -1402,6 +1835,7 @@ class AccountBroker(DatabaseBroker):
                     raise
             DatabaseBroker._reclaim(self, conn, container_timestamp)
             conn.commit()
+        return reclaimed
 
     def put_container(self, name, put_timestamp, delete_timestamp,
                       object_count, bytes_used):
@@ -1609,47 +2043,49 @@ class AccountBroker(DatabaseBroker):
         """
         with self.get() as conn:
             max_rowid = -1
-            for rec in item_list:
-                record = [rec['name'], rec['put_timestamp'],
-                          rec['delete_timestamp'], rec['object_count'],
-                          rec['bytes_used'], rec['deleted']]
-                query = '''
-                    SELECT name, put_timestamp, delete_timestamp,
-                           object_count, bytes_used, deleted
-                    FROM container WHERE name = ?
-                '''
-                if self.get_db_version(conn) >= 1:
-                    query += ' AND deleted IN (0, 1)'
-                curs = conn.execute(query, (rec['name'],))
-                curs.row_factory = None
-                row = curs.fetchone()
-                if row:
-                    row = list(row)
-                    for i in xrange(5):
-                        if record[i] is None and row[i] is not None:
-                            record[i] = row[i]
-                    if row[1] > record[1]:  # Keep newest put_timestamp
-                        record[1] = row[1]
-                    if row[2] > record[2]:  # Keep newest delete_timestamp
-                        record[2] = row[2]
-                    # If deleted, mark as such
-                    if record[2] > record[1] and \
-                            record[3] in (None, '', 0, '0'):
-                        record[5] = 1
-                    else:
-                        record[5] = 0
-                conn.execute('''
-                    DELETE FROM container WHERE name = ? AND
-                                                deleted IN (0, 1)
-                ''', (record[0],))
-                conn.execute('''
-                    INSERT INTO container (name, put_timestamp,
-                        delete_timestamp, object_count, bytes_used,
-                        deleted)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', record)
-                if source:
-                    max_rowid = max(max_rowid, rec['ROWID'])
+            db_version = self.get_db_version(conn)
+            with self.batched_chexor(conn):
+                for rec in item_list:
+                    record = [rec['name'], rec['put_timestamp'],
+                              rec['delete_timestamp'], rec['object_count'],
+                              rec['bytes_used'], rec['deleted']]
+                    query = '''
+                        SELECT name, put_timestamp, delete_timestamp,
+                               object_count, bytes_used, deleted
+                        FROM container WHERE name = ?
+                    '''
+                    if db_version >= 1:
+                        query += ' AND deleted IN (0, 1)'
+                    curs = conn.execute(query, (rec['name'],))
+                    curs.row_factory = None
+                    row = curs.fetchone()
+                    if row:
+                        row = list(row)
+                        for i in xrange(5):
+                            if record[i] is None and row[i] is not None:
+                                record[i] = row[i]
+                        if row[1] > record[1]:  # Keep newest put_timestamp
+                            record[1] = row[1]
+                        if row[2] > record[2]:  # Keep newest delete_timestamp
+                            record[2] = row[2]
+                        # If deleted, mark as such
+                        if record[2] > record[1] and \
+                                record[3] in (None, '', 0, '0'):
+                            record[5] = 1
+                        else:
+                            record[5] = 0
+                    conn.execute('''
+                        DELETE FROM container WHERE name = ? AND
+                                                    deleted IN (0, 1)
+                    ''', (record[0],))
+                    conn.execute('''
+                        INSERT INTO container (name, put_timestamp,
+                            delete_timestamp, object_count, bytes_used,
+                            deleted)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', record)
+                    if source:
+                        max_rowid = max(max_rowid, rec['ROWID'])
             if source:
                 try:
                     conn.execute('''
@@ -164,6 +164,8 @@ class Replicator(Daemon):
         self.reclaim_age = float(conf.get('reclaim_age', 86400 * 7))
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        swift.common.db.RECLAIM_BATCH_SIZE = \
+            int(conf.get('reclaim_batch_size', 1000))
         self._zero_stats()
         self.recon_cache_path = conf.get('recon_cache_path',
                                          '/var/cache/swift')
@@ -178,7 +180,7 @@ class Replicator(Daemon):
         self.stats = {'attempted': 0, 'success': 0, 'failure': 0, 'ts_repl': 0,
                       'no_change': 0, 'hashmatch': 0, 'rsync': 0, 'diff': 0,
                       'remove': 0, 'empty': 0, 'remote_merge': 0,
-                      'start': time.time(), 'diff_capped': 0}
+                      'start': time.time(), 'diff_capped': 0, 'reclaimed': 0}
 
     def _report_stats(self):
         """Report the current stats to the logs."""
@@ -200,7 +202,7 @@ class Replicator(Daemon):
         self.logger.info(' '.join(['%s:%s' % item for item in
                          self.stats.items() if item[0] in
                          ('no_change', 'hashmatch', 'rsync', 'diff', 'ts_repl',
-                          'empty', 'diff_capped')]))
+                          'empty', 'diff_capped', 'reclaimed')]))
 
     def _rsync_file(self, db_file, remote_file, whole_file=True):
         """
@@ -409,8 +411,11 @@ class Replicator(Daemon):
         self.logger.increment('attempts')
         try:
             broker = self.brokerclass(object_file, pending_timeout=30)
-            broker.reclaim(time.time() - self.reclaim_age,
-                           time.time() - (self.reclaim_age * 2))
+            reclaimed = broker.reclaim(time.time() - self.reclaim_age,
+                                       time.time() - (self.reclaim_age * 2))
+            if reclaimed:
+                self.stats['reclaimed'] += reclaimed
+                self.logger.update_stats('reclaimed', reclaimed)
             info = broker.get_replication_info()
             full_info = broker.get_info()
         except (Exception, Timeout), e:
@@ -27,6 +27,8 @@ import time
 from bisect import bisect
 from hashlib import md5
 
+from eventlet import GreenPile
+
 from swift.common.utils import json
 
 DEFAULT_MEMCACHED_PORT = 11211
@@ -104,10 +106,10 @@ class MemcacheRing(object):
                 self._error_limited[server] = now + ERROR_LIMIT_DURATION
                 logging.error(_('Error limiting server %s'), server)
 
-    def _get_conns(self, key):
+    def _get_servers(self, key):
         """
-        Retrieves a server conn from the pool, or connects a new one.
-        Chooses the server based on a consistent hash of "key".
+        Yields the servers to try for "key", based on a consistent hash of
+        it, skipping those that are error limited.
         """
         pos = bisect(self._sorted, key)
         served = []
@@ -119,6 +121,14 @@ class MemcacheRing(object):
             served.append(server)
             if self._error_limited[server] > time.time():
                 continue
+            yield server
+
+    def _get_conns(self, key):
+        """
+        Retrieves a server conn from the pool, or connects a new one.
+        Chooses the server based on a consistent hash of "key".
+        """
+        for server in self._get_servers(key):
             try:
                 fp, sock = self._client_cache[server].pop()
                 yield server, fp, sock
@@ -363,8 +373,10 @@ class MemcacheRing(object):
                             is used
         :returns: list of values
         """
-        server_key = md5hash(server_key)
-        keys = [md5hash(key) for key in keys]
+        return self._get_multi([md5hash(key) for key in keys],
+                               md5hash(server_key))
+
+    def _get_multi(self, keys, server_key):
         for (server, fp, sock) in self._get_conns(server_key):
             try:
                 sock.sendall('get %s\r\n' % ' '.join(keys))
@@ -394,3 +406,35 @@ class MemcacheRing(object):
                 return values
             except Exception, e:
                 self._exception_occurred(server, e)
+
+    def get_many(self, keys):
+        """
+        Gets the values of keys that, unlike with get_multi, each live on
+        the server their own hash picks. The keys are grouped by server and
+        each server gets a single request for its keys, all servers in
+        parallel, so this takes about the time of a single get.
+
+        :param keys: keys for values to be retrieved from memcache
+        :returns: list of values, None for keys that were not found
+        """
+        keys = [md5hash(key) for key in keys]
+        groups = {}
+        for key in keys:
+            for server in self._get_servers(key):
+                groups.setdefault(server, []).append(key)
+                break
+        groups = groups.values()
+        if not groups:
+            return [None] * len(keys)
+        if len(groups) == 1:
+            results = [self._get_multi(groups[0], groups[0][0])]
+        else:
+            pile = GreenPile(len(groups))
+            for group in groups:
+                pile.spawn(self._get_multi, group, group[0])
+            results = list(pile)
+        responses = {}
+        for group, values in zip(groups, results):
+            if values:
+                responses.update(zip(group, values))
+        return [responses.get(key) for key in keys]
@@ -56,15 +56,25 @@ needed. With the doubled proxy logs, any consumer/processor of swift's proxy
 logs should look at the swift.source field, the rightmost log value, to decide
 if this is a middleware subrequest or not. A log processor calculating
 bandwidth usage will want to only sum up logs with no swift.source.
+
+A sample of the requests, stage_timing_sample_rate of them, can be timed
+stage by stage as they go through the proxy: looking up the container, auth,
+connecting to the object servers, the upload of the client, waiting for the
+final statuses of the object servers and so on. Each stage is sent to StatsD
+as a <type>.<verb>.<status>.stages.<stage>.timing metric and, with
+log_stage_timings turned on, added to the log line as one more field after
+swift.source: a comma-separated list of stage:seconds entries, or a hyphen for
+requests that weren't sampled.
 """
 
+import random
 import time
 from urllib import quote, unquote
 
 from swift.common.swob import Request
 from swift.common.utils import (get_logger, get_remote_client,
                                 get_valid_utf8_str, config_true_value,
-                                InputProxy)
+                                InputProxy, StageTimings)
 
 
 class ProxyLoggingMiddleware(object):
@@ -91,13 +101,18 @@ class ProxyLoggingMiddleware(object):
                     'log_udp_port', 'log_statsd_host', 'log_statsd_port',
                     'log_statsd_default_sample_rate',
                     'log_statsd_sample_rate_factor',
-                    'log_statsd_metric_prefix'):
+                    'log_statsd_metric_prefix', 'log_statsd_flush_interval',
+                    'log_statsd_max_packet_size'):
             value = conf.get('access_' + key, conf.get(key, None))
             if value:
                 access_log_conf[key] = value
         self.access_logger = get_logger(access_log_conf,
                                         log_route='proxy-access')
         self.access_logger.set_statsd_prefix('proxy-server')
+        self.stage_timing_sample_rate = float(conf.get(
+            'stage_timing_sample_rate', 0))
+        self.log_stage_timings = config_true_value(conf.get(
+            'log_stage_timings', 'no'))
 
     def method_from_req(self, req):
         return req.environ.get('swift.orig_req_method', req.method)
@@ -130,7 +145,7 @@ class ProxyLoggingMiddleware(object):
             logged_headers = '\n'.join('%s: %s' % (k, v)
                                        for k, v in req.headers.items())
         method = self.method_from_req(req)
-        self.access_logger.info(' '.join(
+        log_line = ' '.join(
             quote(str(x) if x else '-')
             for x in (
                 get_remote_client(req),
@@ -150,7 +165,14 @@ class ProxyLoggingMiddleware(object):
                 logged_headers,
                 '%.4f' % request_time,
                 req.environ.get('swift.source'),
-            )))
+            ))
+        stage_timings = req.environ.get('swift.stage_timings')
+        if self.log_stage_timings:
+            # stage names and timings need no quoting
+            log_line += ' ' + (str(stage_timings)
+                               if stage_timings and stage_timings.stages
+                               else '-')
+        self.access_logger.info(log_line)
         self.mark_req_logged(req)
         # Log timing and bytes-transfered data to StatsD
         metric_name = self.statsd_metric_name(req, status_int, method)
@@ -161,6 +183,11 @@ class ProxyLoggingMiddleware(object):
                                       request_time * 1000)
             self.access_logger.update_stats(metric_name + '.xfer',
                                             bytes_received + bytes_sent)
+            if stage_timings:
+                for stage, seconds in stage_timings.stages:
+                    self.access_logger.timing(
+                        '%s.stages.%s.timing' % (metric_name, stage),
+                        seconds * 1000)
 
     def statsd_metric_name(self, req, status_int, method):
         if req.path.startswith('/v1/'):
@@ -182,6 +209,11 @@ class ProxyLoggingMiddleware(object):
         input_proxy = InputProxy(env['wsgi.input'])
         env['wsgi.input'] = input_proxy
         start_time = time.time()
+        # the left-most proxy-logging samples the request for both
+        if self.stage_timing_sample_rate and \
+                'swift.stage_timings' not in env and \
+                random.random() < self.stage_timing_sample_rate:
+            env['swift.stage_timings'] = StageTimings()
 
         def my_start_response(status, headers, exc_info=None):
             start_response_args[0] = (status, list(headers), exc_info)
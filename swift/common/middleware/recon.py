@@ -19,6 +19,7 @@ import os
 from swift.common.swob import Request, Response
 from swift.common.utils import get_logger, config_true_value, json
 from swift.common.constraints import check_mount
+from swift.common.profiler import read_profiles
 from resource import getpagesize
 from hashlib import md5
 
@@ -50,6 +51,7 @@ class ReconMiddleware(object):
                                                   'container.recon')
         self.account_recon_cache = os.path.join(self.recon_cache_path,
                                                 'account.recon')
+        self.profile_dir = os.path.join(self.recon_cache_path, 'profile')
         self.account_ring_path = os.path.join(swift_dir, 'account.ring.gz')
         self.container_ring_path = os.path.join(swift_dir, 'container.ring.gz')
         self.object_ring_path = os.path.join(swift_dir, 'object.ring.gz')
@@ -271,6 +273,17 @@ class ReconMiddleware(object):
                 raise
         return sockstat
 
+    def get_profile(self, name=None):
+        """
+        get the samples of the sampling profilers of the running servers and
+        daemons, added up, in the folded format of flame graph tools
+
+        :param name: if given, only the samples of this kind of server or
+                     daemon, e.g. object-replicator
+        """
+        return ''.join('%s %d\n' % item for item in sorted(
+            read_profiles(self.profile_dir, name).iteritems()))
+
     def GET(self, req):
         root, rcheck, rtype = req.split_path(1, 3, True)
         all_rtypes = ['account', 'container', 'object']
@@ -305,6 +318,9 @@ class ReconMiddleware(object):
             content = self.get_quarantine_count()
         elif rcheck == "sockstat":
             content = self.get_socket_info()
+        elif rcheck == "profile":
+            return Response(request=req, body=self.get_profile(rtype),
+                            content_type="text/plain")
         else:
             content = "Invalid path: %s" % req.path
             return Response(request=req, status="404 Not Found",
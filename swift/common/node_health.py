@@ -0,0 +1,241 @@
+# Copyright (c) 2010-2013 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Node health state shared by all the workers of a server through a memory
+mapped file.
+"""
+
+import mmap
+import os
+import struct
+from hashlib import md5
+from tempfile import mkstemp
+
+from swift.common.utils import lock_parent_directory, mkdirs
+
+
+HEADER = struct.Struct('<4sII')
+MAGIC = 'SWNH'
+VERSION = 2
+# key hash, then the record fields
+SLOT = struct.Struct('<Qi4xddddddd')
+FIELDS = ('errors', 'last_error', 'timing', 'timing_expires', 'connect_ewma',
+          'first_byte_ewma', 'latency_updated', 'ejected_until')
+EMPTY = (0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+# A key is only looked for this many slots on from where it hashes to, so
+# looking up a node the table has no record of stays cheap however full the
+# table gets.
+MAX_PROBES = 32
+
+
+class NodeHealthTable(object):
+    """
+    A fixed size hash table of node health records, kept in a file that all
+    the workers of a server map into memory. When one worker finds a node
+    failing, the others then stop using it too instead of each having to run
+    into its errors by itself.
+
+    Records are looked up by a string key, such as ``ip:port/device`` for
+    a device or ``ip`` for the timings of a server, and hold an error count
+    with the time of the last error, a timing with the time it expires, and
+    the latency averages of a device with the time they were last updated
+    and the time until which the device is ejected as an outlier. Reads and
+    updates of a record are not locked: two workers updating the same record
+    at the same time may lose one of the updates, which only makes a node's
+    error count a little lower or its latency averages a little off. Adding
+    a record to the table is done under a lock, though, so two keys can never
+    end up in the same slot.
+
+    Records are never removed, so the table needs more slots than there are
+    devices and servers in the rings. A key is only looked for in the
+    MAX_PROBES slots from where it hashes to; when those are all taken, as
+    happens once the table fills up with the records of nodes long gone
+    from the rings, the key's record is kept in the worker's memory instead,
+    and a warning is logged, once per worker, and counted.
+
+    :param path: path of the file to map; it is created, or replaced if it
+                 has a different number of slots, as needed
+    :param slots: number of records the table holds
+    :param logger: logger to warn about a full table with
+    """
+
+    def __init__(self, path, slots=8192, logger=None):
+        self.path = path
+        self.slots = slots
+        self.logger = logger
+        # records of the keys without a slot, kept by this worker alone
+        self.overflow = {}
+        self.size = HEADER.size + SLOT.size * slots
+        mkdirs(os.path.dirname(path))
+        with lock_parent_directory(path):
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except OSError:
+                fd = self._create()
+            else:
+                if os.fstat(fd).st_size != self.size or \
+                        os.read(fd, HEADER.size) != \
+                        HEADER.pack(MAGIC, VERSION, slots):
+                    os.close(fd)
+                    fd = self._create()
+        try:
+            self.map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+
+    def _create(self):
+        """
+        Writes out an empty table and moves it into place. The file is
+        replaced rather than truncated, as workers still running with the
+        old table mapped would crash on accessing its truncated pages.
+        """
+        fd, tmppath = mkstemp(dir=os.path.dirname(self.path))
+        try:
+            os.write(fd, HEADER.pack(MAGIC, VERSION, self.slots))
+            os.ftruncate(fd, self.size)
+            os.fchmod(fd, 0644)
+            os.rename(tmppath, self.path)
+        except Exception:
+            os.close(fd)
+            os.unlink(tmppath)
+            raise
+        return fd
+
+    def _hash(self, key):
+        return struct.unpack('<Q', md5(key).digest()[:8])[0] or 1
+
+    def _find(self, key, add=False):
+        """
+        Finds the offset of the record for a key.
+
+        :param key: key of the record
+        :param add: if True, a slot is taken for the key if it has none yet
+        :returns: offset of the record, or None if there is none
+        """
+        key_hash = self._hash(key)
+        start = key_hash % self.slots
+        for i in xrange(min(self.slots, MAX_PROBES)):
+            offset = HEADER.size + SLOT.size * ((start + i) % self.slots)
+            slot_hash = struct.unpack_from('<Q', self.map, offset)[0]
+            if slot_hash == key_hash:
+                return offset
+            if not slot_hash:
+                if not add:
+                    return None
+                with lock_parent_directory(self.path):
+                    # another worker may have taken the slot meanwhile
+                    slot_hash = struct.unpack_from('<Q', self.map, offset)[0]
+                    if not slot_hash:
+                        SLOT.pack_into(self.map, offset, key_hash, *EMPTY[1:])
+                        return offset
+                if slot_hash == key_hash:
+                    return offset
+        return None
+
+    def _get(self, key):
+        offset = self._find(key)
+        if offset is None:
+            return tuple(self.overflow.get(key, EMPTY))
+        return SLOT.unpack_from(self.map, offset)
+
+    def _set(self, key, **fields):
+        offset = self._find(key, add=True)
+        if offset is None:
+            if key not in self.overflow:
+                self._overflowed(key)
+            record = self.overflow.setdefault(key, list(EMPTY))
+        else:
+            record = list(SLOT.unpack_from(self.map, offset))
+        for index, field in enumerate(FIELDS, 1):
+            if field in fields:
+                record[index] = fields[field]
+        if offset is not None:
+            SLOT.pack_into(self.map, offset, *record)
+
+    def _overflowed(self, key):
+        """
+        Called when a key can't be given a slot; warns the first time.
+        """
+        if not self.logger:
+            return
+        self.logger.increment('node_health.overflows')
+        if not self.overflow:
+            self.logger.warning(_(
+                'Node health table %(path)s has no slot left for %(key)s; '
+                'keeping its state in this worker only. Raise '
+                'node_health_slots, or remove the file to start over.'),
+                {'path': self.path, 'key': key})
+
+    def get_errors(self, key):
+        """
+        Returns the error count of a node and the time of its last error.
+
+        :param key: key of the node
+        :returns: tuple of (errors, last_error); (0, 0.0) if there are none
+        """
+        return self._get(key)[1:3]
+
+    def set_errors(self, key, errors, last_error):
+        """
+        Sets the error count of a node and the time of its last error.
+
+        :param key: key of the node
+        :param errors: error count
+        :param last_error: time of the last error
+        """
+        self._set(key, errors=errors, last_error=last_error)
+
+    def get_timing(self, key):
+        """
+        Returns the timing of a node and the time it expires.
+
+        :param key: key of the node
+        :returns: tuple of (timing, expires); (0.0, 0.0) if there is none
+        """
+        return self._get(key)[3:5]
+
+    def set_timing(self, key, timing, expires):
+        """
+        Sets the timing of a node and the time it expires.
+
+        :param key: key of the node
+        :param timing: timing
+        :param expires: time the timing expires
+        """
+        self._set(key, timing=timing, timing_expires=expires)
+
+    def get_latency(self, key):
+        """
+        Returns the latency averages of a node.
+
+        :param key: key of the node
+        :returns: tuple of (connect_ewma, first_byte_ewma, latency_updated,
+                  ejected_until); all 0.0 if there are none
+        """
+        return self._get(key)[5:9]
+
+    def set_latency(self, key, **fields):
+        """
+        Sets the latency averages of a node.
+
+        :param key: key of the node
+        :param fields: any of connect_ewma, first_byte_ewma, latency_updated
+                       and ejected_until
+        """
+        self._set(key, **fields)
+
+    def close(self):
+        self.map.close()
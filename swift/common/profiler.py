@@ -0,0 +1,220 @@
+# Copyright (c) 2010-2013 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A sampling profiler for finding out where servers and daemons spend their CPU
+time under real load.
+
+Every so much CPU time the process uses, a SIGPROF interrupts whichever green
+thread is running and its stack is counted. The counts are dumped now and then,
+and on SIGUSR2, to <recon_cache_path>/profile/<name>-<pid>.folded in the
+folded format of flame graph tools: one line per stack, its frames from the
+outermost in, separated by semicolons, and the number of samples of it::
+
+    flamegraph.pl /var/cache/swift/profile/object-server-*.folded > cpu.svg
+
+The recon middleware serves the dumps of the running processes of a node
+added up, at /recon/profile or, for one kind of server or daemon, at
+/recon/profile/<name>.
+"""
+
+import errno
+import os
+import signal
+import time
+from collections import defaultdict
+from tempfile import NamedTemporaryFile
+
+from swift.common.utils import config_true_value, mkdirs
+
+PROFILE_SUFFIX = '.folded'
+
+
+class SamplingProfiler(object):
+    """
+    Counts the stacks of the running green thread, once every interval
+    seconds of CPU time the process uses. Sampling happens in a signal
+    handler, so there is no cost at all while the process is idle, and a
+    bounded one, set by the interval and max_depth, while it is busy.
+
+    :param name: name of the server or daemon, e.g. object-server
+    :param dump_dir: directory to dump the counts to
+    :param interval: seconds of CPU time between samples
+    :param dump_interval: seconds between dumps
+    :param max_stacks: the most distinct stacks counted; samples of other
+                       stacks are counted as [other]
+    :param max_depth: the most frames of a stack kept, the innermost ones
+    :param logger: logger to log errors dumping the counts to
+    """
+
+    def __init__(self, name, dump_dir, interval=0.01, dump_interval=60,
+                 max_stacks=10000, max_depth=64, logger=None):
+        self.name = name
+        self.dump_dir = dump_dir
+        self.interval = interval
+        self.dump_interval = dump_interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.logger = logger
+        self.stacks = defaultdict(int)
+        # code object to frame name, as formatting those for every frame of
+        # every sample would be much of the cost of sampling
+        self._frame_names = {}
+        self.last_dump = time.time()
+
+    def start(self):
+        """
+        Starts sampling, and dumping the counts on SIGUSR2.
+        """
+        for signum, handler in ((signal.SIGPROF, self._handle_sample),
+                                (signal.SIGUSR2, self._handle_dump)):
+            signal.signal(signum, handler)
+            # restart interrupted system calls rather than fail them
+            signal.siginterrupt(signum, False)
+        self.last_dump = time.time()
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        """
+        Stops sampling and dumps the counts.
+        """
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_IGN)
+        self.dump()
+
+    def _handle_sample(self, signum, frame):
+        self.sample(frame)
+        if time.time() - self.last_dump >= self.dump_interval:
+            self.dump()
+
+    def _handle_dump(self, signum, frame):
+        self.dump()
+
+    def _frame_name(self, code):
+        try:
+            return self._frame_names[code]
+        except KeyError:
+            name = self._frame_names[code] = '%s:%d(%s)' % (
+                code.co_filename, code.co_firstlineno, code.co_name)
+            return name
+
+    def sample(self, frame):
+        """
+        Counts a stack.
+
+        :param frame: innermost frame of the stack
+        """
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            names.append(self._frame_name(frame.f_code))
+            frame = frame.f_back
+        if frame is not None:
+            names.append('[truncated]')
+        names.reverse()
+        stack = ';'.join(names)
+        if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+            stack = '[other]'
+        self.stacks[stack] += 1
+
+    def folded(self):
+        """
+        Returns the counts in the folded format of flame graph tools.
+        """
+        return ''.join('%s %d\n' % item for item in sorted(
+            self.stacks.iteritems()))
+
+    def dump(self):
+        """
+        Writes the counts to <dump_dir>/<name>-<pid>.folded.
+        """
+        self.last_dump = time.time()
+        path = os.path.join(self.dump_dir, '%s-%d%s' % (
+            self.name, os.getpid(), PROFILE_SUFFIX))
+        tmp_path = None
+        try:
+            mkdirs(self.dump_dir)
+            with NamedTemporaryFile(dir=self.dump_dir, delete=False) as fp:
+                tmp_path = fp.name
+                fp.write(self.folded())
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            if self.logger:
+                self.logger.exception(_('Error dumping profile to %s'), path)
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+
+def start_sampling_profiler(conf, name, logger=None):
+    """
+    Starts a SamplingProfiler for a server or daemon process if its conf has
+    sampling_profiler turned on.
+
+    :param conf: configuration of the server or daemon
+    :param name: name of the server or daemon, e.g. object-server
+    :param logger: logger to log errors dumping the counts to
+    :returns: the SamplingProfiler, or None if profiling is off
+    """
+    if not config_true_value(conf.get('sampling_profiler', 'no')):
+        return None
+    profiler = SamplingProfiler(
+        name, os.path.join(conf.get('recon_cache_path', '/var/cache/swift'),
+                           'profile'),
+        interval=float(conf.get('sampling_profiler_interval', 0.01)),
+        dump_interval=float(conf.get('sampling_profiler_dump_interval', 60)),
+        max_stacks=int(conf.get('sampling_profiler_max_stacks', 10000)),
+        logger=logger)
+    profiler.start()
+    return profiler
+
+
+def read_profiles(dump_dir, name=None):
+    """
+    Adds up the dumped counts of the running processes.
+
+    :param dump_dir: directory the counts are dumped to
+    :param name: if given, only the counts of the processes of this server or
+                 daemon are added up
+    :returns: dict of folded stack to number of samples
+    """
+    stacks = defaultdict(int)
+    try:
+        filenames = os.listdir(dump_dir)
+    except OSError, err:
+        if err.errno != errno.ENOENT:
+            raise
+        return {}
+    for filename in filenames:
+        if not filename.endswith(PROFILE_SUFFIX):
+            continue
+        proc_name, _junk, pid = \
+            filename[:-len(PROFILE_SUFFIX)].rpartition('-')
+        if not pid.isdigit() or (name and proc_name != name):
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except OSError, err:
+            if err.errno == errno.ESRCH:
+                # the dump of a process gone since
+                continue
+        try:
+            with open(os.path.join(dump_dir, filename)) as fp:
+                for line in fp:
+                    stack, _junk, count = line.rstrip('\n').rpartition(' ')
+                    if stack and count.isdigit():
+                        stacks[stack] += int(count)
+        except IOError, err:
+            if err.errno != errno.ENOENT:
+                raise
+    return dict(stacks)
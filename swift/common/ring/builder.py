@@ -609,9 +609,9 @@ class RingBuilder(object):
         gathering from removed devices, insufficiently-far-apart replicas, and
         overweight drives.
         """
-        # inline memoization of tiers_for_dev() results (profiling reveals it
-        # as a hot-spot).
-        tfd = {}
+        replica2part2dev = self._replica2part2dev
+        last_part_moves = self._last_part_moves
+        min_part_hours = self.min_part_hours
 
         # First we gather partitions from removed devices. Since removed
         # devices usually indicate device failures, we have no choice but to
@@ -619,66 +619,77 @@ class RingBuilder(object):
         # choices will skip other replicas of the same partition if possible.
         removed_dev_parts = defaultdict(list)
         if self._remove_devs:
-            dev_ids = [d['id'] for d in self._remove_devs if d['parts']]
+            dev_ids = set(d['id'] for d in self._remove_devs if d['parts'])
             if dev_ids:
-                for part, replica in self._each_part_replica():
-                    dev_id = self._replica2part2dev[replica][part]
-                    if dev_id in dev_ids:
-                        self._last_part_moves[part] = 0
-                        removed_dev_parts[part].append(replica)
+                for replica, part2dev in enumerate(replica2part2dev):
+                    for part, dev_id in enumerate(part2dev):
+                        if dev_id in dev_ids:
+                            last_part_moves[part] = 0
+                            removed_dev_parts[part].append(replica)
 
         # Now we gather partitions that are "at risk" because they aren't
         # currently sufficient spread out across the cluster.
+        #
+        # Every tier gets an index into a list of replica counters, and every
+        # device the indexes of its tiers, as dict lookups keyed by the tier
+        # tuples showed up as a hot-spot when profiling. The counters of a
+        # partition's tiers are set back to 0 once it has been checked.
         spread_out_parts = defaultdict(list)
         max_allowed_replicas = self._build_max_replicas_by_tier()
+        tier2index = {}
+        max_allowed_by_index = []
+        dev_tier_indexes = {}
+        for dev in self._iter_devs():
+            indexes = []
+            for tier in tiers_for_dev(dev):
+                if tier not in tier2index:
+                    tier2index[tier] = len(max_allowed_by_index)
+                    max_allowed_by_index.append(max_allowed_replicas[tier])
+                indexes.append(tier2index[tier])
+            dev_tier_indexes[dev['id']] = indexes
+        replicas_at_tier = [0] * len(max_allowed_by_index)
         for part in xrange(self.parts):
-            # Only move one replica at a time if possible.
-            if part in removed_dev_parts:
+            # Only move one replica at a time if possible; and nothing
+            # moved recently can be moved again.
+            if part in removed_dev_parts or \
+                    last_part_moves[part] < min_part_hours:
                 continue
 
-            # First, add up the count of replicas at each tier for each
+            # First, add up the count of replicas at each tier for the
             # partition.
-            # replicas_at_tier was a "lambda: 0" defaultdict, but profiling
-            # revealed the lambda invocation as a significant cost.
-            replicas_at_tier = {}
-            for dev in self._devs_for_part(part):
-                if dev['id'] not in tfd:
-                    tfd[dev['id']] = tiers_for_dev(dev)
-                for tier in tfd[dev['id']]:
-                    if tier not in replicas_at_tier:
-                        replicas_at_tier[tier] = 1
-                    else:
-                        replicas_at_tier[tier] += 1
-
-            # Now, look for partitions not yet spread out enough and not
-            # recently moved.
-            for replica in self._replicas_for_part(part):
-                dev = self.devs[self._replica2part2dev[replica][part]]
-                removed_replica = False
-                if dev['id'] not in tfd:
-                    tfd[dev['id']] = tiers_for_dev(dev)
-                for tier in tfd[dev['id']]:
-                    rep_at_tier = 0
-                    if tier in replicas_at_tier:
-                        rep_at_tier = replicas_at_tier[tier]
-                    if (rep_at_tier > max_allowed_replicas[tier] and
-                            self._last_part_moves[part] >=
-                            self.min_part_hours):
-                        self._last_part_moves[part] = 0
+            part_dev_ids = [(replica, part2dev[part]) for replica, part2dev
+                            in enumerate(replica2part2dev)
+                            if part < len(part2dev)]
+            for replica, dev_id in part_dev_ids:
+                for index in dev_tier_indexes[dev_id]:
+                    replicas_at_tier[index] += 1
+
+            # Now, look for replicas not yet spread out enough.
+            for replica, dev_id in part_dev_ids:
+                indexes = dev_tier_indexes[dev_id]
+                for index in indexes:
+                    if replicas_at_tier[index] > max_allowed_by_index[index] \
+                            and last_part_moves[part] >= min_part_hours:
+                        last_part_moves[part] = 0
                         spread_out_parts[part].append(replica)
+                        dev = self.devs[dev_id]
                         dev['parts_wanted'] += 1
                         dev['parts'] -= 1
-                        removed_replica = True
+                        for index in indexes:
+                            replicas_at_tier[index] -= 1
                         break
-                if removed_replica:
-                    if dev['id'] not in tfd:
-                        tfd[dev['id']] = tiers_for_dev(dev)
-                    for tier in tfd[dev['id']]:
-                        replicas_at_tier[tier] -= 1
+
+            for replica, dev_id in part_dev_ids:
+                for index in dev_tier_indexes[dev_id]:
+                    replicas_at_tier[index] = 0
 
         # Last, we gather partitions from devices that are "overweight" because
-        # they have more partitions than their parts_wanted.
+        # they have more partitions than their parts_wanted. The devices'
+        # wants are tracked in lists indexed by device id while going through
+        # the partitions.
         reassign_parts = defaultdict(list)
+        parts_wanted = [dev and dev['parts_wanted'] for dev in self.devs]
+        parts_given = [0] * len(self.devs)
 
         # We randomly pick a new starting point in the "circular" ring of
         # partitions to try to get a better rebalance when called multiple
@@ -688,7 +699,7 @@ class RingBuilder(object):
         start += random.randint(0, self.parts / 2)  # GRAH PEP8!!!
 
         self._last_part_gather_start = start
-        for replica, part2dev in enumerate(self._replica2part2dev):
+        for replica, part2dev in enumerate(replica2part2dev):
             # If we've got a partial replica, start may be out of
             # range. Scale it down so that we get a similar movement
             # pattern (but scaled down) on sequential runs.
@@ -696,16 +707,18 @@ class RingBuilder(object):
 
             for part in itertools.chain(xrange(this_start, len(part2dev)),
                                         xrange(0, this_start)):
-                if self._last_part_moves[part] < self.min_part_hours:
-                    continue
-                if part in removed_dev_parts or part in spread_out_parts:
-                    continue
-                dev = self.devs[part2dev[part]]
-                if dev['parts_wanted'] < 0:
-                    self._last_part_moves[part] = 0
-                    dev['parts_wanted'] += 1
-                    dev['parts'] -= 1
+                dev_id = part2dev[part]
+                if parts_wanted[dev_id] < 0 and \
+                        last_part_moves[part] >= min_part_hours and \
+                        part not in removed_dev_parts and \
+                        part not in spread_out_parts:
+                    last_part_moves[part] = 0
+                    parts_wanted[dev_id] += 1
+                    parts_given[dev_id] += 1
                     reassign_parts[part].append(replica)
+        for dev in self._iter_devs():
+            dev['parts_wanted'] = parts_wanted[dev['id']]
+            dev['parts'] -= parts_given[dev['id']]
 
         reassign_parts.update(spread_out_parts)
         reassign_parts.update(removed_dev_parts)
@@ -742,20 +755,29 @@ class RingBuilder(object):
                                replicas_to_replace may be shared for multiple
                                partitions, so be sure you do not modify it.
         """
+        # The sort keys and tiers of the devices, indexed by device id;
+        # tiers_for_dev() showed up as a hot-spot when profiling.
+        sort_keys = [None] * len(self.devs)
+        dev_tiers = [None] * len(self.devs)
         for dev in self._iter_devs():
-            dev['sort_key'] = self._sort_key_for(dev)
+            sort_keys[dev['id']] = self._sort_key_for(dev)
+            dev_tiers[dev['id']] = tiers_for_dev(dev)
 
         available_devs = \
             sorted((d for d in self._iter_devs() if d['weight']),
-                   key=lambda x: x['sort_key'])
+                   key=lambda x: sort_keys[x['id']])
 
-        tier2devs = defaultdict(list)
+        # Only the sort keys of the devices in each tier are kept in order;
+        # the device of a tier at the deepest level, which is the one
+        # partitions get assigned to, is simply looked up.
+        tier2dev = {}
         tier2sort_key = defaultdict(list)
         max_tier_depth = 0
         for dev in available_devs:
-            for tier in tiers_for_dev(dev):
-                tier2devs[tier].append(dev)  # <-- starts out sorted!
-                tier2sort_key[tier].append(dev['sort_key'])
+            tier2dev[dev_tiers[dev['id']][-1]] = dev
+            for tier in dev_tiers[dev['id']]:
+                # starts out sorted!
+                tier2sort_key[tier].append(sort_keys[dev['id']])
                 if len(tier) > max_tier_depth:
                     max_tier_depth = len(tier)
 
@@ -776,17 +798,21 @@ class RingBuilder(object):
             tiers_list = new_tiers_list
             depth += 1
 
+        replica2part2dev = self._replica2part2dev
         for part, replace_replicas in reassign_parts:
             # Gather up what other tiers (regions, zones, ip/ports, and
-            # devices) the replicas not-to-be-moved are in for this part.
-            other_replicas = defaultdict(int)
-            unique_tiers_by_tier_len = defaultdict(set)
-            for replica in self._replicas_for_part(part):
-                if replica not in replace_replicas:
-                    dev = self.devs[self._replica2part2dev[replica][part]]
-                    for tier in tiers_for_dev(dev):
-                        other_replicas[tier] += 1
-                        unique_tiers_by_tier_len[len(tier)].add(tier)
+            # devices) the replicas not-to-be-moved are in for this part,
+            # along with how many distinct tiers of each depth hold them.
+            other_replicas = {}
+            tier_count_by_depth = [0] * (max_tier_depth + 2)
+            for replica, part2dev in enumerate(replica2part2dev):
+                if part < len(part2dev) and replica not in replace_replicas:
+                    for tier in dev_tiers[part2dev[part]]:
+                        if tier in other_replicas:
+                            other_replicas[tier] += 1
+                        else:
+                            other_replicas[tier] = 1
+                            tier_count_by_depth[len(tier)] += 1
 
             for replica in replace_replicas:
                 tier = ()
@@ -812,9 +838,7 @@ class RingBuilder(object):
                     # This used to be a cute, recursive function, but it's been
                     # unrolled for performance.
                     candidate_tiers = tier2children[tier]
-                    candidates_with_replicas = \
-                        unique_tiers_by_tier_len[len(tier) + 1]
-                    if len(candidate_tiers) > len(candidates_with_replicas):
+                    if len(candidate_tiers) > tier_count_by_depth[depth]:
                         # There exists at least one tier with 0 other replicas,
                         # so work backward among the candidates, accepting the
                         # first which isn't in other_replicas.
@@ -823,68 +847,66 @@ class RingBuilder(object):
                         # below, which is expensive if you've got thousands of
                         # drives.
                         for t in reversed(candidate_tiers):
-                            if other_replicas[t] == 0:
+                            if t not in other_replicas:
                                 tier = t
                                 break
                     else:
-                        min_count = min(other_replicas[t]
+                        min_count = min(other_replicas.get(t, 0)
                                         for t in candidate_tiers)
                         tier = (t for t in reversed(candidate_tiers)
-                                if other_replicas[t] == min_count).next()
+                                if other_replicas.get(t, 0) == min_count
+                                ).next()
                     depth += 1
-                dev = tier2devs[tier][-1]
+                dev = tier2dev[tier]
+                dev_id = dev['id']
                 dev['parts_wanted'] -= 1
                 dev['parts'] += 1
-                old_sort_key = dev['sort_key']
-                new_sort_key = dev['sort_key'] = self._sort_key_for(dev)
-                for tier in tiers_for_dev(dev):
-                    other_replicas[tier] += 1
-                    unique_tiers_by_tier_len[len(tier)].add(tier)
-
-                    index = bisect.bisect_left(tier2sort_key[tier],
-                                               old_sort_key)
-                    tier2devs[tier].pop(index)
-                    tier2sort_key[tier].pop(index)
+                old_sort_key = sort_keys[dev_id]
+                new_sort_key = sort_keys[dev_id] = self._sort_key_for(dev)
+                for tier in dev_tiers[dev_id]:
+                    if tier in other_replicas:
+                        other_replicas[tier] += 1
+                    else:
+                        other_replicas[tier] = 1
+                        tier_count_by_depth[len(tier)] += 1
 
-                    new_index = bisect.bisect_left(tier2sort_key[tier],
-                                                   new_sort_key)
-                    tier2devs[tier].insert(new_index, dev)
-                    tier2sort_key[tier].insert(new_index, new_sort_key)
+                    sort_key = tier2sort_key[tier]
+                    if len(sort_key) == 1:
+                        sort_key[0] = new_sort_key
+                    else:
+                        del sort_key[bisect.bisect_left(sort_key,
+                                                        old_sort_key)]
+                        sort_key.insert(
+                            bisect.bisect_left(sort_key, new_sort_key),
+                            new_sort_key)
 
                     # Now jiggle tier2children values to keep them sorted
-                    new_last_sort_key = tier2sort_key[tier][-1]
+                    new_last_sort_key = sort_key[-1]
                     parent_tier = tier[0:-1]
-                    index = bisect.bisect_left(
-                        tier2children_sort_key[parent_tier],
-                        old_sort_key)
-                    popped = tier2children[parent_tier].pop(index)
-                    tier2children_sort_key[parent_tier].pop(index)
-
-                    new_index = bisect.bisect_left(
-                        tier2children_sort_key[parent_tier],
-                        new_last_sort_key)
-                    tier2children[parent_tier].insert(new_index, popped)
-                    tier2children_sort_key[parent_tier].insert(
-                        new_index, new_last_sort_key)
-
-                self._replica2part2dev[replica][part] = dev['id']
-
-        # Just to save memory and keep from accidental reuse.
-        for dev in self._iter_devs():
-            del dev['sort_key']
+                    children = tier2children[parent_tier]
+                    children_sort_key = tier2children_sort_key[parent_tier]
+                    index = bisect.bisect_left(children_sort_key,
+                                               old_sort_key)
+                    popped = children.pop(index)
+                    del children_sort_key[index]
+
+                    new_index = bisect.bisect_left(children_sort_key,
+                                                   new_last_sort_key)
+                    children.insert(new_index, popped)
+                    children_sort_key.insert(new_index, new_last_sort_key)
+
+                replica2part2dev[replica][part] = dev_id
 
     def _sort_key_for(self, dev):
-        # The maximum value of self.parts is 2^32, which is 9 hex
-        # digits wide (0x100000000). Using a width of 16 here gives us
-        # plenty of breathing room; you'd need more than 2^28 replicas
-        # to overflow it.
-        # Since the sort key is a string and therefore an ascii sort applies,
-        # the maximum_parts_wanted + parts_wanted is used so negative
-        # parts_wanted end up sorted above positive parts_wanted.
-        return '%016x.%04x.%04x' % (
-            (self.parts * self.replicas) + dev['parts_wanted'],
-            random.randint(0, 0xFFFF),
-            dev['id'])
+        # The sort key packs, from most to least significant, the
+        # maximum_parts_wanted + parts_wanted (so negative parts_wanted end up
+        # sorted above positive parts_wanted), 16 random bits and 16 bits of
+        # device id into a single int, which is cheaper to build and compare
+        # than the equivalent fixed width hex string. random.randint(0, 0xFFFF)
+        # is inlined as int(random.random() * 0x10000), which it comes down
+        # to, since it showed up in profiling.
+        return (int(self.parts * self.replicas + dev['parts_wanted']) << 32 |
+                int(random.random() * 0x10000) << 16 | dev['id'])
 
     def _build_max_replicas_by_tier(self):
         """
@@ -0,0 +1,272 @@
+# Copyright (c) 2010-2013 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tools for looking at what a ring change does before the new ring is pushed:
+which partition replicas move between which devices, how much data that
+means replicating, how well the replicas end up spread out, and how many
+rebalances min_part_hours spreads the change over.
+"""
+
+from collections import defaultdict
+from itertools import izip
+from operator import add, eq
+
+from eventlet import GreenPool
+from eventlet.green import urllib2
+
+from swift.common.ring.builder import RingBuilder
+from swift.common.ring.ring import RingData
+from swift.common.ring.utils import tiers_for_dev
+from swift.common.utils import json
+
+# The levels of tiers_for_dev(), from the widest to the narrowest.
+TIER_LEVELS = ('region', 'zone', 'server', 'device')
+
+
+def load_ring_data(path):
+    """
+    Loads the ring data from a builder file or from any kind of ring file.
+
+    :param path: path of a .builder file or a ring file
+    :returns: RingData instance
+    """
+    if path.endswith('.builder'):
+        return RingBuilder.load(path).get_ring()
+    return RingData.load(path)
+
+
+def _partition_count(replica2part2dev_id):
+    return len(replica2part2dev_id[0]) if replica2part2dev_id else 0
+
+
+def get_part_replica_moves(old_replica2part2dev_id, new_replica2part2dev_id):
+    """
+    Works out which partition replicas move between two rings with the same
+    partition count. A replica that only switched places with another replica
+    of the same partition doesn't count as moved, as no data has to move for
+    it.
+
+    Only the partitions where one of the replica tables differs are looked at
+    individually; comparing whole tables and then their items pairwise is
+    cheap even for rings with millions of partitions.
+
+    :param old_replica2part2dev_id: replica tables of the current ring
+    :param new_replica2part2dev_id: replica tables of the new ring
+    :returns: tuple of (number of partitions with moving replicas, dict of
+              device id to number of replicas moving off the device, dict of
+              device id to number of replicas moving onto the device)
+    :raises ValueError: if the rings differ in partition count
+    """
+    old_parts = _partition_count(old_replica2part2dev_id)
+    new_parts = _partition_count(new_replica2part2dev_id)
+    if old_parts != new_parts:
+        raise ValueError('Rings have different partition counts: %d and %d'
+                         % (old_parts, new_parts))
+    changed = set()
+    for replica in xrange(max(len(old_replica2part2dev_id),
+                              len(new_replica2part2dev_id))):
+        old_part2dev = new_part2dev = ()
+        if replica < len(old_replica2part2dev_id):
+            old_part2dev = old_replica2part2dev_id[replica]
+        if replica < len(new_replica2part2dev_id):
+            new_part2dev = new_replica2part2dev_id[replica]
+        if old_part2dev == new_part2dev:
+            continue
+        changed.update(part for part, (old_dev_id, new_dev_id) in
+                       enumerate(izip(old_part2dev, new_part2dev))
+                       if old_dev_id != new_dev_id)
+        # partial replicas of differing lengths
+        changed.update(xrange(min(len(old_part2dev), len(new_part2dev)),
+                              max(len(old_part2dev), len(new_part2dev))))
+    moved_parts = 0
+    moves_out = defaultdict(int)
+    moves_in = defaultdict(int)
+    for part in changed:
+        old_dev_ids = [part2dev[part] for part2dev in old_replica2part2dev_id
+                       if part < len(part2dev)]
+        moved = False
+        for part2dev in new_replica2part2dev_id:
+            if part < len(part2dev):
+                if part2dev[part] in old_dev_ids:
+                    old_dev_ids.remove(part2dev[part])
+                else:
+                    moves_in[part2dev[part]] += 1
+                    moved = True
+        for dev_id in old_dev_ids:
+            moves_out[dev_id] += 1
+            moved = True
+        if moved:
+            moved_parts += 1
+    return moved_parts, dict(moves_out), dict(moves_in)
+
+
+def get_tier_moves(moves, devs):
+    """
+    Adds up the replica moves of devices for the tiers they are in.
+
+    :param moves: dict of device id to number of replicas moving
+    :param devs: list of device dicts, indexed by device id
+    :returns: dict of tier to number of replicas moving; see tiers_for_dev()
+    """
+    tier_moves = defaultdict(int)
+    for dev_id, count in moves.iteritems():
+        for tier in tiers_for_dev(devs[dev_id]):
+            tier_moves[tier] += count
+    return dict(tier_moves)
+
+
+def get_dispersion(replica2part2dev_id, devs):
+    """
+    Works out how well the replicas of the partitions are spread out. For
+    each level of tiers (regions, zones, servers and devices), the partitions
+    are counted by the most of their replicas that any single tier of that
+    level holds; ideally, with at least as many tiers as replicas, that is 1
+    for every partition.
+
+    :param replica2part2dev_id: replica tables of the ring
+    :param devs: list of device dicts, indexed by device id
+    :returns: dict of level name (see TIER_LEVELS) to a list whose item n is
+              the number of partitions having at most n replicas in any
+              single tier of the level, and n in one of them
+    """
+    lengths = sorted(set(len(part2dev) for part2dev in replica2part2dev_id))
+    dispersion = {}
+    for level, name in enumerate(TIER_LEVELS):
+        tier_ids = {}
+        dev_tier_ids = [dev and tier_ids.setdefault(tiers_for_dev(dev)[level],
+                                                    len(tier_ids))
+                        for dev in devs]
+        columns = [map(dev_tier_ids.__getitem__, part2dev)
+                   for part2dev in replica2part2dev_id]
+        counts = [0] * (len(replica2part2dev_id) + 1)
+        start = 0
+        # partial replicas make for fewer replicas of the last partitions
+        for length in lengths:
+            segment = [column[start:length] for column in columns
+                       if len(column) >= length]
+            # For every replica, how many replicas of its partition share its
+            # tier, worked out by comparing the columns pairwise with map()
+            # rather than looping over the partitions in Python.
+            sharing = [[1] * (length - start) for column in segment]
+            for index, column in enumerate(segment):
+                for other_index in xrange(index + 1, len(segment)):
+                    same = map(eq, column, segment[other_index])
+                    sharing[index] = map(add, sharing[index], same)
+                    sharing[other_index] = map(add, sharing[other_index],
+                                               same)
+            most = map(max, *sharing) if len(sharing) > 1 else sharing[0]
+            for replicas in xrange(1, len(segment) + 1):
+                counts[replicas] += most.count(replicas)
+            start = length
+        dispersion[name] = counts
+    return dispersion
+
+
+def get_disk_usage(devs, timeout=5, concurrency=32):
+    """
+    Gets the disk usage of devices from the recon middleware of their
+    servers.
+
+    :param devs: list of device dicts
+    :param timeout: seconds to wait for each server
+    :param concurrency: number of servers asked at once
+    :returns: dict of device id to bytes used, for the devices whose servers
+              answered
+    """
+    servers = defaultdict(dict)
+    for dev in devs:
+        if dev:
+            servers[(dev['ip'], dev['port'])][dev['device']] = dev['id']
+
+    def scout(server):
+        url = 'http://%s:%s/recon/diskusage' % server
+        try:
+            return server, json.loads(
+                urllib2.urlopen(url, timeout=timeout).read())
+        except Exception:
+            return server, []
+
+    disk_usage = {}
+    for server, entries in GreenPool(concurrency).imap(scout, servers):
+        for entry in entries:
+            dev_id = servers[server].get(entry.get('device'))
+            if dev_id is not None and entry.get('mounted'):
+                disk_usage[dev_id] = entry['used']
+    return disk_usage
+
+
+def estimate_bytes_moved(moves_out, replica2part2dev_id, disk_usage):
+    """
+    Estimates the replication traffic of a ring change as the bytes of the
+    replicas moving off each device, taking all partition replicas of a
+    device to be the same size.
+
+    :param moves_out: dict of device id to number of replicas moving off the
+                      device
+    :param replica2part2dev_id: replica tables of the current ring
+    :param disk_usage: dict of device id to bytes used; see get_disk_usage()
+    :returns: tuple of (dict of device id to estimated bytes moving off it,
+              number of devices with moves but no disk usage)
+    """
+    replicas_held = defaultdict(int)
+    for part2dev in replica2part2dev_id:
+        for dev_id in part2dev:
+            replicas_held[dev_id] += 1
+    bytes_moved = {}
+    unknown = 0
+    for dev_id, count in moves_out.iteritems():
+        if dev_id in disk_usage and replicas_held[dev_id]:
+            bytes_moved[dev_id] = \
+                disk_usage[dev_id] * count / replicas_held[dev_id]
+        else:
+            unknown += 1
+    return bytes_moved, unknown
+
+
+def simulate_rebalances(builder, max_rebalances=10):
+    """
+    Simulates the rebalances it takes for the pending changes of a builder to
+    settle, with min_part_hours passing between each of them, on a copy of
+    the builder.
+
+    :param builder: RingBuilder instance; it is left as is
+    :param max_rebalances: the most rebalances to simulate
+    :returns: list of (partitions reassigned, balance) tuples, one per
+              rebalance, ending with the one that balanced the ring or
+              stopped improving the balance
+    """
+    sim = RingBuilder(1, 1, 1)
+    sim.copy_from(builder.to_dict())
+    # copy_from shares the builder's device dicts and partition tables
+    sim.devs = [dev and dict(dev) for dev in builder.devs]
+    sim._remove_devs = [sim.devs[dev['id']] for dev in builder._remove_devs]
+    if builder._replica2part2dev is not None:
+        sim._replica2part2dev = [part2dev[:] for part2dev in
+                                 builder._replica2part2dev]
+    if builder._last_part_moves is not None:
+        sim._last_part_moves = builder._last_part_moves[:]
+    results = []
+    last_balance = None
+    for index in xrange(max_rebalances):
+        parts, balance = sim.rebalance()
+        results.append((parts, balance))
+        # the first rebalance may well be held back by min_part_hours
+        if balance < 1 or (index and (not parts or
+                                      abs(last_balance - balance) < 1)):
+            break
+        last_balance = balance
+        sim.pretend_min_part_hours_passed()
+    return results
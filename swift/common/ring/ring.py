@@ -21,13 +21,127 @@ from os.path import getmtime
 import struct
 from time import time
 import os
+import mmap
+import sys
 from io import BufferedReader
+from tempfile import mkstemp
 from hashlib import md5
-from itertools import chain
+from itertools import chain, count, islice, izip
 
 from swift.common.utils import hash_path, validate_configuration, json
 from swift.common.ring.utils import tiers_for_dev
 
+# Rings with up to this many partitions keep a tuple of primary node dicts for
+# every partition. Larger rings keep the device ids of the primary nodes in a
+# single array instead, which takes two bytes rather than a pointer and a share
+# of a tuple per replica.
+MAX_PART_NODES_TABLE_PARTS = 1 << 18
+# get_more_nodes remembers the first HANDOFF_CACHE_DEPTH handoff nodes of up to
+# HANDOFF_CACHE_SIZE partitions, dropping the least recently used ones.
+HANDOFF_CACHE_DEPTH = 8
+HANDOFF_CACHE_SIZE = 4096
+# Device id marking a missing or duplicate replica in a table of the primary
+# nodes of every partition.
+NO_DEV = 0xffff
+# Tables in a memory mapped ring file start on a multiple of this many bytes.
+MAPPED_RING_ALIGNMENT = 4096
+
+
+def build_part_dev_ids(replica2part2dev_id, typecode='H', no_dev=NO_DEV):
+    """
+    Builds a flat array of the device ids of each partition's replicas, with
+    a replica that is missing or on the same device as an earlier one set to
+    no_dev.
+
+    :param replica2part2dev_id: the replica to partition to device id tables
+    :param typecode: array typecode of the device ids
+    :param no_dev: device id marking a missing or duplicate replica
+    :returns: array of replica count device ids per partition
+    """
+    replicas = len(replica2part2dev_id)
+    parts = replicas and len(replica2part2dev_id[0])
+    part_dev_ids = array.array(typecode, [no_dev]) * (parts * replicas)
+    for replica, part2dev_id in enumerate(replica2part2dev_id):
+        part_dev_ids[replica:len(part2dev_id) * replicas:replicas] = \
+            array.array(typecode, part2dev_id)
+        for earlier_part2dev_id in replica2part2dev_id[:replica]:
+            for part in [part for part, (earlier, dev_id) in enumerate(
+                         izip(earlier_part2dev_id, part2dev_id))
+                         if earlier == dev_id]:
+                part_dev_ids[part * replicas + replica] = no_dev
+    return part_dev_ids
+
+
+def _aligned(offset):
+    return -(-offset // MAPPED_RING_ALIGNMENT) * MAPPED_RING_ALIGNMENT
+
+
+class MappedArray(object):
+    """
+    Read-only array of little-endian unsigned shorts in a memory mapped ring
+    file. It stands in for the array('H') tables of a loaded ring without
+    copying them out of the page cache.
+
+    :param map: the mmap of the ring file
+    :param offset: offset of the first item in the map
+    :param length: number of items
+    """
+
+    def __init__(self, map, offset, length):
+        self.map = map
+        self.offset = offset
+        self.length = length
+        # slice length -> unpack_from of a struct of that many items
+        self._unpackers = {}
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self.to_array()[index])
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('array index out of range')
+        return struct.unpack_from('<H', self.map, self.offset + 2 * index)[0]
+
+    def __getslice__(self, start, stop):
+        if stop > self.length:
+            stop = self.length
+        if start > stop:
+            start = stop
+        elif start < 0:
+            start = 0
+        try:
+            unpacker = self._unpackers[stop - start]
+        except KeyError:
+            unpacker = self._unpackers[stop - start] = \
+                struct.Struct('<%dH' % (stop - start)).unpack_from
+        return unpacker(self.map, self.offset + 2 * start)
+
+    def __iter__(self):
+        return iter(self.to_array())
+
+    def __eq__(self, other):
+        if isinstance(other, MappedArray):
+            other = other.to_array()
+        return self.to_array() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def to_array(self):
+        """Returns a copy of the items as an array('H')."""
+        items = array.array(
+            'H', self.map[self.offset:self.offset + 2 * self.length])
+        if sys.byteorder == 'big':
+            items.byteswap()
+        return items
+
+    def tostring(self):
+        return self.to_array().tostring()
+
 
 class RingData(object):
     """Partitioned consistent hashing ring data (used for serialization)."""
@@ -36,6 +150,9 @@ class RingData(object):
         self.devs = devs
         self._replica2part2dev_id = replica2part2dev_id
         self._part_shift = part_shift
+        # flat table of the primary device ids of every partition, when
+        # loaded from a memory mapped ring file
+        self._part_dev_ids = None
 
         for dev in self.devs:
             if dev is not None:
@@ -60,6 +177,10 @@ class RingData(object):
         :param filename: Path to a file serialized by the save() method.
         :returns: A RingData instance containing the loaded data.
         """
+        with open(filename, 'rb') as fp:
+            magic = fp.read(6)
+        if magic == struct.pack('!4sH', 'R1NG', 2):
+            return cls.load_mapped(filename)
         gz_file = GzipFile(filename, 'rb')
         # Python 2.6 GzipFile doesn't support BufferedIO
         if hasattr(gz_file, '_checkReadable'):
@@ -82,6 +203,35 @@ class RingData(object):
                                  ring_data['devs'], ring_data['part_shift'])
         return ring_data
 
+    @classmethod
+    def load_mapped(cls, filename):
+        """
+        Load ring data from an uncompressed ring file, mapping its tables
+        into memory rather than reading them in. Every process loading the
+        same file shares one copy of the tables through the page cache.
+
+        :param filename: Path to a file serialized by save(mapped=True).
+        :returns: A RingData instance whose tables are MappedArrays.
+        """
+        fd = os.open(filename, os.O_RDONLY)
+        try:
+            ring_map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        json_len, = struct.unpack_from('!I', ring_map, 6)
+        ring_dict = json.loads(ring_map[10:10 + json_len])
+        offset = _aligned(10 + json_len)
+        replica2part2dev_id = []
+        for part_count in ring_dict['replica_part_counts']:
+            replica2part2dev_id.append(
+                MappedArray(ring_map, offset, part_count))
+            offset = _aligned(offset + 2 * part_count)
+        ring_data = cls(replica2part2dev_id, ring_dict['devs'],
+                        ring_dict['part_shift'])
+        ring_data._part_dev_ids = MappedArray(
+            ring_map, offset, ring_dict['part_dev_id_count'])
+        return ring_data
+
     def serialize_v1(self, file_obj):
         # Write out new-style serialization magic and version:
         file_obj.write(struct.pack('!4sH', 'R1NG', 1))
@@ -96,12 +246,58 @@ class RingData(object):
         for part2dev_id in ring['replica2part2dev_id']:
             file_obj.write(part2dev_id.tostring())
 
-    def save(self, filename):
+    def serialize_v2(self, file_obj):
+        """
+        Writes the uncompressed ring format that load_mapped maps into
+        memory: the v1 style header, then every replica's table and the
+        primary device ids of every partition as little-endian unsigned
+        shorts, each starting on a page boundary.
+        """
+        if len(self.devs) >= NO_DEV:
+            raise ValueError('Too many devices for a mapped ring file')
+        file_obj.write(struct.pack('!4sH', 'R1NG', 2))
+        ring = self.to_dict()
+        tables = list(ring['replica2part2dev_id'])
+        part_dev_ids = build_part_dev_ids(tables)
+        json_encoder = json.JSONEncoder(sort_keys=True)
+        json_text = json_encoder.encode(
+            {'devs': ring['devs'], 'part_shift': ring['part_shift'],
+             'replica_count': len(tables),
+             'replica_part_counts': [len(t) for t in tables],
+             'part_dev_id_count': len(part_dev_ids)})
+        json_len = len(json_text)
+        file_obj.write(struct.pack('!I', json_len))
+        file_obj.write(json_text)
+        offset = 10 + json_len
+        for table in tables + [part_dev_ids]:
+            file_obj.write('\0' * (_aligned(offset) - offset))
+            table = array.array('H', table)
+            if sys.byteorder == 'big':
+                table.byteswap()
+            file_obj.write(table.tostring())
+            offset = _aligned(offset) + 2 * len(table)
+
+    def save(self, filename, mapped=False):
         """
         Serialize this RingData instance to disk.
 
         :param filename: File into which this instance should be serialized.
+        :param mapped: If True, the uncompressed format that processes map
+                       into memory is written instead. The file is replaced
+                       rather than rewritten, as processes may still have the
+                       old one mapped.
         """
+        if mapped:
+            fd, tmppath = mkstemp(dir=os.path.dirname(filename) or '.')
+            try:
+                with os.fdopen(fd, 'wb') as fp:
+                    self.serialize_v2(fp)
+                os.chmod(tmppath, 0644)
+                os.rename(tmppath, filename)
+            except Exception:
+                os.unlink(tmppath)
+                raise
+            return
         # Override the timestamp so that the same ring data creates
         # the same bytes on disk. This makes a checksum comparison a
         # good way to see if two rings are identical.
@@ -127,6 +323,10 @@ class Ring(object):
 
     :param serialized_path: path to serialized RingData instance
     :param reload_time: time interval in seconds to check for a ring change
+    :param ring_name: if given, serialized_path is the directory holding
+                      <ring_name>.ring.gz; a <ring_name>.ring memory mapped
+                      ring file next to it is loaded instead when it is at
+                      least as recent
     """
 
     def __init__(self, serialized_path, reload_time=15, ring_name=None):
@@ -135,21 +335,55 @@ class Ring(object):
         if ring_name:
             self.serialized_path = os.path.join(serialized_path,
                                                 ring_name + '.ring.gz')
+            self.mapped_path = os.path.join(serialized_path,
+                                            ring_name + '.ring')
         else:
             self.serialized_path = os.path.join(serialized_path)
+            self.mapped_path = None
         self.reload_time = reload_time
         self._reload(force=True)
 
     def _reload(self, force=False):
         self._rtime = time() + self.reload_time
         if force or self.has_changed():
-            ring_data = RingData.load(self.serialized_path)
-            self._mtime = getmtime(self.serialized_path)
+            ring_path = self._get_ring_path()
+            ring_data = RingData.load(ring_path)
+            self._ring_path = ring_path
+            self._mtime = getmtime(ring_path)
             self._devs = ring_data.devs
 
             self._replica2part2dev_id = ring_data._replica2part2dev_id
             self._part_shift = ring_data._part_shift
             self._rebuild_tier_data()
+            if ring_data._part_dev_ids is not None:
+                # a mapped ring file comes with the table precomputed
+                self._replicas = len(self._replica2part2dev_id)
+                self._no_dev = NO_DEV
+                self._part_nodes = None
+                self._part_dev_ids = ring_data._part_dev_ids
+            else:
+                self._rebuild_part_nodes()
+            # part -> [tuple of handoff nodes, last use]
+            self._handoff_cache = {}
+            self._handoff_uses = count()
+
+    def _get_ring_path(self):
+        """
+        Returns the path of the ring file to load: the memory mapped ring
+        file if there is one at least as recent as the gzipped one.
+        """
+        if self.mapped_path:
+            try:
+                mapped_mtime = getmtime(self.mapped_path)
+            except OSError:
+                return self.serialized_path
+            try:
+                if mapped_mtime < getmtime(self.serialized_path):
+                    return self.serialized_path
+            except OSError:
+                pass
+            return self.mapped_path
+        return self.serialized_path
 
     def _rebuild_tier_data(self):
         self.tier2devs = defaultdict(list)
@@ -167,6 +401,33 @@ class Ring(object):
         for tiers in self.tiers_by_length:
             tiers.sort()
 
+    def _rebuild_part_nodes(self):
+        """
+        Precomputes the primary nodes of every partition, so looking them up
+        is a single indexed access instead of a walk over the replicas.
+        """
+        replicas = len(self._replica2part2dev_id)
+        parts = replicas and len(self._replica2part2dev_id[0])
+        if len(self._devs) < NO_DEV:
+            typecode, no_dev = 'H', NO_DEV
+        else:
+            typecode, no_dev = 'i', -1
+        part_dev_ids = build_part_dev_ids(self._replica2part2dev_id,
+                                          typecode, no_dev)
+        self._replicas = replicas
+        self._no_dev = no_dev
+        if parts <= MAX_PART_NODES_TABLE_PARTS:
+            devs = self._devs
+            self._part_nodes = [
+                tuple(devs[dev_id]
+                      for dev_id in part_dev_ids[start:start + replicas]
+                      if dev_id != no_dev)
+                for start in xrange(0, parts * replicas, replicas)]
+            self._part_dev_ids = None
+        else:
+            self._part_nodes = None
+            self._part_dev_ids = part_dev_ids
+
     @property
     def replica_count(self):
         """Number of replicas (full or partial) used in the ring."""
@@ -191,18 +452,21 @@ class Ring(object):
 
         :returns: True if the ring on disk has changed, False otherwise
         """
-        return getmtime(self.serialized_path) != self._mtime
+        ring_path = self._get_ring_path()
+        return ring_path != self._ring_path or \
+            getmtime(ring_path) != self._mtime
 
     def _get_part_nodes(self, part):
-        part_nodes = []
-        seen_ids = set()
-        for r2p2d in self._replica2part2dev_id:
-            if part < len(r2p2d):
-                dev_id = r2p2d[part]
-                if dev_id not in seen_ids:
-                    part_nodes.append(self.devs[dev_id])
-                seen_ids.add(dev_id)
-        return part_nodes
+        if self._part_nodes is not None:
+            if part >= len(self._part_nodes):
+                return []
+            return list(self._part_nodes[part])
+        start = part * self._replicas
+        devs = self._devs
+        no_dev = self._no_dev
+        return [devs[dev_id]
+                for dev_id in self._part_dev_ids[start:start + self._replicas]
+                if dev_id != no_dev]
 
     def get_part_nodes(self, part):
         """
@@ -261,7 +525,8 @@ class Ring(object):
         The handoff nodes will try to be in zones other than the
         primary zones, will take into account the device weights, and
         will usually keep the same sequences of handoffs even with
-        ring changes.
+        ring changes. The first few handoff nodes of recently used
+        partitions are remembered until the ring is reloaded.
 
         :param part: partition to get handoff nodes for
         :returns: generator of node dicts
@@ -270,6 +535,32 @@ class Ring(object):
         """
         if time() > self._rtime:
             self._reload()
+        entry = self._handoff_cache.get(part)
+        if entry:
+            entry[1] = self._handoff_uses.next()
+            handoffs = entry[0]
+        else:
+            handoffs = tuple(islice(self._get_more_nodes(part),
+                                    HANDOFF_CACHE_DEPTH))
+            if len(self._handoff_cache) >= HANDOFF_CACHE_SIZE:
+                # drops the least recently used quarter of the entries
+                lru = sorted(self._handoff_cache,
+                             key=lambda p: self._handoff_cache[p][1])
+                for lru_part in lru[:max(1, HANDOFF_CACHE_SIZE / 4)]:
+                    del self._handoff_cache[lru_part]
+            self._handoff_cache[part] = [handoffs,
+                                         self._handoff_uses.next()]
+        for dev in handoffs:
+            yield dev
+        if len(handoffs) == HANDOFF_CACHE_DEPTH:
+            for dev in islice(self._get_more_nodes(part),
+                              HANDOFF_CACHE_DEPTH, None):
+                yield dev
+
+    def _get_more_nodes(self, part):
+        """
+        Works out the handoff nodes of a partition for get_more_nodes.
+        """
         primary_nodes = self._get_part_nodes(part)
 
         used = set(d['id'] for d in primary_nodes)
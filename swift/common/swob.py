@@ -183,6 +183,52 @@ def _header_int_property(header):
                     doc="Retrieve and set the %s header as an int" % header)
 
 
+# Header names are mapped to environ keys and back again on every header
+# access; the mappings are cached, as working them out anew is much of the
+# header handling of small requests. Clients pick header names, so each cache
+# stops growing at MAX_CACHED_HEADERS entries.
+MAX_CACHED_HEADERS = 4096
+_environ_keys = {}
+_header_names = {}
+
+
+def _environ_key(header):
+    """
+    Returns the environ key of a header, e.g. HTTP_X_TIMESTAMP for
+    X-Timestamp.
+    """
+    try:
+        return _environ_keys[header]
+    except KeyError:
+        key = 'HTTP_' + header.replace('-', '_').upper()
+        if key in ('HTTP_CONTENT_LENGTH', 'HTTP_CONTENT_TYPE'):
+            key = key[5:]
+        if len(_environ_keys) < MAX_CACHED_HEADERS:
+            _environ_keys[header] = key
+        return key
+
+
+def _header_name(key):
+    """
+    Returns the header name of an environ key, e.g. X-Timestamp for
+    HTTP_X_TIMESTAMP, or None if the key isn't one of a header.
+    """
+    try:
+        return _header_names[key]
+    except KeyError:
+        if key.startswith('HTTP_'):
+            name = key[5:].replace('_', '-').title()
+        elif key == 'CONTENT_LENGTH':
+            name = 'Content-Length'
+        elif key == 'CONTENT_TYPE':
+            name = 'Content-Type'
+        else:
+            name = None
+        if len(_header_names) < MAX_CACHED_HEADERS:
+            _header_names[key] = name
+        return name
+
+
 class HeaderEnvironProxy(UserDict.DictMixin):
     """
     A dict-like object that proxies requests to a wsgi environ,
@@ -195,12 +241,7 @@ class HeaderEnvironProxy(UserDict.DictMixin):
         self.environ = environ
 
     def _normalize(self, key):
-        key = 'HTTP_' + key.replace('-', '_').upper()
-        if key == 'HTTP_CONTENT_LENGTH':
-            return 'CONTENT_LENGTH'
-        if key == 'HTTP_CONTENT_TYPE':
-            return 'CONTENT_TYPE'
-        return key
+        return _environ_key(key)
 
     def __getitem__(self, key):
         return self.environ[self._normalize(key)]
@@ -219,14 +260,29 @@ class HeaderEnvironProxy(UserDict.DictMixin):
     def __delitem__(self, key):
         del self.environ[self._normalize(key)]
 
+    def get(self, key, default=None):
+        return self.environ.get(self._normalize(key), default)
+
     def keys(self):
-        keys = [key[5:].replace('_', '-').title()
-                for key in self.environ.iterkeys() if key.startswith('HTTP_')]
-        if 'CONTENT_LENGTH' in self.environ:
-            keys.append('Content-Length')
-        if 'CONTENT_TYPE' in self.environ:
-            keys.append('Content-Type')
-        return keys
+        return [name for name in map(_header_name, self.environ)
+                if name is not None]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def iteritems(self):
+        # one pass over the environ, rather than DictMixin's lookup of every
+        # key; over a copy of it, so the headers may be changed meanwhile
+        for key, value in self.environ.items():
+            name = _header_name(key)
+            if name is not None:
+                yield name, value
+
+    def items(self):
+        return list(self.iteritems())
 
 
 class HeaderKeyDict(dict):
@@ -240,12 +296,16 @@ class HeaderKeyDict(dict):
         self.update(kwargs)
 
     def update(self, other):
-        if hasattr(other, 'keys'):
-            for key in other.keys():
-                self[key.lower()] = other[key]
-        else:
-            for key, value in other:
-                self[key.lower()] = value
+        if isinstance(other, HeaderKeyDict):
+            # keys and values are already as they would be stored here
+            dict.update(self, other)
+            return
+        if hasattr(other, 'iteritems'):
+            other = other.iteritems()
+        elif hasattr(other, 'keys'):
+            other = ((key, other[key]) for key in other.keys())
+        for key, value in other:
+            self[key] = value
 
     def __getitem__(self, key):
         return dict.get(self, key.lower())
@@ -253,6 +313,8 @@ class HeaderKeyDict(dict):
     def __setitem__(self, key, value):
         if value is None:
             self.pop(key.lower(), None)
+        elif value.__class__ is str:
+            return dict.__setitem__(self, key.lower(), value)
         elif isinstance(value, unicode):
             return dict.__setitem__(self, key.lower(), value.encode('utf-8'))
         else:
@@ -24,6 +24,7 @@ import time
 import functools
 from hashlib import md5
 from random import random, shuffle
+from bisect import bisect_left
 from urllib import quote
 from contextlib import contextmanager, closing
 import ctypes
@@ -71,6 +72,11 @@ _posix_fadvise = None
 # available being at or below this amount, in bytes.
 FALLOCATE_RESERVE = 0
 
+# Shard containers of a sharded container live in a hidden account named
+# after the root container's account. The leading dot lets the account and
+# container servers auto-create their databases.
+SHARD_ACCOUNT_PREFIX = '.shards_'
+
 # Used by hash_path to offer a bit more security when generating hashes for
 # paths. It simply appends this value to all paths; guessing the hash a path
 # will end up with would also require knowing this suffix.
@@ -444,8 +450,28 @@ class LoggerFileObject(object):
 
 
 class StatsdClient(object):
+    """
+    Sends metrics to StatsD.
+
+    By default every metric goes out right away in a datagram of its own.
+    With a flush_interval, metrics are buffered instead and sent several to a
+    datagram, one per line, once the buffer fills a datagram of
+    max_packet_size bytes or flush_interval seconds after the first of them
+    was buffered. Counters buffered more than once with the same sample rate
+    are added up and sent as one. The datagrams of all buffering clients of a
+    process go out through one non-blocking socket, so sending never
+    switches green threads; a datagram the socket can't take right away is
+    dropped, as any UDP datagram may be.
+    """
+
+    # the socket the buffering clients of the process share, and the pid it
+    # was opened by
+    _shared_sock = None
+    _shared_sock_pid = None
+
     def __init__(self, host, port, base_prefix='', tail_prefix='',
-                 default_sample_rate=1, sample_rate_factor=1):
+                 default_sample_rate=1, sample_rate_factor=1,
+                 flush_interval=0, max_packet_size=1400):
         self._host = host
         self._port = port
         self._base_prefix = base_prefix
@@ -454,6 +480,17 @@ class StatsdClient(object):
         self._sample_rate_factor = sample_rate_factor
         self._target = (self._host, self._port)
         self.random = random
+        self._flush_interval = flush_interval
+        self._max_packet_size = max_packet_size
+        self._reset_buffer()
+
+    def _reset_buffer(self):
+        self._lines = []
+        # (name, suffix) of buffered counters to their sum
+        self._counters = {}
+        self._buffered_bytes = 0
+        self._flush_timer = None
+        self._buffer_pid = os.getpid()
 
     def set_prefix(self, new_prefix):
         if new_prefix and self._base_prefix:
@@ -475,6 +512,9 @@ class StatsdClient(object):
                 parts.append('@%s' % (sample_rate,))
             else:
                 return
+        if self._flush_interval:
+            return self._buffer_metric(self._prefix + m_name, m_value,
+                                       '|' + '|'.join(parts[1:]))
         # Ideally, we'd cache a sending socket in self, but that
         # results in a socket getting shared by multiple green threads.
         with closing(self._open_socket()) as sock:
@@ -483,6 +523,81 @@ class StatsdClient(object):
     def _open_socket(self):
         return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
+    def _buffer_metric(self, name, value, suffix):
+        if self._buffer_pid != os.getpid():
+            # a forked child; the parent sends what it buffered itself
+            self._reset_buffer()
+        counter = suffix.split('|', 2)[1] == 'c'
+        if counter:
+            key = (name, suffix)
+            if key in self._counters:
+                self._counters[key] += value
+                return
+            # with room for the sum to grow
+            size = len(name) + len(suffix) + 12
+        else:
+            line = '%s:%s%s' % (name, value, suffix)
+            size = len(line) + 1
+        # the last line of a datagram goes without a newline
+        if self._buffered_bytes + size > self._max_packet_size + 1:
+            self.flush()
+        if counter:
+            self._counters[key] = value
+        else:
+            self._lines.append(line)
+        self._buffered_bytes += size
+        if self._flush_timer is None:
+            self._flush_timer = eventlet.hubs.get_hub().schedule_call_global(
+                self._flush_interval, self.flush)
+
+    def _open_shared_socket(self):
+        # not a green socket: flushes run in the hub's timers, and green
+        # sockets wait on the hub even when sending without blocking
+        sock = eventlet.patcher.original('socket').socket(socket.AF_INET,
+                                                          socket.SOCK_DGRAM)
+        sock.setblocking(0)
+        return sock
+
+    def _shared_socket(self):
+        if StatsdClient._shared_sock_pid != os.getpid():
+            sock = self._open_shared_socket()
+            StatsdClient._shared_sock = sock
+            StatsdClient._shared_sock_pid = os.getpid()
+        return StatsdClient._shared_sock
+
+    def flush(self):
+        """
+        Sends out the buffered metrics, as many to a datagram as fit in
+        max_packet_size bytes.
+        """
+        if self._buffer_pid != os.getpid():
+            self._reset_buffer()
+            return
+        lines = self._lines
+        lines.extend('%s:%s%s' % (name, value, suffix)
+                     for (name, suffix), value in self._counters.iteritems())
+        flush_timer = self._flush_timer
+        self._reset_buffer()
+        if flush_timer is not None:
+            flush_timer.cancel()
+        packet = []
+        size = 0
+        for line in lines:
+            if packet and size + len(line) > self._max_packet_size:
+                self._send_packet('\n'.join(packet))
+                packet = []
+                size = 0
+            packet.append(line)
+            size += len(line) + 1
+        if packet:
+            self._send_packet('\n'.join(packet))
+
+    def _send_packet(self, packet):
+        try:
+            self._shared_socket().sendto(packet, self._target)
+        except socket.error:
+            pass
+
     def update_stats(self, m_name, m_value, sample_rate=None):
         return self._send(m_name, m_value, 'c', sample_rate)
 
@@ -532,6 +647,66 @@ def timing_stats(**dec_kwargs):
     return decorating_func
 
 
+class StageTimings(object):
+    """
+    Durations of the named stages a request goes through in the proxy, such
+    as looking up its container or connecting to the object servers. Only
+    requests the proxy-logging middleware samples for it carry one, in their
+    WSGI environment as swift.stage_timings; see time_stage().
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    def add(self, stage, seconds):
+        self.stages.append((stage, seconds))
+
+    def __str__(self):
+        return ','.join('%s:%.4f' % stage for stage in self.stages)
+
+
+class _StageTimer(object):
+
+    def __init__(self, timings, stage):
+        self.timings = timings
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exc_info):
+        self.timings.add(self.stage, time.time() - self.start)
+
+
+class _NullStageTimer(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_stage_timer = _NullStageTimer()
+
+
+def time_stage(env, stage):
+    """
+    Returns a context manager timing a stage of a request if the request is
+    sampled for stage timings, or doing nothing otherwise::
+
+        with time_stage(req.environ, 'container_info'):
+            container_info = self.container_info(account, container)
+
+    :param env: WSGI environment of the request
+    :param stage: name of the stage
+    """
+    timings = env.get('swift.stage_timings')
+    if timings is None:
+        return _null_stage_timer
+    return _StageTimer(timings, stage)
+
+
 # double inheritance to support property with setter
 class LogAdapter(logging.LoggerAdapter, object):
     """
@@ -793,9 +968,12 @@ def get_logger(conf, name=None, log_to_console=False, log_route=None,
             'log_statsd_default_sample_rate', 1))
         sample_rate_factor = float(conf.get(
             'log_statsd_sample_rate_factor', 1))
+        flush_interval = float(conf.get('log_statsd_flush_interval', 0))
+        max_packet_size = int(conf.get('log_statsd_max_packet_size', 1400))
         statsd_client = StatsdClient(statsd_host, statsd_port, base_prefix,
                                      name, default_sample_rate,
-                                     sample_rate_factor)
+                                     sample_rate_factor, flush_interval,
+                                     max_packet_size)
         logger.statsd_client = statsd_client
     else:
         logger.statsd_client = None
@@ -1005,6 +1183,42 @@ def hash_path(account, container=None, object=None, raw_digest=False):
                    + HASH_PATH_SUFFIX).hexdigest()
 
 
+def get_shard_account(account):
+    """
+    Get the name of the hidden account holding the shard containers of the
+    given account's sharded containers.
+
+    :param account: Account of the sharded (root) container
+    :returns: shard account name
+    """
+    return SHARD_ACCOUNT_PREFIX + account
+
+
+def get_shard_container(account, container, index):
+    """
+    Get the name of one shard container of a sharded container.
+
+    :param account: Account of the sharded (root) container
+    :param container: Name of the sharded (root) container
+    :param index: Index of the shard range
+    :returns: shard container name
+    """
+    return '%s-%d' % (hash_path(account, container), index)
+
+
+def find_shard(name, shard_points):
+    """
+    Find the shard range an object name belongs to.  Shard range i holds the
+    names greater than shard_points[i - 1] and less than or equal to
+    shard_points[i]; the last range is unbounded.
+
+    :param name: Object name
+    :param shard_points: Sorted list of shard range upper bounds
+    :returns: index of the shard range
+    """
+    return bisect_left(shard_points, name)
+
+
 @contextmanager
 def lock_path(directory, timeout=10):
     """
@@ -1633,6 +1847,29 @@ def reiterate(iterable):
             return []
 
 
+def coalesce_chunks(iterable, chunk_size=65536):
+    """
+    Joins the small strings yielded by an iterable into chunks of at least
+    chunk_size bytes (the last chunk may be shorter).  This keeps generators
+    that yield a piece per row, such as listing serializers, from costing a
+    write per piece when used as a WSGI app_iter.
+
+    :param iterable: an iterable of strings
+    :param chunk_size: minimum size of the chunks to yield
+    """
+    buf = []
+    buf_size = 0
+    for piece in iterable:
+        buf.append(piece)
+        buf_size += len(piece)
+        if buf_size >= chunk_size:
+            yield ''.join(buf)
+            buf = []
+            buf_size = 0
+    if buf:
+        yield ''.join(buf)
+
+
 class InputProxy(object):
     """
     File-like object that counts bytes read.
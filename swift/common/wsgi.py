@@ -26,11 +26,13 @@ from StringIO import StringIO
 import eventlet
 import eventlet.debug
 from eventlet import greenio, GreenPool, sleep, wsgi, listen
+from eventlet.hubs import trampoline
 from paste.deploy import loadapp, appconfig
 from eventlet.green import socket, ssl
 from urllib import unquote
 
 from swift.common import utils
+from swift.common.profiler import start_sampling_profiler
 from swift.common.swob import Request
 from swift.common.utils import capture_stdio, disable_fallocate, \
     drop_privileges, get_logger, NullLogger, config_true_value, \
@@ -105,6 +107,69 @@ def get_socket(conf, default_port=8080):
     return sock
 
 
+class SwiftHttpProtocol(wsgi.HttpProtocol):
+    """
+    HttpProtocol keeping client connections alive for a limited number of
+    requests, and for a limited time between requests, counting connections
+    and their reuse with StatsD.
+
+    Requests a client pipelined are served without waiting on the socket, as
+    they already sit in the read buffer.
+
+    The settings are class attributes, set by run_wsgi from the config:
+
+    :param max_requests: requests served on a connection before it is closed;
+                         0 is no limit
+    :param idle_timeout: seconds a kept-alive connection may sit idle before
+                         it is closed; 0 is no limit
+    :param logger: logger to count connections with, or None
+    """
+    max_requests = 0
+    idle_timeout = 0
+    logger = None
+
+    def setup(self):
+        wsgi.HttpProtocol.setup(self)
+        self.requests_handled = 0
+        if self.logger:
+            self.logger.increment('client_connections')
+
+    def _request_waiting(self):
+        """
+        Waits for the next request on a kept-alive connection.
+
+        :returns: False if none came within idle_timeout
+        """
+        rbuf = getattr(self.rfile, '_rbuf', None)
+        if not self.idle_timeout or (rbuf and rbuf.tell()) or \
+                (hasattr(self.connection, 'pending') and
+                 self.connection.pending()):
+            return True
+        try:
+            trampoline(self.connection, read=True, timeout=self.idle_timeout,
+                       timeout_exc=socket.timeout)
+        except socket.timeout:
+            if self.logger:
+                self.logger.increment('client_idle_timeouts')
+            return False
+        return True
+
+    def handle_one_request(self):
+        if self.requests_handled and not self._request_waiting():
+            self.close_connection = 1
+            return
+        wsgi.HttpProtocol.handle_one_request(self)
+
+    def handle_one_response(self):
+        self.requests_handled += 1
+        if self.requests_handled > 1 and self.logger:
+            self.logger.increment('client_connection_reuses')
+        if self.max_requests and self.requests_handled >= self.max_requests:
+            # the response tells the client to close the connection
+            self.close_connection = 1
+        wsgi.HttpProtocol.handle_one_response(self)
+
+
 # TODO: pull pieces of this out to test
 def run_wsgi(conf_file, app_section, *args, **kwargs):
     """
@@ -133,6 +198,8 @@ def run_wsgi(conf_file, app_section, *args, **kwargs):
     capture_stdio(logger)
 
     def run_server():
+        # Only applies to requests without any HTTP version; HTTP/1.1 clients
+        # get their connections kept alive unless keep_alive is turned off.
         wsgi.HttpProtocol.default_request_version = "HTTP/1.0"
         # Turn off logging requests by the underlying WSGI software.
         wsgi.HttpProtocol.log_request = lambda *a: None
@@ -140,6 +207,11 @@ def run_wsgi(conf_file, app_section, *args, **kwargs):
         wsgi.HttpProtocol.log_message = \
             lambda s, f, *a: logger.error('ERROR WSGI: ' + f % a)
         wsgi.WRITE_TIMEOUT = int(conf.get('client_timeout') or 60)
+        SwiftHttpProtocol.max_requests = \
+            int(conf.get('max_requests_per_connection', 1000))
+        SwiftHttpProtocol.idle_timeout = \
+            float(conf.get('keep_alive_timeout', 30))
+        SwiftHttpProtocol.logger = logger
 
         eventlet.hubs.use_hub(get_hub())
         eventlet.patcher.monkey_patch(all=False, socket=True)
@@ -148,12 +220,18 @@ def run_wsgi(conf_file, app_section, *args, **kwargs):
         app = loadapp('config:%s' % conf_file,
                       global_conf={'log_name': log_name})
         pool = GreenPool(size=1024)
+        profiler = start_sampling_profiler(conf, log_name, logger)
         try:
-            wsgi.server(sock, app, NullLogger(), custom_pool=pool)
+            wsgi.server(sock, app, NullLogger(), custom_pool=pool,
+                        protocol=SwiftHttpProtocol,
+                        keepalive=config_true_value(
+                            conf.get('keep_alive', 'true')))
         except socket.error, err:
             if err[0] != errno.EINVAL:
                 raise
         pool.waitall()
+        if profiler:
+            profiler.stop()
 
     worker_count = int(conf.get('workers', '1'))
     # Useful for profiling [no forks].
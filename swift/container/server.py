@@ -15,23 +15,25 @@
 
 from __future__ import with_statement
 
+import errno
 import os
 import time
 import traceback
 from xml.sax import saxutils
 from datetime import datetime
 
-from eventlet import Timeout
+from eventlet import sleep, spawn, Timeout
 
 import swift.common.db
 from swift.common.db import ContainerBroker
 from swift.common.utils import get_logger, get_param, hash_path, public, \
     normalize_timestamp, storage_directory, validate_sync_to, \
-    config_true_value, validate_device_partition, json, timing_stats
+    config_true_value, validate_device_partition, json, timing_stats, \
+    coalesce_chunks
 from swift.common.constraints import CONTAINER_LISTING_LIMIT, \
     check_mount, check_float, check_utf8, FORMAT2CONTENT_TYPE
 from swift.common.bufferedhttp import http_connect
-from swift.common.exceptions import ConnectionTimeout
+from swift.common.exceptions import ConnectionTimeout, LockTimeout
 from swift.common.db_replicator import ReplicatorRpc
 from swift.common.http import HTTP_NOT_FOUND, is_success
 from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPConflict, \
@@ -42,6 +44,31 @@ from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPConflict, \
 DATADIR = 'containers'
 
 
+def timestamp_to_last_modified(created_at, seconds_cache=None):
+    """
+    Formats a created_at value from the object table as the ISO 8601
+    last_modified string used in listings, always including microseconds.
+
+    Only the whole seconds go through datetime; the fractional digits of the
+    normalized timestamp are copied as they are.  Rows of a listing page often
+    share the same second, so the formatted seconds are memoized in
+    seconds_cache when one is given.
+
+    :param created_at: normalized timestamp string
+    :param seconds_cache: optional dict to memoize formatted seconds in
+    :returns: string like 1970-01-01T00:00:01.500000
+    """
+    seconds, _junk, fraction = created_at.partition('.')
+    if seconds_cache is None:
+        seconds_cache = {}
+    try:
+        formatted = seconds_cache[seconds]
+    except KeyError:
+        formatted = seconds_cache[seconds] = \
+            datetime.utcfromtimestamp(int(seconds)).isoformat()
+    return '%s.%s' % (formatted, fraction[:6].ljust(6, '0'))
+
+
 class ContainerController(object):
     """WSGI Controller for the container server."""
 
@@ -68,6 +95,14 @@ class ContainerController(object):
             self.save_headers.append('x-versions-location')
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        self.pending_flush_interval = \
+            float(conf.get('pending_flush_interval', 1))
+        self.pending_flush_size = int(conf.get('pending_flush_size', 16384))
+        self.pending_flush_age = float(conf.get('pending_flush_age', 5))
+        self.pending_flush_lock_timeout = \
+            float(conf.get('pending_flush_lock_timeout', 0.5))
+        self.pending_dbs = {}
+        self.pending_flusher = None
 
     def _get_container_broker(self, drive, part, account, container):
         """
@@ -85,6 +120,66 @@ class ContainerController(object):
         return ContainerBroker(db_path, account=account, container=container,
                                logger=self.logger)
 
+    def pending_updated(self, broker):
+        """
+        Notes that an object update was queued in the .pending file of a
+        container DB, so the pending flusher merges it in the background, and
+        starts the flusher if it isn't running yet.  The flusher stops again
+        once there are no more pending updates to look after.
+
+        :param broker: container DB broker object
+        """
+        if self.pending_flush_interval <= 0:
+            return
+        self.pending_dbs.setdefault(broker.db_file, time.time())
+        if not self.pending_flusher:
+            self.pending_flusher = spawn(self._run_pending_flusher)
+
+    def _run_pending_flusher(self):
+        try:
+            while self.pending_dbs:
+                sleep(self.pending_flush_interval)
+                try:
+                    self.flush_pending()
+                except (Exception, Timeout):
+                    self.logger.exception(_('ERROR flushing pending files'))
+        finally:
+            self.pending_flusher = None
+
+    def flush_pending(self):
+        """
+        Merges the .pending files of the container DBs updated recently into
+        the DBs once they have grown past pending_flush_size bytes or their
+        first update is pending_flush_age seconds old, so reads of the
+        containers rarely have to do so on the request path.
+        """
+        now = time.time()
+        for db_file, first_update in self.pending_dbs.items():
+            try:
+                pending_size = os.path.getsize(db_file + '.pending')
+            except OSError, err:
+                if err.errno != errno.ENOENT:
+                    self.logger.exception(
+                        _('ERROR checking pending file of %s'), db_file)
+                del self.pending_dbs[db_file]
+                continue
+            if pending_size < self.pending_flush_size and \
+                    now - first_update < self.pending_flush_age:
+                continue
+            broker = ContainerBroker(
+                db_file, logger=self.logger,
+                pending_timeout=self.pending_flush_lock_timeout)
+            try:
+                broker.commit_pending()
+            except LockTimeout:
+                # someone else holds it, likely a request merging it itself
+                continue
+            except (Exception, Timeout):
+                self.logger.exception(_('ERROR flushing %s'), db_file)
+            del self.pending_dbs[db_file]
+            self.logger.increment('pending_flushes')
+            sleep()
+
     def account_update(self, req, account, container, broker):
         """
         Update the account server(s) with latest container info.
@@ -190,6 +285,7 @@ class ContainerController(object):
             return HTTPNotFound()
         if obj:     # delete object
             broker.delete_object(obj, req.headers.get('x-timestamp'))
+            self.pending_updated(broker)
             return HTTPNoContent(request=req)
         else:
             # delete container
@@ -239,6 +335,7 @@ class ContainerController(object):
             broker.put_object(obj, timestamp, int(req.headers['x-size']),
                               req.headers['x-content-type'],
                               req.headers['x-etag'])
+            self.pending_updated(broker)
             return HTTPCreated(request=req)
         else:   # put container
             if not os.path.exists(broker.db_file):
@@ -294,6 +391,9 @@ class ContainerController(object):
             'X-Timestamp': info['created_at'],
             'X-PUT-Timestamp': info['put_timestamp'],
         }
+        shard_points = broker.get_shard_points()
+        if shard_points:
+            headers['X-Container-Shard-Count'] = len(shard_points) + 1
         headers.update(
             (key, value)
             for key, (value, timestamp) in broker.metadata.iteritems()
@@ -345,6 +445,10 @@ class ContainerController(object):
         broker.stale_reads_ok = True
         if broker.is_deleted():
             return HTTPNotFound(request=req)
+        shard_points = broker.get_shard_points()
+        if config_true_value(req.headers.get('x-container-get-shard-points')):
+            return Response(body=json.dumps(shard_points), request=req,
+                            content_type='application/json')
         info = broker.get_info()
         resp_headers = {
             'X-Container-Object-Count': info['object_count'],
@@ -352,6 +456,8 @@ class ContainerController(object):
             'X-Timestamp': info['created_at'],
             'X-PUT-Timestamp': info['put_timestamp'],
         }
+        if shard_points:
+            resp_headers['X-Container-Shard-Count'] = len(shard_points) + 1
         resp_headers.update(
             (key, value)
             for key, (value, timestamp) in broker.metadata.iteritems()
@@ -385,60 +491,82 @@ class ContainerController(object):
             ['text/plain', 'application/json', 'application/xml', 'text/xml'])
         if not out_content_type:
             return HTTPNotAcceptable(request=req)
-        container_list = broker.list_objects_iter(limit, marker, end_marker,
-                                                  prefix, delimiter, path)
+        # The proxy server merging the listings of a sharded container and
+        # its shards needs the deleted objects too, to know which is newest.
+        include_deleted = out_content_type == 'application/json' and \
+            config_true_value(req.headers.get('x-container-list-deleted'))
+        container_list = broker.list_objects_iter(
+            limit, marker, end_marker, prefix, delimiter, path,
+            include_deleted=include_deleted)
         if out_content_type == 'application/json':
-            data = []
-            for (name, created_at, size, content_type, etag) in container_list:
-                if content_type is None:
-                    data.append({"subdir": name})
-                else:
-                    created_at = datetime.utcfromtimestamp(
-                        float(created_at)).isoformat()
-                    # python isoformat() doesn't include msecs when zero
-                    if len(created_at) < len("1970-01-01T00:00:00.000000"):
-                        created_at += ".000000"
-                    content_type, size = self.derive_content_type_metadata(
-                        content_type, size)
-                    data.append({'last_modified': created_at, 'bytes': size,
-                                'content_type': content_type, 'hash': etag,
-                                'name': name})
-            container_list = json.dumps(data)
+            app_iter = self._json_listing_iter(container_list)
         elif out_content_type.endswith('/xml'):
-            xml_output = []
-            for (name, created_at, size, content_type, etag) in container_list:
-                # escape name and format date here
-                name = saxutils.escape(name)
-                created_at = datetime.utcfromtimestamp(
-                    float(created_at)).isoformat()
-                # python isoformat() doesn't include msecs when zero
-                if len(created_at) < len("1970-01-01T00:00:00.000000"):
-                    created_at += ".000000"
-                if content_type is None:
-                    xml_output.append('<subdir name="%s"><name>%s</name>'
-                                      '</subdir>' % (name, name))
-                else:
-                    content_type, size = self.derive_content_type_metadata(
-                        content_type, size)
-                    content_type = saxutils.escape(content_type)
-                    xml_output.append(
-                        '<object><name>%s</name><hash>%s</hash>'
-                        '<bytes>%d</bytes><content_type>%s</content_type>'
-                        '<last_modified>%s</last_modified></object>' %
-                        (name, etag, size, content_type, created_at))
-            container_list = ''.join([
-                '<?xml version="1.0" encoding="UTF-8"?>\n',
-                '<container name=%s>' % saxutils.quoteattr(container),
-                ''.join(xml_output), '</container>'])
+            app_iter = self._xml_listing_iter(container, container_list)
         else:
             if not container_list:
                 return HTTPNoContent(request=req, headers=resp_headers)
-            container_list = '\n'.join(r[0] for r in container_list) + '\n'
-        ret = Response(body=container_list, request=req, headers=resp_headers)
+            app_iter = ('%s\n' % r[0] for r in container_list)
+        ret = Response(app_iter=coalesce_chunks(app_iter), request=req,
+                       headers=resp_headers)
         ret.content_type = out_content_type
         ret.charset = 'utf-8'
         return ret
 
+    def _json_listing_iter(self, container_list):
+        """
+        Serializes listing rows as a JSON array, one row at a time.
+
+        :param container_list: rows from ContainerBroker.list_objects_iter
+        """
+        yield '['
+        seconds_cache = {}
+        separator = ''
+        for row in container_list:
+            name, created_at, size, content_type, etag = row[:5]
+            if len(row) > 5 and row[5]:
+                yield '%s{"name": %s, "last_modified": "%s", "deleted": 1}' % (
+                    separator, json.dumps(name),
+                    timestamp_to_last_modified(created_at, seconds_cache))
+            elif content_type is None:
+                yield '%s{"subdir": %s}' % (separator, json.dumps(name))
+            else:
+                content_type, size = self.derive_content_type_metadata(
+                    content_type, size)
+                yield '%s{"name": %s, "hash": %s, "bytes": %d, ' \
+                    '"content_type": %s, "last_modified": "%s"}' % (
+                        separator, json.dumps(name), json.dumps(etag), size,
+                        json.dumps(content_type),
+                        timestamp_to_last_modified(created_at,
+                                                   seconds_cache))
+            separator = ', '
+        yield ']'
+
+    def _xml_listing_iter(self, container, container_list):
+        """
+        Serializes listing rows as an XML document, one row at a time.
+
+        :param container: container name
+        :param container_list: rows from ContainerBroker.list_objects_iter
+        """
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n' \
+            '<container name=%s>' % saxutils.quoteattr(container)
+        seconds_cache = {}
+        for (name, created_at, size, content_type, etag) in container_list:
+            name = saxutils.escape(name)
+            if content_type is None:
+                yield '<subdir name="%s"><name>%s</name></subdir>' % (
+                    name, name)
+            else:
+                content_type, size = self.derive_content_type_metadata(
+                    content_type, size)
+                yield '<object><name>%s</name><hash>%s</hash>' \
+                    '<bytes>%d</bytes><content_type>%s</content_type>' \
+                    '<last_modified>%s</last_modified></object>' % (
+                        name, etag, size, saxutils.escape(content_type),
+                        timestamp_to_last_modified(created_at,
+                                                   seconds_cache))
+        yield '</container>'
+
     @public
     @timing_stats(sample_rate=0.01)
     def REPLICATE(self, req):
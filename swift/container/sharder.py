@@ -0,0 +1,331 @@
+# Copyright (c) 2010-2013 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from time import ctime, time
+from random import random
+
+from eventlet import sleep, Timeout
+
+import swift.common.db
+from swift.container import server as container_server
+from swift.common.bufferedhttp import http_connect
+from swift.common.db import ContainerBroker
+from swift.common.db_replicator import ReplConnection
+from swift.common.direct_client import direct_head_container
+from swift.common.exceptions import ConnectionTimeout
+from swift.common.http import is_success
+from swift.common.ring import Ring
+from swift.common.utils import audit_location_generator, get_logger, \
+    hash_path, config_true_value, normalize_timestamp, whataremyips, \
+    get_shard_account, get_shard_container, SHARD_ACCOUNT_PREFIX
+from swift.common.daemon import Daemon
+
+
+class ContainerSharder(Daemon):
+    """
+    Daemon to split large containers into shard containers.
+
+    This is done by scanning the local devices for container databases. Once
+    a container holds shard_container_size objects, the first primary node
+    for it picks shard points splitting its names into ranges of half that
+    many objects, creates one shard container per range in a hidden
+    ``.shards_<account>`` account and records the shard points in the
+    container's metadata, from where replication spreads them to the other
+    replicas.
+
+    Every replica of a sharded container then hands the rows it holds over to
+    the shard containers with REPLICATE merge_items requests, just like the
+    db replicator does, and removes them locally once a majority of the shard
+    replicas took them. The proxy sends object updates for a sharded
+    container to its shards and stitches the shard listings back together,
+    so rows still arriving at the root are only those from proxies that have
+    not yet learned about the sharding; they are moved on the next pass.
+
+    Finally the object count and bytes used of the shards are gathered and
+    stored in the container's metadata, so HEADs of the container and the
+    account stats still cover all of its objects.
+
+    :param conf: The dict of configuration values from the
+                 [container-sharder] section of the container-server.conf
+    :param container_ring: If None, the <swift_dir>/container.ring.gz will be
+                           loaded. This is overridden by unit tests.
+    """
+
+    def __init__(self, conf, container_ring=None):
+        self.conf = conf
+        self.logger = get_logger(conf, log_route='container-sharder')
+        self.devices = conf.get('devices', '/srv/node')
+        self.mount_check = config_true_value(conf.get('mount_check', 'true'))
+        self.interval = int(conf.get('interval', 1800))
+        self.shard_container_size = \
+            int(conf.get('shard_container_size', 1000000))
+        self.shard_batch_size = int(conf.get('shard_batch_size', 1000))
+        self.node_timeout = int(conf.get('node_timeout', 10))
+        self.conn_timeout = float(conf.get('conn_timeout', 0.5))
+        self.containers_sharded = 0
+        self.objects_moved = 0
+        self.container_failures = 0
+        self.reported = time()
+        swift_dir = conf.get('swift_dir', '/etc/swift')
+        self.container_ring = container_ring or Ring(swift_dir,
+                                                     ring_name='container')
+        self._myips = whataremyips()
+        self._myport = int(conf.get('bind_port', 6001))
+        swift.common.db.DB_PREALLOCATION = \
+            config_true_value(conf.get('db_preallocation', 'f'))
+
+    def run_forever(self, *args, **kwargs):
+        """
+        Runs container sharder scans until stopped.
+        """
+        sleep(random() * self.interval)
+        while True:
+            begin = time()
+            all_locs = audit_location_generator(self.devices,
+                                                container_server.DATADIR,
+                                                mount_check=self.mount_check,
+                                                logger=self.logger)
+            for path, device, partition in all_locs:
+                self.container_shard(path)
+                if time() - self.reported >= 3600:  # once an hour
+                    self.report()
+            elapsed = time() - begin
+            if elapsed < self.interval:
+                sleep(self.interval - elapsed)
+
+    def run_once(self, *args, **kwargs):
+        """
+        Runs a single container sharder scan.
+        """
+        self.logger.info(_('Begin container sharder "once" mode'))
+        begin = time()
+        all_locs = audit_location_generator(self.devices,
+                                            container_server.DATADIR,
+                                            mount_check=self.mount_check,
+                                            logger=self.logger)
+        for path, device, partition in all_locs:
+            self.container_shard(path)
+            if time() - self.reported >= 3600:  # once an hour
+                self.report()
+        self.report()
+        elapsed = time() - begin
+        self.logger.info(
+            _('Container sharder "once" mode completed: %.02fs'), elapsed)
+
+    def report(self):
+        """
+        Writes a report of the stats to the logger and resets the stats for the
+        next report.
+        """
+        self.logger.info(
+            _('Since %(time)s: %(sharded)s containers sharded, %(moved)s '
+              'objects moved, %(fail)s failed'),
+            {'time': ctime(self.reported),
+             'sharded': self.containers_sharded,
+             'moved': self.objects_moved,
+             'fail': self.container_failures})
+        self.reported = time()
+        self.containers_sharded = 0
+        self.objects_moved = 0
+        self.container_failures = 0
+
+    def container_shard(self, path):
+        """
+        Checks the given path for a container database, shards it if it has
+        grown too large and moves its rows over to its shard containers.
+
+        :param path: the path to a container db
+        """
+        broker = None
+        try:
+            if not path.endswith('.db'):
+                return
+            broker = ContainerBroker(path)
+            if broker.is_deleted():
+                return
+            info = broker.get_info()
+            account = info['account']
+            container = info['container']
+            if account.startswith(SHARD_ACCOUNT_PREFIX):
+                return
+            x, nodes = self.container_ring.get_nodes(account, container)
+            for ordinal, node in enumerate(nodes):
+                if node['ip'] in self._myips and node['port'] == self._myport:
+                    break
+            else:
+                return
+            shard_points = broker.get_shard_points()
+            if not shard_points:
+                if ordinal != 0 or \
+                        info['object_count'] < self.shard_container_size:
+                    return
+                shard_points = broker.find_shard_points(
+                    max(1, self.shard_container_size / 2))
+                if not shard_points:
+                    return
+                timestamp = normalize_timestamp(time())
+                for index in xrange(len(shard_points) + 1):
+                    if not self.create_shard(account, container, index,
+                                             timestamp):
+                        self.container_failures += 1
+                        self.logger.increment('failures')
+                        return
+                broker.set_shard_points(shard_points, timestamp)
+                self.containers_sharded += 1
+                self.logger.increment('sharded')
+            for index in xrange(len(shard_points) + 1):
+                if not self.move_objects(broker, account, container,
+                                         shard_points, index):
+                    self.container_failures += 1
+                    self.logger.increment('failures')
+                    return
+            self.update_shard_stats(broker, account, container,
+                                    len(shard_points) + 1)
+        except (Exception, Timeout):
+            self.container_failures += 1
+            self.logger.increment('failures')
+            self.logger.exception(_('ERROR Sharding %s'),
+                                  broker.db_file if broker else path)
+
+    def create_shard(self, account, container, index, timestamp):
+        """
+        Creates one shard container of a container on all its nodes.
+
+        :param account: account name of the sharded container
+        :param container: name of the sharded container
+        :param index: index of the shard range
+        :param timestamp: put timestamp for the shard container
+        :returns: True if a majority of the shard's nodes created it
+        """
+        shard_account = get_shard_account(account)
+        shard_container = get_shard_container(account, container, index)
+        part, nodes = self.container_ring.get_nodes(shard_account,
+                                                    shard_container)
+        path = '/%s/%s' % (shard_account, shard_container)
+        successes = 0
+        for node in nodes:
+            try:
+                with ConnectionTimeout(self.conn_timeout):
+                    conn = http_connect(node['ip'], node['port'],
+                                        node['device'], part, 'PUT', path,
+                                        {'X-Timestamp': timestamp})
+                with Timeout(self.node_timeout):
+                    resp = conn.getresponse()
+                    resp.read()
+                if is_success(resp.status):
+                    successes += 1
+                else:
+                    self.logger.error(
+                        _('ERROR %(status)d creating shard container '
+                          '%(path)s on %(ip)s:%(port)s/%(device)s'),
+                        {'status': resp.status, 'path': path,
+                         'ip': node['ip'], 'port': node['port'],
+                         'device': node['device']})
+            except (Exception, Timeout):
+                self.logger.exception(
+                    _('ERROR creating shard container %(path)s on '
+                      '%(ip)s:%(port)s/%(device)s'),
+                    {'path': path, 'ip': node['ip'], 'port': node['port'],
+                     'device': node['device']})
+        return successes > len(nodes) / 2
+
+    def move_objects(self, broker, account, container, shard_points, index):
+        """
+        Moves the rows of one shard range from the container database to
+        the shard container, in batches of shard_batch_size rows.
+
+        :param broker: ContainerBroker of the sharded container
+        :param account: account name of the sharded container
+        :param container: name of the sharded container
+        :param shard_points: the container's shard points
+        :param index: index of the shard range
+        :returns: True if all rows of the range were moved
+        """
+        lower = shard_points[index - 1] if index else None
+        upper = shard_points[index] if index < len(shard_points) else None
+        shard_account = get_shard_account(account)
+        shard_container = get_shard_container(account, container, index)
+        part, nodes = self.container_ring.get_nodes(shard_account,
+                                                    shard_container)
+        hsh = hash_path(shard_account, shard_container)
+        while True:
+            objects = broker.get_objects_in_range(lower, upper,
+                                                  self.shard_batch_size)
+            if not objects:
+                return True
+            successes = 0
+            for node in nodes:
+                if self._merge_objects(node, part, hsh, objects):
+                    successes += 1
+            if successes <= len(nodes) / 2:
+                self.logger.error(
+                    _('ERROR moving objects of %(db_file)s to shard '
+                      'container /%(account)s/%(container)s'),
+                    {'db_file': broker.db_file, 'account': shard_account,
+                     'container': shard_container})
+                return False
+            broker.remove_objects(objects)
+            self.objects_moved += len(objects)
+            self.logger.update_stats('objects_moved', len(objects))
+            sleep()
+
+    def _merge_objects(self, node, part, hsh, objects):
+        try:
+            with ConnectionTimeout(self.conn_timeout):
+                http = ReplConnection(node, part, hsh, self.logger)
+            with Timeout(self.node_timeout):
+                response = http.replicate('merge_items', objects, None)
+            return bool(response and is_success(response.status))
+        except (Exception, Timeout):
+            self.logger.exception(
+                _('ERROR merging objects to %(ip)s:%(port)s/%(device)s'),
+                node)
+            return False
+
+    def update_shard_stats(self, broker, account, container, shard_count):
+        """
+        Gathers the object count and bytes used of a container's shards and
+        stores them in the container's metadata.
+
+        :param broker: ContainerBroker of the sharded container
+        :param account: account name of the sharded container
+        :param container: name of the sharded container
+        :param shard_count: number of shard ranges
+        """
+        shard_account = get_shard_account(account)
+        object_count = bytes_used = 0
+        for index in xrange(shard_count):
+            shard_container = get_shard_container(account, container, index)
+            part, nodes = self.container_ring.get_nodes(shard_account,
+                                                        shard_container)
+            for node in nodes:
+                try:
+                    headers = direct_head_container(
+                        node, part, shard_account, shard_container,
+                        conn_timeout=self.conn_timeout,
+                        response_timeout=self.node_timeout)
+                    break
+                except (Exception, Timeout):
+                    continue
+            else:
+                self.logger.warning(
+                    _('Could not get stats of shard container '
+                      '/%(account)s/%(container)s'),
+                    {'account': shard_account, 'container': shard_container})
+                return
+            object_count += int(headers['x-container-object-count'])
+            bytes_used += int(headers['x-container-bytes-used'])
+        if broker.get_shard_stats() != (object_count, bytes_used):
+            broker.set_shard_stats(object_count, bytes_used, time())
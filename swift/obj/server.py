@@ -33,12 +33,13 @@ from eventlet import sleep, Timeout, tpool
 from swift.common.utils import mkdirs, normalize_timestamp, public, \
     storage_directory, hash_path, renamer, fallocate, fsync, fdatasync, \
     split_path, drop_buffer_cache, get_logger, write_pickle, \
-    config_true_value, validate_device_partition, timing_stats
+    config_true_value, validate_device_partition, timing_stats, \
+    get_shard_account
 from swift.common.bufferedhttp import http_connect
 from swift.common.constraints import check_object_creation, check_mount, \
     check_float, check_utf8
 from swift.common.exceptions import ConnectionTimeout, DiskFileError, \
-    DiskFileNotExist
+    DiskFileNotExist, ChunkReadTimeout
 from swift.obj.replicator import tpool_reraise, invalidate_hash, \
     quarantine_renamer, get_hashes
 from swift.common.http import is_success
@@ -92,6 +93,27 @@ def write_metadata(fd, metadata):
         key += 1
 
 
+def split_container_shard(shard, account):
+    """
+    Splits the X-Container-Shard header the proxy server sends when an
+    object's container is sharded into the shard container's account and
+    name. The shard has to be in the object's own account or in the hidden
+    account holding that account's shard containers, so a client can't have
+    listing updates sent to any other container.
+
+    :param shard: quoted "account/container" value of the header
+    :param account: account of the object
+    :returns: tuple of (account, container)
+    :raises ValueError: if the value is malformed or outside the account
+    """
+    shard_account, _junk, shard_container = unquote(shard).partition('/')
+    if not shard_account or not shard_container or '/' in shard_container:
+        raise ValueError('Invalid X-Container-Shard')
+    if shard_account not in (account, get_shard_account(account)):
+        raise ValueError('X-Container-Shard outside of account')
+    return shard_account, shard_container
+
+
 class DiskFile(object):
     """
     Manage object files on disk.
@@ -514,6 +536,17 @@ class ObjectController(object):
         else:
             updates = []
 
+        shard = headers_in.get('X-Container-Shard')
+        if shard:
+            # The container is sharded; the hosts given are those of the
+            # shard container holding this object's name.
+            try:
+                account, container = split_container_shard(shard, account)
+            except ValueError, err:
+                self.logger.error(_('ERROR Container update failed: %s'),
+                                  err)
+                return
+
         for conthost, contdevice in updates:
             self.async_update(op, account, container, obj, conthost,
                               contpartition, contdevice, headers_out,
@@ -612,6 +645,84 @@ class ObjectController(object):
         file.put_metadata(metadata)
         return HTTPAccepted(request=request)
 
+    def _open_copy_source(self, request):
+        """
+        Opens the data of the object a PUT copies, as given by the
+        X-Copy-Source-* headers the proxy server sends instead of a request
+        body: the replica on X-Copy-Source-Local-Device if there is one on
+        this server, otherwise the first of X-Copy-Source-Hosts and
+        X-Copy-Source-Devices that has it. Only a replica with the ETag of the
+        PUT request is used, so stale replicas are passed over.
+
+        :param request: the PUT request
+        :returns: tuple of (content length, iterator over the data), or None
+                  if no replica of the source could be opened
+        :raises ValueError: if the X-Copy-Source-* headers are invalid
+        """
+        partition = request.headers['x-copy-source-partition']
+        path = unquote(request.headers['x-copy-source-path'])
+        account, container, obj = split_path(path, 3, 3, True)
+        etag = request.headers.get('etag')
+        local_device = request.headers.get('x-copy-source-local-device')
+        hosts = request.headers.get('x-copy-source-hosts')
+        devices = request.headers.get('x-copy-source-devices')
+        sources = zip(hosts.split(','), devices.split(',')) \
+            if hosts and devices else []
+        for device in [local_device] + [device for _junk, device in sources]:
+            if device:
+                validate_device_partition(device, partition)
+        if local_device and (not self.mount_check or
+                             check_mount(self.devices, local_device)):
+            file = DiskFile(self.devices, local_device, partition, account,
+                            container, obj, self.logger, keep_data_fp=True,
+                            disk_chunk_size=self.disk_chunk_size,
+                            iter_hook=sleep)
+            if not file.is_deleted() and not file.is_expired() and \
+                    (etag is None or file.metadata['ETag'] == etag.lower()):
+                try:
+                    return file.get_data_file_size(), iter(file)
+                except (DiskFileError, DiskFileNotExist):
+                    file.quarantine()
+            file.close()
+        headers = {'X-Trans-Id': request.headers.get('x-trans-id', '-')}
+        if etag:
+            headers['If-Match'] = etag
+        for host, device in sources:
+            ip, port = host.rsplit(':', 1)
+            try:
+                with ConnectionTimeout(self.conn_timeout):
+                    conn = http_connect(ip, port, device, partition, 'GET',
+                                        path, headers)
+                with Timeout(self.node_timeout):
+                    response = conn.getresponse()
+                if is_success(response.status):
+                    return (int(response.getheader('content-length')),
+                            self._iter_copy_source(response, host, device))
+                response.close()
+            except (Exception, Timeout):
+                self.logger.exception(_(
+                    'ERROR copy source %(ip)s:%(port)s/%(dev)s'),
+                    {'ip': ip, 'port': port, 'dev': device})
+        return None
+
+    def _iter_copy_source(self, response, host, device):
+        """
+        Reads the data of a copy source from another object server; it just
+        stops short if the other server stops sending.
+        """
+        try:
+            while True:
+                with ChunkReadTimeout(self.node_timeout):
+                    chunk = response.read(self.network_chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        except ChunkReadTimeout:
+            self.logger.warn(_('ERROR copy source %(host)s/%(dev)s read '
+                               'timeout'), {'host': host, 'dev': device})
+        finally:
+            response.close()
+
     @public
     @timing_stats()
     def PUT(self, request):
@@ -629,6 +740,13 @@ class ObjectController(object):
                 not check_float(request.headers['x-timestamp']):
             return HTTPBadRequest(body='Missing timestamp', request=request,
                                   content_type='text/plain')
+        if 'x-container-shard' in request.headers:
+            try:
+                split_container_shard(request.headers['x-container-shard'],
+                                      account)
+            except ValueError, err:
+                return HTTPBadRequest(body=str(err), request=request,
+                                      content_type='text/plain')
         error_response = check_object_creation(request, obj)
         if error_response:
             return error_response
@@ -636,6 +754,23 @@ class ObjectController(object):
         if new_delete_at and new_delete_at < time.time():
             return HTTPBadRequest(body='X-Delete-At in past', request=request,
                                   content_type='text/plain')
+        if 'x-copy-source-path' in request.headers:
+            # The proxy server sends no data for a copy, just where to get it
+            # from. Reading the empty body answers its Expect: 100-continue
+            # before the copy starts.
+            request.environ['wsgi.input'].read()
+            try:
+                source = self._open_copy_source(request)
+            except ValueError, err:
+                return HTTPBadRequest(body=str(err), request=request,
+                                      content_type='text/plain')
+            if not source:
+                return HTTPNotFound(request=request)
+            content_length, data_source = source
+        else:
+            content_length = request.headers.get('content-length')
+            reader = request.environ['wsgi.input'].read
+            data_source = iter(lambda: reader(self.network_chunk_size), '')
         file = DiskFile(self.devices, device, partition, account, container,
                         obj, self.logger, disk_chunk_size=self.disk_chunk_size)
         orig_timestamp = file.metadata.get('X-Timestamp')
@@ -646,11 +781,10 @@ class ObjectController(object):
         elapsed_time = 0
         with file.mkstemp() as fd:
             try:
-                fallocate(fd, int(request.headers.get('content-length', 0)))
+                fallocate(fd, int(content_length or 0))
             except OSError:
                 return HTTPInsufficientStorage(drive=device, request=request)
-            reader = request.environ['wsgi.input'].read
-            for chunk in iter(lambda: reader(self.network_chunk_size), ''):
+            for chunk in data_source:
                 start_time = time.time()
                 upload_size += len(chunk)
                 if time.time() > upload_expiration:
@@ -672,8 +806,8 @@ class ObjectController(object):
                 self.logger.transfer_rate(
                     'PUT.' + device + '.timing', elapsed_time, upload_size)
 
-            if 'content-length' in request.headers and \
-                    int(request.headers['content-length']) != upload_size:
+            if content_length is not None and \
+                    int(content_length) != upload_size:
                 return HTTPClientDisconnect(request=request)
             etag = etag.hexdigest()
             if 'etag' in request.headers and \
@@ -852,6 +986,13 @@ class ObjectController(object):
                 not check_float(request.headers['x-timestamp']):
             return HTTPBadRequest(body='Missing timestamp', request=request,
                                   content_type='text/plain')
+        if 'x-container-shard' in request.headers:
+            try:
+                split_container_shard(request.headers['x-container-shard'],
+                                      account)
+            except ValueError, err:
+                return HTTPBadRequest(body=str(err), request=request,
+                                      content_type='text/plain')
         if self.mount_check and not check_mount(self.devices, device):
             return HTTPInsufficientStorage(drive=device, request=request)
         response_class = HTTPNoContent
@@ -30,7 +30,8 @@ from urllib import unquote
 from swift.common.utils import normalize_timestamp, public
 from swift.common.constraints import check_metadata, MAX_ACCOUNT_NAME_LENGTH
 from swift.common.http import is_success, HTTP_NOT_FOUND
-from swift.proxy.controllers.base import Controller, get_account_memcache_key
+from swift.proxy.controllers.base import Controller, \
+    get_account_memcache_key, info_cache
 from swift.common.swob import HTTPBadRequest, HTTPMethodNotAllowed, Request
 
 
@@ -96,8 +97,8 @@ class AccountController(Controller):
                    'Connection': 'close'}
         self.transfer_headers(req.headers, headers)
         if self.app.memcache:
-            self.app.memcache.delete(
-                get_account_memcache_key(self.account_name))
+            info_cache.delete(self.app.memcache,
+                              get_account_memcache_key(self.account_name))
         resp = self.make_requests(
             req, self.app.account_ring, account_partition, 'PUT',
             req.path_info, [headers] * len(accounts))
@@ -116,8 +117,8 @@ class AccountController(Controller):
                    'Connection': 'close'}
         self.transfer_headers(req.headers, headers)
         if self.app.memcache:
-            self.app.memcache.delete(
-                get_account_memcache_key(self.account_name))
+            info_cache.delete(self.app.memcache,
+                              get_account_memcache_key(self.account_name))
         resp = self.make_requests(
             req, self.app.account_ring, account_partition, 'POST',
             req.path_info, [headers] * len(accounts))
@@ -150,8 +151,8 @@ class AccountController(Controller):
                    'X-Trans-Id': self.trans_id,
                    'Connection': 'close'}
         if self.app.memcache:
-            self.app.memcache.delete(
-                get_account_memcache_key(self.account_name))
+            info_cache.delete(self.app.memcache,
+                              get_account_memcache_key(self.account_name))
         resp = self.make_requests(
             req, self.app.account_ring, account_partition, 'DELETE',
             req.path_info, [headers] * len(accounts))
@@ -27,14 +27,16 @@
 import time
 import functools
 import inspect
+import itertools
 
-from eventlet import spawn_n, GreenPile
+from eventlet import spawn, spawn_n, GreenPile
 from eventlet.queue import Queue, Empty, Full
+from eventlet.support.greenlets import GreenletExit
 from eventlet.timeout import Timeout
 
 from swift.common.wsgi import make_pre_authed_request
 from swift.common.utils import normalize_timestamp, config_true_value, \
-    public, split_path, cache_from_env
+    public, split_path, cache_from_env, json
 from swift.common.bufferedhttp import http_connect
 from swift.common.constraints import MAX_ACCOUNT_NAME_LENGTH
 from swift.common.exceptions import ChunkReadTimeout, ConnectionTimeout
@@ -58,7 +60,8 @@ def update_headers(response, headers):
         if name == 'etag':
             response.headers[name] = value.replace('"', '')
         elif name not in ('date', 'content-length', 'content-type',
-                          'connection', 'x-put-timestamp', 'x-delete-after'):
+                          'connection', 'x-put-timestamp', 'x-delete-after',
+                          'transfer-encoding'):
             response.headers[name] = value
 
 
@@ -97,6 +100,155 @@ def get_container_memcache_key(account, container):
     return 'container/%s/%s' % (account, container)
 
 
+def get_shard_points_memcache_key(account, container):
+    return 'shard_points/%s/%s' % (account, container)
+
+
+def get_dlo_listing_memcache_key(account, container, prefix):
+    return 'dlo_listing/%s/%s/%s' % (account, container, prefix)
+
+
+class InfoCache(object):
+    """
+    A small LRU cache in front of memcache for account and container info,
+    kept by each proxy worker. Hot accounts and containers are looked up for
+    nearly every request; within ttl seconds of having seen their info, a
+    worker answers from memory instead of asking memcache again. This
+    includes the info of accounts and containers that were not found.
+
+    The worker drops its entry when it changes the account or container
+    itself, but other workers and proxies may use their entries for up to
+    ttl seconds after a change; keep ttl short.
+
+    :param max_size: maximum number of entries; 0 disables the cache
+    :param ttl: number of seconds an entry is used for
+    """
+
+    def __init__(self, max_size=0, ttl=1):
+        self.configure(max_size, ttl)
+
+    def configure(self, max_size, ttl):
+        """
+        Sets the size and ttl of the cache, dropping all its entries.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = {}
+
+    def _store(self, key, value, ttl):
+        if not self.max_size or value is None:
+            return
+        now = time.time()
+        if len(self.entries) >= self.max_size and key not in self.entries:
+            for entry_key, entry in self.entries.items():
+                if entry[0] <= now:
+                    del self.entries[entry_key]
+            if len(self.entries) >= self.max_size:
+                # drops the least recently used quarter of the entries
+                lru = sorted(self.entries,
+                             key=lambda entry_key: self.entries[entry_key][2])
+                for entry_key in lru[:max(1, self.max_size / 4)]:
+                    del self.entries[entry_key]
+        if isinstance(value, dict):
+            value = dict(value)
+        self.entries[key] = [now + ttl, value, now]
+
+    def _lookup(self, key):
+        """
+        Looks a key up in memory.
+
+        :returns: tuple of (found, value)
+        """
+        if self.max_size:
+            entry = self.entries.get(key)
+            if entry:
+                now = time.time()
+                if entry[0] > now:
+                    entry[2] = now
+                    if isinstance(entry[1], dict):
+                        return True, dict(entry[1])
+                    return True, entry[1]
+                del self.entries[key]
+        return False, None
+
+    def get(self, memcache, key):
+        """
+        Gets the value for a key, from memory if possible.
+
+        :param memcache: the memcache client
+        :param key: the memcache key
+        :returns: the value, or None if there is none
+        """
+        found, value = self._lookup(key)
+        if found:
+            return value
+        value = memcache.get(key)
+        self._store(key, value, self.ttl)
+        return value
+
+    def peek(self, key):
+        """
+        Gets the value for a key if it is in memory, without asking memcache.
+
+        :param key: the memcache key
+        :returns: tuple of (found, value)
+        """
+        return self._lookup(key)
+
+    def get_many(self, memcache, keys):
+        """
+        Gets the values for several keys, from memory if possible. The keys
+        that are not in memory are fetched from memcache all at once.
+
+        :param memcache: the memcache client
+        :param keys: the memcache keys
+        :returns: list of the values, None for those there are none of
+        """
+        values = {}
+        missing = []
+        for key in keys:
+            found, value = self._lookup(key)
+            if found:
+                values[key] = value
+            else:
+                missing.append(key)
+        if missing:
+            if hasattr(memcache, 'get_many'):
+                fetched = memcache.get_many(missing)
+            else:
+                fetched = [memcache.get(key) for key in missing]
+            for key, value in zip(missing, fetched):
+                values[key] = value
+                self._store(key, value, self.ttl)
+        return [values[key] for key in keys]
+
+    def set(self, memcache, key, value, time=0):
+        """
+        Sets the value for a key in memcache and in memory.
+
+        :param memcache: the memcache client
+        :param key: the memcache key
+        :param value: the value
+        :param time: memcache expiry time
+        """
+        memcache.set(key, value, time=time)
+        self._store(key, value, min(self.ttl, time or self.ttl))
+
+    def delete(self, memcache, key):
+        """
+        Deletes a key from memcache and from memory.
+
+        :param memcache: the memcache client
+        :param key: the memcache key
+        """
+        self.entries.pop(key, None)
+        memcache.delete(key)
+
+
+# The info cache of this worker, configured by the proxy server's Application.
+info_cache = InfoCache()
+
+
 def headers_to_account_info(headers, status_int=HTTP_OK):
     """
     Construct a cacheable dict of account info based on response headers.
@@ -125,7 +277,9 @@ def headers_to_container_info(headers, status_int=HTTP_OK):
         'sync_key': headers.get('x-container-sync-key'),
         'object_count': headers.get('x-container-object-count'),
         'bytes': headers.get('x-container-bytes-used'),
+        'put_timestamp': headers.get('x-put-timestamp'),
         'versions': headers.get('x-versions-location'),
+        'shard_count': int(headers.get('x-container-shard-count') or 0),
         'cors': {
             'allow_origin': headers.get(
                 'x-container-meta-access-control-allow-origin'),
@@ -220,7 +374,7 @@ def get_container_info(env, app, swift_source=None):
     # to make a new request, it won't accidentally reuse the old container info
     env_key = 'swift.%s' % cache_key
     if env_key not in env:
-        container_info = cache.get(cache_key)
+        container_info = info_cache.get(cache, cache_key)
         if not container_info:
             resp = make_pre_authed_request(
                 env, 'HEAD', '/%s/%s/%s' % (version, account, container),
@@ -249,7 +403,7 @@ def get_account_info(env, app, swift_source=None):
     # to make a new request, it won't accidentally reuse the old account info
     env_key = 'swift.%s' % cache_key
     if env_key not in env:
-        account_info = cache.get(cache_key)
+        account_info = info_cache.get(cache, cache_key)
         if not account_info:
             resp = make_pre_authed_request(
                 env, 'HEAD', '/%s/%s' % (version, account),
@@ -272,6 +426,8 @@ class Controller(object):
         self.account_name = None
         self.app = app
         self.trans_id = '-'
+        # cached info fetched ahead of its lookup, by memcache key
+        self.prefetched_info = {}
         self.allowed_methods = set()
         all_methods = inspect.getmembers(self, predicate=inspect.ismethod)
         for name, m in all_methods:
@@ -301,8 +457,8 @@ class Controller(object):
 
         :param node: dictionary of node to increment the error count for
         """
-        node['errors'] = node.get('errors', 0) + 1
-        node['last_error'] = time.time()
+        errors, last_error = self.app.get_node_errors(node)
+        self.app.set_node_errors(node, (errors or 0) + 1, time.time())
 
     def error_occurred(self, node, msg):
         """
@@ -338,15 +494,14 @@ class Controller(object):
         :returns: True if error limited, False otherwise
         """
         now = time.time()
-        if 'errors' not in node:
+        errors, last_error = self.app.get_node_errors(node)
+        if not errors:
             return False
-        if 'last_error' in node and node['last_error'] < \
-                now - self.app.error_suppression_interval:
-            del node['last_error']
-            if 'errors' in node:
-                del node['errors']
+        if last_error is not None and \
+                last_error < now - self.app.error_suppression_interval:
+            self.app.set_node_errors(node, None, None)
             return False
-        limited = node['errors'] > self.app.error_suppression_limit
+        limited = errors > self.app.error_suppression_limit
         if limited:
             self.app.logger.debug(
                 _('Node error limited %(ip)s:%(port)s (%(device)s)'), node)
@@ -358,8 +513,8 @@ class Controller(object):
 
         :param node: dictionary of node to error limit
         """
-        node['errors'] = self.app.error_suppression_limit + 1
-        node['last_error'] = time.time()
+        self.app.set_node_errors(node, self.app.error_suppression_limit + 1,
+                                 time.time())
 
     def account_info(self, account, autocreate=False):
         """
@@ -378,7 +533,10 @@ class Controller(object):
         # 0 = no responses, 200 = found, 404 = not found, -1 = mixed responses
         if self.app.memcache:
             cache_key = get_account_memcache_key(account)
-            cache_value = self.app.memcache.get(cache_key)
+            if cache_key in self.prefetched_info:
+                cache_value = self.prefetched_info.pop(cache_key)
+            else:
+                cache_value = info_cache.get(self.app.memcache, cache_key)
             if not isinstance(cache_value, dict):
                 result_code = cache_value
                 container_count = 0
@@ -395,7 +553,7 @@ class Controller(object):
         result_code = 0
         attempts_left = len(nodes)
         path = '/%s' % account
-        headers = {'x-trans-id': self.trans_id, 'Connection': 'close'}
+        headers = {'x-trans-id': self.trans_id}
         iternodes = self.iter_nodes(partition, nodes, self.app.account_ring)
         while attempts_left > 0:
             try:
@@ -406,12 +564,14 @@ class Controller(object):
             try:
                 start_node_timing = time.time()
                 with ConnectionTimeout(self.app.conn_timeout):
-                    conn = http_connect(node['ip'], node['port'],
-                                        node['device'], partition, 'HEAD',
-                                        path, headers)
+                    conn = self._connect_node(node, partition, 'HEAD', path,
+                                              headers)
                 self.app.set_node_timing(node, time.time() - start_node_timing)
                 with Timeout(self.app.node_timeout):
+                    start_first_byte = time.time()
                     resp = conn.getresponse()
+                    self.app.set_node_first_byte_timing(
+                        node, time.time() - start_first_byte)
                     resp.read()
                     if is_success(resp.status):
                         result_code = HTTP_OK
@@ -452,9 +612,8 @@ class Controller(object):
             else:
                 cache_timeout = self.app.recheck_account_existence * 0.1
             account_info.update(status=result_code)
-            self.app.memcache.set(cache_key,
-                                  account_info,
-                                  time=cache_timeout)
+            info_cache.set(self.app.memcache, cache_key, account_info,
+                           time=cache_timeout)
         if result_code == HTTP_OK:
             try:
                 container_count = int(account_info['container_count'])
@@ -482,11 +641,23 @@ class Controller(object):
         container_info = {'status': 0, 'read_acl': None,
                           'write_acl': None, 'sync_key': None,
                           'count': None, 'bytes': None,
-                          'versions': None, 'partition': None,
-                          'nodes': None}
+                          'versions': None, 'shard_count': 0,
+                          'partition': None, 'nodes': None}
         if self.app.memcache:
             cache_key = get_container_memcache_key(account, container)
-            cache_value = self.app.memcache.get(cache_key)
+            account_cache_key = get_account_memcache_key(account)
+            found, cache_value = info_cache.peek(cache_key)
+            if not found:
+                # The account info is needed too if the container info isn't
+                # cached, so unless it is in memory it comes along in the
+                # same round trip to memcache; it is only kept for a miss.
+                keys = [cache_key]
+                if not info_cache.peek(account_cache_key)[0]:
+                    keys.append(account_cache_key)
+                values = info_cache.get_many(self.app.memcache, keys)
+                cache_value = values[0]
+                if len(values) > 1 and not isinstance(cache_value, dict):
+                    self.prefetched_info[account_cache_key] = values[1]
             if isinstance(cache_value, dict):
                 if 'container_size' in cache_value:
                     cache_value['count'] = cache_value['container_size']
@@ -495,20 +666,26 @@ class Controller(object):
                     container_info['partition'] = part
                     container_info['nodes'] = nodes
                 return container_info
-        if not self.account_info(account, autocreate=account_autocreate)[1]:
+        account_nodes = self.account_info(
+            account, autocreate=account_autocreate)[1]
+        # a later account_info call must not get this round's value
+        self.prefetched_info.clear()
+        if not account_nodes:
             return container_info
         attempts_left = len(nodes)
-        headers = {'x-trans-id': self.trans_id, 'Connection': 'close'}
+        headers = {'x-trans-id': self.trans_id}
         for node in self.iter_nodes(part, nodes, self.app.container_ring):
             try:
                 start_node_timing = time.time()
                 with ConnectionTimeout(self.app.conn_timeout):
-                    conn = http_connect(node['ip'], node['port'],
-                                        node['device'], part, 'HEAD',
-                                        path, headers)
+                    conn = self._connect_node(node, part, 'HEAD', path,
+                                              headers)
                 self.app.set_node_timing(node, time.time() - start_node_timing)
                 with Timeout(self.app.node_timeout):
+                    start_first_byte = time.time()
                     resp = conn.getresponse()
+                    self.app.set_node_first_byte_timing(
+                        node, time.time() - start_first_byte)
                     resp.read()
                 if is_success(resp.status):
                     container_info.update(
@@ -529,18 +706,99 @@ class Controller(object):
                 break
         if self.app.memcache:
             if container_info['status'] == HTTP_OK:
-                self.app.memcache.set(
-                    cache_key, container_info,
+                info_cache.set(
+                    self.app.memcache, cache_key, container_info,
                     time=self.app.recheck_container_existence)
             elif container_info['status'] == HTTP_NOT_FOUND:
-                self.app.memcache.set(
-                    cache_key, container_info,
+                info_cache.set(
+                    self.app.memcache, cache_key, container_info,
                     time=self.app.recheck_container_existence * 0.1)
         if container_info['status'] == HTTP_OK:
             container_info['partition'] = part
             container_info['nodes'] = nodes
         return container_info
 
+    def shard_points(self, account, container):
+        """
+        Get the shard points of a sharded container: the sorted names bounding
+        its shard ranges, as found by swift.common.utils.find_shard.
+
+        :param account: account name for the container
+        :param container: container name to look up
+        :returns: list of shard points, empty if the container is not
+                  sharded, or None if no container server could be reached
+        """
+        if self.app.memcache:
+            cache_key = get_shard_points_memcache_key(account, container)
+            shard_points = self.app.memcache.get(cache_key)
+            if isinstance(shard_points, list):
+                return [p.encode('utf-8') if isinstance(p, unicode) else p
+                        for p in shard_points]
+        part, nodes = self.app.container_ring.get_nodes(account, container)
+        path = '/%s/%s' % (account, container)
+        headers = {'x-trans-id': self.trans_id,
+                   'X-Container-Get-Shard-Points': 'true'}
+        shard_points = None
+        attempts_left = len(nodes)
+        for node in self.iter_nodes(part, nodes, self.app.container_ring):
+            try:
+                with ConnectionTimeout(self.app.conn_timeout):
+                    conn = self._connect_node(node, part, 'GET', path,
+                                              headers)
+                with Timeout(self.app.node_timeout):
+                    resp = conn.getresponse()
+                    body = resp.read()
+                if is_success(resp.status):
+                    shard_points = json.loads(body)
+                    # A replica that has not yet been told about the sharding
+                    # answers with no points; keep looking for one that has.
+                    if shard_points:
+                        break
+                elif resp.status == HTTP_INSUFFICIENT_STORAGE:
+                    self.error_limit(node)
+            except (Exception, Timeout):
+                self.exception_occurred(
+                    node, _('Container'),
+                    _('Trying to get shard points for %s') % path)
+            attempts_left -= 1
+            if attempts_left <= 0:
+                break
+        if self.app.memcache and shard_points is not None:
+            self.app.memcache.set(cache_key, shard_points,
+                                  time=self.app.recheck_container_existence)
+        if shard_points is None:
+            return None
+        return [p.encode('utf-8') if isinstance(p, unicode) else p
+                for p in shard_points]
+
+    def _connect_node(self, node, part, method, path, headers,
+                      query_string=None):
+        """
+        Opens a connection to a node for a backend request whose response is
+        read to its end.  With backend_keepalive on, the connection is taken
+        from and given back to the proxy's pool of kept-alive connections;
+        otherwise the backend is asked to close it after the response.
+
+        :param node: node dict to connect to
+        :param part: partition of the request
+        :param method: HTTP method of the request
+        :param path: path of the request
+        :param headers: headers of the request
+        :param query_string: query string of the request
+        :returns: HTTPConnection object
+        """
+        headers = dict(headers.iteritems())
+        if self.app.backend_pool:
+            headers.pop('Connection', None)
+            return http_connect(node['ip'], node['port'], node['device'],
+                                part, method, path, headers=headers,
+                                query_string=query_string,
+                                pool=self.app.backend_pool)
+        headers['Connection'] = 'close'
+        return http_connect(node['ip'], node['port'], node['device'], part,
+                            method, path, headers=headers,
+                            query_string=query_string)
+
     def iter_nodes(self, partition, nodes, ring):
         """
         Node iterator that will first iterate over the normal nodes for a
@@ -572,13 +830,15 @@ class Controller(object):
             try:
                 start_node_timing = time.time()
                 with ConnectionTimeout(self.app.conn_timeout):
-                    conn = http_connect(node['ip'], node['port'],
-                                        node['device'], part, method, path,
-                                        headers=headers, query_string=query)
+                    conn = self._connect_node(node, part, method, path,
+                                              headers, query_string=query)
                     conn.node = node
                 self.app.set_node_timing(node, time.time() - start_node_timing)
                 with Timeout(self.app.node_timeout):
+                    start_first_byte = time.time()
                     resp = conn.getresponse()
+                    self.app.set_node_first_byte_timing(
+                        node, time.time() - start_first_byte)
                     if not is_informational(resp.status) and \
                             not is_server_error(resp.status):
                         return resp.status, resp.reason, resp.read()
@@ -755,6 +1015,112 @@ class Controller(object):
         """
         return is_success(src.status) or is_redirection(src.status)
 
+    def _get_source(self, node, req, server_type, partition, path):
+        """
+        Sends a GET or HEAD request to one node.
+
+        :param node: node dict to send the request to
+        :param req: swob.Request object
+        :param server_type: server type
+        :param partition: partition
+        :param path: path for the request
+        :returns: httplib response object, or None if the node did not
+                  answer
+        """
+        conn = None
+        start_node_timing = time.time()
+        try:
+            with ConnectionTimeout(self.app.conn_timeout):
+                conn = self._connect_node(
+                    node, partition, req.method, path, req.headers,
+                    query_string=req.query_string)
+            self.app.set_node_timing(node, time.time() - start_node_timing)
+            with Timeout(self.app.node_timeout):
+                start_first_byte = time.time()
+                possible_source = conn.getresponse()
+                self.app.set_node_first_byte_timing(
+                    node, time.time() - start_first_byte)
+                # See NOTE: swift_conn at top of file about this.
+                possible_source.swift_conn = conn
+            return possible_source
+        except GreenletExit:
+            # a hedged request that lost the race
+            if conn:
+                conn.close()
+            raise
+        except (Exception, Timeout):
+            self.exception_occurred(
+                node, server_type, _('Trying to %(method)s %(path)s') %
+                {'method': req.method, 'path': req.path})
+
+    def _iter_sources(self, req, server_type, partition, nodes, path):
+        """
+        Sends a GET or HEAD request to one node after another, yielding
+        (node, response) for each node that answered.
+        """
+        for node in nodes:
+            if self.error_limited(node):
+                continue
+            possible_source = self._get_source(node, req, server_type,
+                                               partition, path)
+            if possible_source is not None:
+                yield node, possible_source
+
+    def _iter_hedged_sources(self, req, server_type, partition, nodes, path,
+                             attempts):
+        """
+        Like _iter_sources, but whenever no node answered within
+        hedged_read_delay seconds, the request is also sent to the next node
+        (for as long as fewer than attempts requests are answered or in
+        flight), and responses are yielded in the order they arrive.
+        Requests still in flight when the generator is closed are killed and
+        responses nobody asked for are closed.
+        """
+        nodes = iter(nodes)
+        results = Queue()
+        pending = {}
+        started = itertools.count()
+        answered = [0]
+
+        def get_source(index, node):
+            possible_source = self._get_source(node, req, server_type,
+                                               partition, path)
+            results.put((index, node, possible_source))
+
+        def start_next():
+            if answered[0] + len(pending) >= attempts:
+                return False
+            for node in nodes:
+                if not self.error_limited(node):
+                    index = started.next()
+                    pending[index] = spawn(get_source, index, node)
+                    return True
+            return False
+
+        try:
+            start_next()
+            while pending:
+                try:
+                    index, node, possible_source = \
+                        results.get(timeout=self.app.hedged_read_delay)
+                except Empty:
+                    if start_next():
+                        self.app.logger.increment('hedged_reads')
+                    continue
+                del pending[index]
+                if possible_source is not None:
+                    answered[0] += 1
+                    yield node, possible_source
+                if possible_source is None or not pending:
+                    start_next()
+        finally:
+            for greenthread in pending.values():
+                greenthread.kill()
+            while not results.empty():
+                index, node, possible_source = results.get_nowait()
+                if possible_source is not None:
+                    self.close_swift_conn(possible_source)
+
     def GETorHEAD_base(self, req, server_type, partition, nodes, path,
                        attempts):
         """
@@ -773,33 +1139,14 @@ class Controller(object):
         bodies = []
         sources = []
         newest = config_true_value(req.headers.get('x-newest', 'f'))
-        nodes = iter(nodes)
-        while len(statuses) < attempts:
-            try:
-                node = nodes.next()
-            except StopIteration:
-                break
-            if self.error_limited(node):
-                continue
-            start_node_timing = time.time()
-            try:
-                with ConnectionTimeout(self.app.conn_timeout):
-                    headers = dict(req.headers)
-                    headers['Connection'] = 'close'
-                    conn = http_connect(
-                        node['ip'], node['port'], node['device'], partition,
-                        req.method, path, headers=headers,
-                        query_string=req.query_string)
-                self.app.set_node_timing(node, time.time() - start_node_timing)
-                with Timeout(self.app.node_timeout):
-                    possible_source = conn.getresponse()
-                    # See NOTE: swift_conn at top of file about this.
-                    possible_source.swift_conn = conn
-            except (Exception, Timeout):
-                self.exception_occurred(
-                    node, server_type, _('Trying to %(method)s %(path)s') %
-                    {'method': req.method, 'path': req.path})
-                continue
+        if self.app.hedged_read_delay and not newest:
+            source_iter = self._iter_hedged_sources(
+                req, server_type, partition, nodes, path, attempts)
+        else:
+            source_iter = self._iter_sources(
+                req, server_type, partition, nodes, path)
+        node = None
+        for node, possible_source in source_iter:
             if self.is_good_source(possible_source):
                 # 404 if we know we don't have a synced copy
                 if not float(possible_source.getheader('X-PUT-Timestamp', 1)):
@@ -826,6 +1173,10 @@ class Controller(object):
                                         {'status': possible_source.status,
                                          'body': bodies[-1][:1024],
                                          'type': server_type})
+            if len(statuses) >= attempts:
+                break
+        # stops any hedged requests still in flight
+        source_iter.close()
         if sources:
             sources.sort(key=source_key)
             source = sources.pop()
@@ -837,6 +1188,9 @@ class Controller(object):
                 res.app_iter = self._make_app_iter(node, source)
                 # See NOTE: swift_conn at top of file about this.
                 res.swift_conn = source.swift_conn
+            elif req.method == 'HEAD':
+                # lets a kept-alive connection go back to the pool
+                source.read()
             res.status = source.status
             update_headers(res, source.getheaders())
             if not res.environ:
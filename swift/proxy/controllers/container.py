@@ -25,15 +25,24 @@
 # collected. We've seen objects hang around forever otherwise.
 
 import time
-from urllib import unquote
+from urllib import unquote, quote, urlencode
+from xml.sax import saxutils
 
-from swift.common.utils import normalize_timestamp, public, csv_append
-from swift.common.constraints import check_metadata, MAX_CONTAINER_NAME_LENGTH
-from swift.common.http import HTTP_ACCEPTED
+from swift.common.utils import normalize_timestamp, public, csv_append, \
+    get_param, json, get_shard_account, get_shard_container
+from swift.common.constraints import check_metadata, \
+    MAX_CONTAINER_NAME_LENGTH, CONTAINER_LISTING_LIMIT, FORMAT2CONTENT_TYPE
+from swift.common.http import HTTP_ACCEPTED, HTTP_OK, HTTP_NO_CONTENT, \
+    is_success
 from swift.proxy.controllers.base import Controller, delay_denial, \
-    get_container_memcache_key, headers_to_container_info, cors_validation
+    get_container_memcache_key, headers_to_container_info, cors_validation, \
+    info_cache
 from swift.common.swob import HTTPBadRequest, HTTPForbidden, \
-    HTTPNotFound
+    HTTPNotFound, HTTPServiceUnavailable, Request
+
+
+def _listing_key(row):
+    return row.get('name', row.get('subdir'))
 
 
 class ContainerController(Controller):
@@ -69,14 +78,30 @@ class ContainerController(Controller):
         part, nodes = self.app.container_ring.get_nodes(
             self.account_name, self.container_name)
         nodes = self.app.sort_nodes(nodes)
+        for header in ('x-container-get-shard-points',
+                       'x-container-list-deleted'):
+            if header in req.headers:
+                del req.headers[header]
+        backend_req = req
+        root_in_json = req.method == 'GET' and self._known_sharded()
+        if root_in_json:
+            # The listing of a sharded container is merged with those of its
+            # shards and formatted at the end, so it is fetched in JSON, with
+            # the deleted objects needed to tell which rows are newest.
+            backend_req = Request(dict(
+                req.environ, QUERY_STRING=urlencode(
+                    dict(req.params, format='json'))))
+            backend_req.headers['X-Container-List-Deleted'] = 'true'
         resp = self.GETorHEAD_base(
-            req, _('Container'), part, nodes, req.path_info, len(nodes))
+            backend_req, _('Container'), part, nodes, req.path_info,
+            len(nodes))
+        resp.request = req
         if self.app.memcache:
             # set the memcache container size for ratelimiting
             cache_key = get_container_memcache_key(self.account_name,
                                                    self.container_name)
-            self.app.memcache.set(
-                cache_key,
+            info_cache.set(
+                self.app.memcache, cache_key,
                 headers_to_container_info(resp.headers, resp.status_int),
                 time=self.app.recheck_container_existence)
 
@@ -90,8 +115,197 @@ class ContainerController(Controller):
                         'x-container-sync-key', 'x-container-sync-to'):
                 if key in resp.headers:
                     del resp.headers[key]
+        if req.method == 'GET' and is_success(resp.status_int):
+            if resp.headers.get('x-container-shard-count'):
+                resp = self._sharded_listing(req, resp, root_in_json)
+            elif root_in_json:
+                # no longer sharded, as far as this replica knows
+                self._format_listing(req, resp, json.loads(resp.body))
         return resp
 
+    def _known_sharded(self):
+        """
+        Tells whether the cached info of the container says it is sharded.
+        """
+        if not self.app.memcache:
+            return False
+        info = info_cache.get(self.app.memcache, get_container_memcache_key(
+            self.account_name, self.container_name))
+        return isinstance(info, dict) and bool(info.get('shard_count'))
+
+    def _get_listing(self, req, account, container, params):
+        """
+        Fetch one page of a container's listing in JSON, including the
+        deleted objects among its entries.
+
+        :param req: the client's swob.Request
+        :param account: account name of the container
+        :param container: container name
+        :param params: dict of listing query parameters
+        :returns: list of listing dicts, or None if it could not be fetched
+        """
+        part, nodes = self.app.container_ring.get_nodes(account, container)
+        nodes = self.app.sort_nodes(nodes)
+        path = '/%s/%s' % (account, container)
+        sub_req = Request.blank(
+            quote(path), headers=dict(req.headers),
+            environ={'REQUEST_METHOD': 'GET',
+                     'QUERY_STRING': urlencode(dict(params, format='json'))})
+        sub_req.headers['X-Container-List-Deleted'] = 'true'
+        resp = self.GETorHEAD_base(
+            sub_req, _('Container'), part, nodes, path, len(nodes))
+        if not is_success(resp.status_int):
+            return None
+        return json.loads(resp.body)
+
+    def _sharded_listing(self, req, resp, root_in_json=False):
+        """
+        Replace the body of a sharded container's listing with the listing
+        stitched together from its shard containers and any rows the root
+        container has not yet handed over to them.  Where the root and a
+        shard both have a row for a name, the newest one counts, and names
+        whose newest row is a deleted object are left out.
+
+        :param req: the client's swob.Request
+        :param resp: the root container's GET response
+        :param root_in_json: True if resp is the root's listing in JSON,
+                             deleted objects included
+        :returns: swob.Response
+        """
+        shard_points = self.shard_points(self.account_name,
+                                         self.container_name)
+        if shard_points is None:
+            return HTTPServiceUnavailable(request=req)
+        params = {}
+        for key in ('marker', 'end_marker', 'prefix', 'delimiter', 'path'):
+            value = get_param(req, key)
+            if value is not None:
+                params[key] = value
+        limit = CONTAINER_LISTING_LIMIT
+        given_limit = get_param(req, 'limit')
+        if given_limit and given_limit.isdigit():
+            # the root container has already refused limits that are too big
+            limit = int(given_limit)
+        params['limit'] = limit
+        if root_in_json and resp.status_int == HTTP_OK:
+            root_listing = json.loads(resp.body)
+        else:
+            # Read out the root's listing; it is fetched again in JSON.
+            resp.body
+            root_listing = self._get_listing(
+                req, self.account_name, self.container_name, params)
+            if root_listing is None:
+                return HTTPServiceUnavailable(request=req)
+
+        marker = params.get('marker')
+        end_marker = params.get('end_marker')
+        prefix = params.get('prefix') or params.get('path')
+        shard_listing = []
+        shard_count = 0
+        for index in xrange(len(shard_points) + 1):
+            lower = shard_points[index - 1] if index else None
+            upper = shard_points[index] if index < len(shard_points) else None
+            if upper is not None and (marker and upper <= marker or
+                                      prefix and upper < prefix):
+                continue
+            if lower is not None and (
+                    end_marker and lower >= end_marker or
+                    prefix and lower > prefix and
+                    not lower.startswith(prefix)):
+                break
+            shard_params = dict(params, limit=limit - shard_count)
+            if shard_listing:
+                # Also keeps a subdir spanning two shards from being listed
+                # twice; the container server skips a subdir equal to marker.
+                shard_params['marker'] = \
+                    _listing_key(shard_listing[-1]).encode('utf-8')
+            rows = self._get_listing(
+                req, get_shard_account(self.account_name),
+                get_shard_container(self.account_name, self.container_name,
+                                    index),
+                shard_params)
+            if rows is None:
+                return HTTPServiceUnavailable(request=req)
+            shard_listing.extend(rows)
+            shard_count += sum(1 for row in rows if not row.get('deleted'))
+            if shard_count >= limit:
+                break
+
+        # Deleted objects are only listed up to the last entry of a full
+        # page; beyond that, which of the root and shard rows is newest isn't
+        # known, so names past the end of either full page are left for the
+        # next page.
+        ends = [_listing_key(rows[-1]) for rows, count in (
+            (root_listing, sum(1 for row in root_listing
+                               if not row.get('deleted'))),
+            (shard_listing, shard_count)) if count >= limit]
+        merged = {}
+        for row in root_listing + shard_listing:
+            key = _listing_key(row)
+            if key not in merged or row.get('last_modified', '') > \
+                    merged[key].get('last_modified', ''):
+                merged[key] = row
+        listing = [merged[key] for key in sorted(merged)
+                   if not merged[key].get('deleted') and
+                   (not ends or key <= min(ends))][:limit]
+        return self._format_listing(req, resp, listing)
+
+    def _format_listing(self, req, resp, listing):
+        """
+        Replace the body of a container's GET response with the given
+        listing, in the format the client asked for.
+
+        :param req: the client's swob.Request
+        :param resp: the container's GET response
+        :param listing: list of listing dicts; deleted objects are left out
+        :returns: swob.Response
+        """
+        listing = [row for row in listing if not row.get('deleted')]
+        query_format = get_param(req, 'format')
+        if query_format:
+            req.accept = FORMAT2CONTENT_TYPE.get(query_format.lower(),
+                                                 FORMAT2CONTENT_TYPE['plain'])
+        out_content_type = req.accept.best_match(
+            ['text/plain', 'application/json', 'application/xml', 'text/xml'])
+        if out_content_type == 'application/json':
+            resp.body = json.dumps(listing)
+        elif out_content_type.endswith('/xml'):
+            resp.body = self._xml_listing(listing)
+        elif listing:
+            resp.body = ''.join('%s\n' % _listing_key(row).encode('utf-8')
+                                for row in listing)
+        else:
+            resp.body = ''
+        resp.status = HTTP_OK if resp.body else HTTP_NO_CONTENT
+        resp.content_type = out_content_type
+        resp.charset = 'utf-8'
+        return resp
+
+    def _xml_listing(self, listing):
+        """
+        Serializes listing dicts the way the container server does.
+
+        :param listing: list of listing dicts
+        """
+        output = ['<?xml version="1.0" encoding="UTF-8"?>\n<container name=%s>'
+                  % saxutils.quoteattr(self.container_name)]
+        for row in listing:
+            if 'subdir' in row:
+                name = saxutils.escape(row['subdir'].encode('utf-8'))
+                output.append('<subdir name="%s"><name>%s</name></subdir>' %
+                              (name, name))
+            else:
+                output.append(
+                    '<object><name>%s</name><hash>%s</hash>'
+                    '<bytes>%d</bytes><content_type>%s</content_type>'
+                    '<last_modified>%s</last_modified></object>' % (
+                        saxutils.escape(row['name'].encode('utf-8')),
+                        row['hash'], row['bytes'],
+                        saxutils.escape(row['content_type'].encode('utf-8')),
+                        row['last_modified']))
+        output.append('</container>')
+        return ''.join(output)
+
     @public
     @delay_denial
     @cors_validation
@@ -138,7 +352,7 @@ class ContainerController(Controller):
         if self.app.memcache:
             cache_key = get_container_memcache_key(self.account_name,
                                                    self.container_name)
-            self.app.memcache.delete(cache_key)
+            info_cache.delete(self.app.memcache, cache_key)
         resp = self.make_requests(
             req, self.app.container_ring,
             container_partition, 'PUT', req.path_info, headers)
@@ -164,7 +378,7 @@ class ContainerController(Controller):
                    'Connection': 'close'}
         self.transfer_headers(req.headers, headers)
         if self.app.memcache:
-            self.app.memcache.delete(get_container_memcache_key(
+            info_cache.delete(self.app.memcache, get_container_memcache_key(
                 self.account_name, self.container_name))
         resp = self.make_requests(
             req, self.app.container_ring, container_partition, 'POST',
@@ -186,7 +400,7 @@ class ContainerController(Controller):
         if self.app.memcache:
             cache_key = get_container_memcache_key(self.account_name,
                                                    self.container_name)
-            self.app.memcache.delete(cache_key)
+            info_cache.delete(self.app.memcache, cache_key)
         resp = self.make_requests(
             req, self.app.container_ring, container_partition, 'DELETE',
             req.path_info, headers)
@@ -197,13 +411,11 @@ class ContainerController(Controller):
 
     def _backend_requests(self, req, n_outgoing,
                           account_partition, accounts):
-        headers = [{'Connection': 'close',
-                    'X-Timestamp': normalize_timestamp(time.time()),
-                    'x-trans-id': self.trans_id}
-                   for _junk in range(n_outgoing)]
-
-        for header in headers:
-            self.transfer_headers(req.headers, header)
+        base_headers = {'Connection': 'close',
+                        'X-Timestamp': normalize_timestamp(time.time()),
+                        'x-trans-id': self.trans_id}
+        self.transfer_headers(req.headers, base_headers)
+        headers = [dict(base_headers) for _junk in range(n_outgoing)]
 
         for i, account in enumerate(accounts):
             i = i % len(headers)
@@ -32,12 +32,13 @@ from datetime import datetime
 from urllib import unquote, quote
 from hashlib import md5
 
-from eventlet import sleep, GreenPile
+from eventlet import sleep, spawn, GreenPile
 from eventlet.queue import Queue
 from eventlet.timeout import Timeout
 
 from swift.common.utils import ContextPool, normalize_timestamp, \
-    config_true_value, public, json, csv_append
+    config_true_value, public, json, csv_append, get_shard_account, \
+    get_shard_container, find_shard, time_stage
 from swift.common.bufferedhttp import http_connect
 from swift.common.constraints import check_metadata, check_object_creation, \
     CONTAINER_LISTING_LIMIT, MAX_FILE_SIZE
@@ -49,7 +50,7 @@ from swift.common.http import is_success, is_client_error, HTTP_CONTINUE, \
     HTTP_INTERNAL_SERVER_ERROR, HTTP_SERVICE_UNAVAILABLE, \
     HTTP_INSUFFICIENT_STORAGE, HTTP_OK
 from swift.proxy.controllers.base import Controller, delay_denial, \
-    cors_validation
+    cors_validation, get_dlo_listing_memcache_key
 from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPNotFound, \
     HTTPPreconditionFailed, HTTPRequestEntityTooLarge, HTTPRequestTimeout, \
     HTTPServerError, HTTPServiceUnavailable, Request, Response, \
@@ -65,6 +66,18 @@ def segment_listing_iter(listing):
         yield seg_dict
 
 
+def segment_container_version(container_info):
+    """
+    Returns what is compared to tell whether a cached DLO segment listing is
+    still that of the segment container: its object count, bytes used and
+    put timestamp.
+
+    :param container_info: the container info of the segment container
+    """
+    return [container_info.get('object_count'), container_info.get('bytes'),
+            container_info.get('put_timestamp')]
+
+
 def copy_headers_into(from_r, to_r):
     """
     Will copy desired headers from from_r to to_r
@@ -103,11 +116,15 @@ class SegmentedIterable(object):
                     'bytes' keys.
     :param response: The swob.Response this iterable is associated with, if
                      any (default: None)
+    :param listing_cache_key: The memcache key the listing is cached under,
+                              if any. The cached listing is dropped when a
+                              segment is found to no longer match its size.
     """
 
     def __init__(self, controller, container, listing, response=None,
-                 is_slo=False):
+                 is_slo=False, listing_cache_key=None):
         self.controller = controller
+        self.listing_cache_key = listing_cache_key
         self.container = container
         self.listing = segment_listing_iter(listing)
         self.is_slo = is_slo
@@ -123,6 +140,107 @@ class SegmentedIterable(object):
         if not self.response:
             self.response = Response()
         self.next_get_time = 0
+        # segment dicts with the greenthreads getting them, read ahead of the
+        # current segment
+        self.prefetched = []
+        # offset of the segment to be requested next and the end of the range
+        # being served, if any
+        self.prefetch_position = 0
+        self.range_stop = None
+
+    def _rate_limit(self, wait=True):
+        """
+        Applies the segment rate limit to the next segment request.
+
+        :param wait: if False, returns False instead of sleeping when the
+                     request would have to wait
+        :returns: True if the request may be made now
+        """
+        if not self.is_slo and self.ratelimit_index >= \
+                self.controller.app.rate_limit_after_segment:
+            if not wait and self.next_get_time > time.time():
+                return False
+            sleep(max(self.next_get_time - time.time(), 0))
+        self.ratelimit_index += 1
+        self.next_get_time = time.time() + \
+            1.0 / self.controller.app.rate_limit_segments_per_sec
+        return True
+
+    def _take_segment_dict(self):
+        segment_dict = self.segment_peek or self.listing.next()
+        self.segment_peek = None
+        if self.range_stop is not None:
+            self.prefetch_position += segment_dict['bytes']
+        return segment_dict
+
+    def _get_segment(self, segment_dict, seek):
+        """
+        Makes the GET request for an object segment.
+
+        :param segment_dict: the segment's listing entry
+        :param seek: offset to start reading the segment at
+        :returns: tuple of (path, response)
+        """
+        if self.container is None:
+            container, obj = segment_dict['name'].lstrip('/').split('/', 1)
+        else:
+            container, obj = self.container, segment_dict['name']
+        partition, nodes = self.controller.app.object_ring.get_nodes(
+            self.controller.account_name, container, obj)
+        path = '/%s/%s/%s' % (self.controller.account_name, container, obj)
+        req = Request.blank(path)
+        if seek:
+            req.range = 'bytes=%s-' % seek
+        nodes = self.controller.app.sort_nodes(nodes)
+        resp = self.controller.GETorHEAD_base(
+            req, _('Object'), partition,
+            self.controller.iter_nodes(partition, nodes,
+                                       self.controller.app.object_ring),
+            path, len(nodes))
+        return path, resp
+
+    def _prefetch_segments(self):
+        """
+        Starts getting the segments following the current one, up to
+        segment_read_ahead of them, so they are ready to be streamed when the
+        current one ends. Requests are only started as far as the rate limit
+        allows without waiting, and not for segments past the end of the range
+        being served. A prefetched segment's response body is not read until
+        its turn, so the read ahead costs a backend connection per segment
+        rather than memory.
+        """
+        while len(self.prefetched) < self.controller.app.segment_read_ahead:
+            if self.range_stop is not None and \
+                    self.prefetch_position >= self.range_stop:
+                return
+            if not self.segment_peek:
+                try:
+                    self.segment_peek = self.listing.next()
+                except StopIteration:
+                    return
+            if not self._rate_limit(wait=False):
+                return
+            segment_dict = self._take_segment_dict()
+            self.prefetched.append(
+                (segment_dict, spawn(self._get_segment, segment_dict, 0)))
+
+    def _close_prefetched(self):
+        """
+        Drops the segments read ahead, closing their backend connections.
+        """
+        prefetched, self.prefetched = self.prefetched, []
+        for segment_dict, getter in prefetched:
+            if not getter.dead:
+                getter.kill()
+                continue
+            try:
+                path, resp = getter.wait()
+                if getattr(resp, 'swift_conn', None):
+                    resp.swift_conn.close()
+                if hasattr(resp.app_iter, 'close'):
+                    resp.app_iter.close()
+            except (Exception, Timeout):
+                pass
 
     def _load_next_segment(self):
         """
@@ -132,32 +250,19 @@ class SegmentedIterable(object):
                  segment no longer matches SLO manifest specifications.
         """
         try:
-            self.ratelimit_index += 1
-            self.segment_dict = self.segment_peek or self.listing.next()
-            self.segment_peek = None
-            if self.container is None:
-                container, obj = \
-                    self.segment_dict['name'].lstrip('/').split('/', 1)
+            seek, self.seek = self.seek, 0
+            if self.prefetched:
+                self.segment_dict, getter = self.prefetched.pop(0)
+                path, resp = getter.wait()
+                seek = 0
             else:
-                container, obj = self.container, self.segment_dict['name']
-            partition, nodes = self.controller.app.object_ring.get_nodes(
-                self.controller.account_name, container, obj)
-            path = '/%s/%s/%s' % (self.controller.account_name, container, obj)
-            req = Request.blank(path)
-            if self.seek:
-                req.range = 'bytes=%s-' % self.seek
-                self.seek = 0
-            if not self.is_slo and self.ratelimit_index > \
-                    self.controller.app.rate_limit_after_segment:
-                sleep(max(self.next_get_time - time.time(), 0))
-            self.next_get_time = time.time() + \
-                1.0 / self.controller.app.rate_limit_segments_per_sec
-            nodes = self.controller.app.sort_nodes(nodes)
-            resp = self.controller.GETorHEAD_base(
-                req, _('Object'), partition,
-                self.controller.iter_nodes(partition, nodes,
-                                           self.controller.app.object_ring),
-                path, len(nodes))
+                self.segment_dict = self._take_segment_dict()
+                self._rate_limit()
+                path, resp = self._get_segment(self.segment_dict, seek)
+            self._prefetch_segments()
+            if self.listing_cache_key and not is_success(resp.status_int):
+                # the segment may be gone; don't serve the same listing again
+                self.controller.app.memcache.delete(self.listing_cache_key)
             if self.is_slo and resp.status_int == HTTP_NOT_FOUND:
                 raise SloSegmentError(_(
                     'Could not load object segment %(path)s:'
@@ -173,6 +278,15 @@ class SegmentedIterable(object):
                         '%(path)s etag: %(r_etag)s != %(s_etag)s.' %
                         {'path': path, 'r_etag': resp.etag,
                          's_etag': self.segment_dict['hash']}))
+            if self.listing_cache_key and 'bytes' in self.segment_dict and \
+                    resp.content_length is not None and \
+                    resp.content_length != self.segment_dict['bytes'] - seek:
+                self.controller.app.memcache.delete(self.listing_cache_key)
+                raise Exception(_(
+                    'Object segment %(path)s changed size: %(size)s != '
+                    '%(l_size)s') % {'path': path,
+                                     'size': resp.content_length + seek,
+                                     'l_size': self.segment_dict['bytes']})
             self.segment_iter = resp.app_iter
             # See NOTE: swift_conn at top of file about this.
             self.segment_iter_swift_conn = getattr(resp, 'swift_conn', None)
@@ -231,6 +345,7 @@ class SegmentedIterable(object):
                      'obj': self.controller.object_name})
                 err.swift_logged = True
                 self.response.status_int = HTTP_SERVICE_UNAVAILABLE
+            self._close_prefetched()
             raise
 
     def app_iter_range(self, start, stop):
@@ -249,8 +364,10 @@ class SegmentedIterable(object):
                     self.position += self.segment_peek['bytes']
                     self.segment_peek = self.listing.next()
                 self.seek = start - self.position
+                self.prefetch_position = self.position
             else:
                 start = 0
+            self.range_stop = stop
             if stop is not None:
                 length = stop - start
             else:
@@ -290,6 +407,11 @@ class SegmentedIterable(object):
                 err.swift_logged = True
                 self.response.status_int = HTTP_SERVICE_UNAVAILABLE
             raise
+        finally:
+            self._close_prefetched()
+
+    def close(self):
+        self._close_prefetched()
 
 
 class ObjectController(Controller):
@@ -342,6 +464,40 @@ class ObjectController(Controller):
             marker = sublisting[-1]['name'].encode('utf-8')
             yield sublisting
 
+    def _get_cached_listing(self, cache_key, lcontainer, linfo,
+                            manifest_resp, env):
+        """
+        Returns the segment listing of a DLO manifest from memcache, if it
+        was cached for the same version of the manifest and the segment
+        container still has the same object count, bytes used and put
+        timestamp.
+
+        :param cache_key: memcache key of the listing
+        :param lcontainer: the container holding the segments
+        :param linfo: the container info of lcontainer
+        :param manifest_resp: the response for the manifest
+        :param env: the environment of the request
+        :returns: the listing, or None if there is none to use
+        :raises ListingIterNotAuthorized: if the request may not read the
+                                          segment container
+        """
+        cached = self.app.memcache.get(cache_key)
+        if not isinstance(cached, dict) or cached.get('timestamp') != \
+                manifest_resp.headers.get('x-timestamp') or \
+                cached.get('container') != segment_container_version(linfo):
+            return None
+        if 'swift.authorize' in env:
+            lreq = Request.blank('i will be overridden by env', environ=env)
+            # Don't quote PATH_INFO, by WSGI spec
+            lreq.environ['PATH_INFO'] = \
+                '/%s/%s' % (self.account_name, lcontainer)
+            lreq.environ['REQUEST_METHOD'] = 'GET'
+            lreq.acl = linfo['read_acl']
+            aresp = env['swift.authorize'](lreq)
+            if aresp:
+                raise ListingIterNotAuthorized(aresp)
+        return cached['listing']
+
     def _remaining_items(self, listing_iter):
         """
         Returns an item-by-item iterator for a page-by-page iterator
@@ -377,21 +533,24 @@ class ObjectController(Controller):
 
     def GETorHEAD(self, req):
         """Handle HTTP GET or HEAD requests."""
-        container_info = self.container_info(self.account_name,
-                                             self.container_name)
+        with time_stage(req.environ, 'container_info'):
+            container_info = self.container_info(self.account_name,
+                                                 self.container_name)
         req.acl = container_info['read_acl']
         if 'swift.authorize' in req.environ:
-            aresp = req.environ['swift.authorize'](req)
+            with time_stage(req.environ, 'authorize'):
+                aresp = req.environ['swift.authorize'](req)
             if aresp:
                 return aresp
 
         partition, nodes = self.app.object_ring.get_nodes(
             self.account_name, self.container_name, self.object_name)
         nodes = self.app.sort_nodes(nodes)
-        resp = self.GETorHEAD_base(
-            req, _('Object'), partition,
-            self.iter_nodes(partition, nodes, self.app.object_ring),
-            req.path_info, len(nodes))
+        with time_stage(req.environ, 'backend_response'):
+            resp = self.GETorHEAD_base(
+                req, _('Object'), partition,
+                self.iter_nodes(partition, nodes, self.app.object_ring),
+                req.path_info, len(nodes))
 
         if ';' in resp.headers.get('content-type', ''):
             # strip off swift_bytes from content-type
@@ -401,6 +560,7 @@ class ObjectController(Controller):
                 resp.content_type = content_type
 
         large_object = None
+        listing_cache_key = None
         if config_true_value(resp.headers.get('x-static-large-object')) and \
                 req.params.get('multipart-manifest') != 'get' and \
                 self.app.allow_static_large_object:
@@ -440,12 +600,35 @@ class ObjectController(Controller):
                 resp.headers['x-object-manifest'].split('/', 1)
             lcontainer = unquote(lcontainer)
             lprefix = unquote(lprefix)
+            if self.app.memcache and self.app.dlo_listing_cache_time:
+                listing_cache_key = get_dlo_listing_memcache_key(
+                    self.account_name, lcontainer, lprefix)
             try:
-                pages_iter = iter(self._listing_pages_iter(lcontainer, lprefix,
-                                                           req.environ))
-                listing_page1 = pages_iter.next()
-                listing = itertools.chain(listing_page1,
-                                          self._remaining_items(pages_iter))
+                listing_page1 = None
+                if listing_cache_key:
+                    # taken before listing, so that a segment added meanwhile
+                    # makes the cached listing out of date rather than lost
+                    linfo = self.container_info(self.account_name,
+                                                lcontainer)
+                    listing_page1 = self._get_cached_listing(
+                        listing_cache_key, lcontainer, linfo, resp,
+                        req.environ)
+                if listing_page1 is not None:
+                    listing = listing_page1
+                else:
+                    pages_iter = iter(self._listing_pages_iter(
+                        lcontainer, lprefix, req.environ))
+                    listing_page1 = pages_iter.next()
+                    listing = itertools.chain(
+                        listing_page1, self._remaining_items(pages_iter))
+                    if listing_cache_key and \
+                            len(listing_page1) < CONTAINER_LISTING_LIMIT:
+                        self.app.memcache.set(
+                            listing_cache_key,
+                            {'timestamp': resp.headers.get('x-timestamp'),
+                             'container': segment_container_version(linfo),
+                             'listing': listing_page1},
+                            time=self.app.dlo_listing_cache_time)
             except ListingIterNotFound:
                 return HTTPNotFound(request=req)
             except ListingIterNotAuthorized, err:
@@ -476,7 +659,8 @@ class ObjectController(Controller):
                 else:
                     resp.app_iter = SegmentedIterable(
                         self, lcontainer, listing, resp,
-                        is_slo=(large_object == 'SLO'))
+                        is_slo=(large_object == 'SLO'),
+                        listing_cache_key=listing_cache_key)
 
             else:
                 # For objects with a reasonable number of segments, we'll serve
@@ -503,7 +687,8 @@ class ObjectController(Controller):
                                 conditional_response=True)
                 resp.app_iter = SegmentedIterable(
                     self, lcontainer, listing, resp,
-                    is_slo=(large_object == 'SLO'))
+                    is_slo=(large_object == 'SLO'),
+                    listing_cache_key=listing_cache_key)
                 resp.content_length = content_length
                 resp.last_modified = last_modified
                 resp.etag = etag
@@ -534,6 +719,10 @@ class ObjectController(Controller):
     @delay_denial
     def POST(self, req):
         """HTTP POST request handler."""
+        # only the proxy may tell object servers which shard container to
+        # update
+        if 'x-container-shard' in req.headers:
+            del req.headers['x-container-shard']
         if 'x-delete-after' in req.headers:
             try:
                 x_delete_after = int(req.headers['x-delete-after'])
@@ -602,22 +791,53 @@ class ObjectController(Controller):
                 self.account_name, self.container_name, self.object_name)
             req.headers['X-Timestamp'] = normalize_timestamp(time.time())
 
+            container_partition, containers, shard = \
+                self._container_update_target(container_info)
             headers = self._backend_requests(
                 req, len(nodes), container_partition, containers,
-                delete_at_part, delete_at_nodes)
+                delete_at_part, delete_at_nodes, shard=shard)
 
             resp = self.make_requests(req, self.app.object_ring, partition,
                                       'POST', req.path_info, headers)
             return resp
 
+    def _container_update_target(self, container_info):
+        """
+        Find the container that should receive the listing update for this
+        object: the container itself, or the shard container holding the
+        object's name if the container is sharded.
+
+        :param container_info: container_info of the object's container
+        :returns: tuple of (partition, nodes, shard) where shard is the
+                  "account/container" path of the shard container or None
+        """
+        partition = container_info['partition']
+        nodes = container_info['nodes']
+        if not container_info.get('shard_count'):
+            return partition, nodes, None
+        shard_points = self.shard_points(self.account_name,
+                                         self.container_name)
+        if not shard_points:
+            # Fall back to the root container; the sharder moves the row
+            # to its shard later on.
+            return partition, nodes, None
+        account = get_shard_account(self.account_name)
+        container = get_shard_container(
+            self.account_name, self.container_name,
+            find_shard(self.object_name, shard_points))
+        partition, nodes = self.app.container_ring.get_nodes(account,
+                                                             container)
+        return partition, nodes, '%s/%s' % (account, container)
+
     def _backend_requests(self, req, n_outgoing,
                           container_partition, containers,
-                          delete_at_partition=None, delete_at_nodes=None):
-        headers = [dict(req.headers.iteritems())
-                   for _junk in range(n_outgoing)]
-
-        for header in headers:
-            header['Connection'] = 'close'
+                          delete_at_partition=None, delete_at_nodes=None,
+                          shard=None):
+        base_headers = dict(req.headers.iteritems())
+        base_headers['Connection'] = 'close'
+        if shard:
+            base_headers['X-Container-Shard'] = quote(shard)
+        headers = [dict(base_headers) for _junk in range(n_outgoing)]
 
         for i, container in enumerate(containers):
             i = i % len(headers)
@@ -657,6 +877,65 @@ class ObjectController(Controller):
                                             _('Trying to write to %s') % path)
             conn.queue.task_done()
 
+    def _copy_source(self, req, source_resp, account, container, obj):
+        """
+        Works out whether the object servers can copy the source object of
+        a copy among themselves, rather than having its data streamed through
+        the proxy. They can unless the source is a large object to be copied
+        whole, which only the proxy puts together from its segments.
+
+        :param req: the PUT request
+        :param source_resp: response to the HEAD of the source object, made
+                            with multipart-manifest=get
+        :param account: account of the source object
+        :param container: container of the source object
+        :param obj: name of the source object
+        :returns: dict of X-Copy-Source-* headers for the object servers, or
+                  None if the data has to be streamed through the proxy
+        """
+        if 'x-object-manifest' in source_resp.headers or \
+                (config_true_value(
+                    source_resp.headers.get('x-static-large-object')) and
+                 req.params.get('multipart-manifest') != 'get'):
+            return None
+        partition, nodes = self.app.object_ring.get_nodes(
+            account, container, obj)
+        # the newest replica may well still be on a handoff node
+        nodes = nodes + list(itertools.islice(
+            self.app.object_ring.get_more_nodes(partition), len(nodes)))
+        return {
+            'X-Copy-Source-Partition': partition,
+            'X-Copy-Source-Path': quote('/%s/%s/%s' % (account, container,
+                                                       obj)),
+            'X-Copy-Source-Hosts': ','.join('%(ip)s:%(port)s' % node
+                                            for node in nodes),
+            'X-Copy-Source-Devices': ','.join(node['device']
+                                              for node in nodes)}
+
+    def _local_copy_source(self, headers, node):
+        """
+        Points an object server at a replica of a copy source on its own
+        server, if there is one, so it copies that without going through the
+        network.
+
+        :param headers: backend headers with the X-Copy-Source-* headers from
+                        _copy_source()
+        :param node: the node the headers are for
+        :returns: the headers for the node
+        """
+        host = '%(ip)s:%(port)s' % node
+        hosts = headers['X-Copy-Source-Hosts'].split(',')
+        devices = headers['X-Copy-Source-Devices'].split(',')
+        if host not in hosts:
+            return headers
+        index = hosts.index(host)
+        headers = dict(headers)
+        headers['X-Copy-Source-Local-Device'] = devices.pop(index)
+        del hosts[index]
+        headers['X-Copy-Source-Hosts'] = ','.join(hosts)
+        headers['X-Copy-Source-Devices'] = ','.join(devices)
+        return headers
+
     def _connect_put_node(self, nodes, part, path, headers,
                           logger_thread_locals):
         """Method for a file PUT connect"""
@@ -664,10 +943,13 @@ class ObjectController(Controller):
         for node in nodes:
             try:
                 start_time = time.time()
+                node_headers = headers
+                if 'X-Copy-Source-Hosts' in headers:
+                    node_headers = self._local_copy_source(headers, node)
                 with ConnectionTimeout(self.app.conn_timeout):
                     conn = http_connect(
                         node['ip'], node['port'], node['device'], part, 'PUT',
-                        path, headers)
+                        path, node_headers)
                 self.app.set_node_timing(node, time.time() - start_time)
                 with Timeout(self.app.node_timeout):
                     resp = conn.getexpect()
@@ -690,20 +972,28 @@ class ObjectController(Controller):
     @delay_denial
     def PUT(self, req):
         """HTTP PUT request handler."""
-        container_info = self.container_info(
-            self.account_name, self.container_name,
-            account_autocreate=self.app.account_autocreate)
+        with time_stage(req.environ, 'container_info'):
+            container_info = self.container_info(
+                self.account_name, self.container_name,
+                account_autocreate=self.app.account_autocreate)
         container_partition = container_info['partition']
         containers = container_info['nodes']
         req.acl = container_info['write_acl']
         req.environ['swift_sync_key'] = container_info['sync_key']
         object_versions = container_info['versions']
         if 'swift.authorize' in req.environ:
-            aresp = req.environ['swift.authorize'](req)
+            with time_stage(req.environ, 'authorize'):
+                aresp = req.environ['swift.authorize'](req)
             if aresp:
                 return aresp
         if not containers:
             return HTTPNotFound(request=req)
+        # only the proxy may tell object servers where to copy data from
+        # and which shard container to update
+        for header in req.headers.keys():
+            if header.lower().startswith('x-copy-source-') or \
+                    header.lower() == 'x-container-shard':
+                del req.headers[header]
         if 'x-delete-after' in req.headers:
             try:
                 x_delete_after = int(req.headers['x-delete-after'])
@@ -804,7 +1094,7 @@ class ObjectController(Controller):
         reader = req.environ['wsgi.input'].read
         data_source = iter(lambda: reader(self.app.client_chunk_size), '')
         source_header = req.headers.get('X-Copy-From')
-        source_resp = None
+        source_resp = copy_source = None
         if source_header:
             source_header = unquote(source_header)
             acct = req.path_info.split('/', 2)[1]
@@ -824,11 +1114,26 @@ class ObjectController(Controller):
             source_req = req.copy_get()
             source_req.path_info = source_header
             source_req.headers['X-Newest'] = 'true'
+            # The source is timed as one stage of the PUT, rather than its
+            # GET or HEAD adding container_info and the like a second time.
+            source_req.environ.pop('swift.stage_timings', None)
             orig_obj_name = self.object_name
             orig_container_name = self.container_name
             self.object_name = src_obj_name
             self.container_name = src_container_name
-            source_resp = self.GET(source_req)
+            with time_stage(req.environ, 'copy_source'):
+                if self.app.server_side_copy:
+                    head_req = Request(dict(
+                        source_req.environ, REQUEST_METHOD='HEAD',
+                        QUERY_STRING='multipart-manifest=get'))
+                    source_resp = self.HEAD(head_req)
+                    if source_resp.status_int >= HTTP_MULTIPLE_CHOICES:
+                        return source_resp
+                    copy_source = self._copy_source(
+                        req, source_resp, acct, src_container_name,
+                        src_obj_name)
+                if not copy_source:
+                    source_resp = self.GET(source_req)
             if source_resp.status_int >= HTTP_MULTIPLE_CHOICES:
                 return source_resp
             self.object_name = orig_obj_name
@@ -845,6 +1150,13 @@ class ObjectController(Controller):
                 return HTTPRequestEntityTooLarge(request=req)
             if new_req.content_length > MAX_FILE_SIZE:
                 return HTTPRequestEntityTooLarge(request=req)
+            if copy_source:
+                # the object servers get the data from the source replicas
+                # themselves and check it against the ETag
+                data_source = iter([])
+                new_req.content_length = 0
+                new_req.headers['ETag'] = source_resp.etag
+                new_req.headers.update(copy_source)
             new_req.etag = source_resp.etag
             # we no longer need the X-Copy-From header
             del new_req.headers['X-Copy-From']
@@ -866,18 +1178,23 @@ class ObjectController(Controller):
         pile = GreenPile(len(nodes))
         chunked = req.headers.get('transfer-encoding')
 
+        container_partition, containers, shard = \
+            self._container_update_target(container_info)
         outgoing_headers = self._backend_requests(
             req, len(nodes), container_partition, containers,
-            delete_at_part, delete_at_nodes)
-
-        for nheaders in outgoing_headers:
-            # RFC2616:8.2.3 disallows 100-continue without a body
-            if (req.content_length > 0) or chunked:
-                nheaders['Expect'] = '100-continue'
-            pile.spawn(self._connect_put_node, node_iter, partition,
-                       req.path_info, nheaders, self.app.logger.thread_locals)
-
-        conns = [conn for conn in pile if conn]
+            delete_at_part, delete_at_nodes, shard=shard)
+
+        with time_stage(req.environ, 'put_connect'):
+            for nheaders in outgoing_headers:
+                # RFC2616:8.2.3 disallows 100-continue without a body; server
+                # side copies are the exception, so that object servers answer
+                # before they start copying rather than once they are done
+                if (req.content_length > 0) or chunked or copy_source:
+                    nheaders['Expect'] = '100-continue'
+                pile.spawn(self._connect_put_node, node_iter, partition,
+                           req.path_info, nheaders,
+                           self.app.logger.thread_locals)
+            conns = [conn for conn in pile if conn]
         if len(conns) <= len(nodes) / 2:
             self.app.logger.error(
                 _('Object PUT returning 503, %(conns)s/%(nodes)s '
@@ -886,38 +1203,44 @@ class ObjectController(Controller):
             return HTTPServiceUnavailable(request=req)
         bytes_transferred = 0
         try:
-            with ContextPool(len(nodes)) as pool:
-                for conn in conns:
-                    conn.failed = False
-                    conn.queue = Queue(self.app.put_queue_depth)
-                    pool.spawn(self._send_file, conn, req.path)
-                while True:
-                    with ChunkReadTimeout(self.app.client_timeout):
-                        try:
-                            chunk = next(data_source)
-                        except StopIteration:
-                            if chunked:
-                                [conn.queue.put('0\r\n\r\n') for conn in conns]
-                            break
-                    bytes_transferred += len(chunk)
-                    if bytes_transferred > MAX_FILE_SIZE:
-                        return HTTPRequestEntityTooLarge(request=req)
-                    for conn in list(conns):
-                        if not conn.failed:
-                            conn.queue.put(
-                                '%x\r\n%s\r\n' % (len(chunk), chunk)
-                                if chunked else chunk)
-                        else:
-                            conns.remove(conn)
-                    if len(conns) <= len(nodes) / 2:
-                        self.app.logger.error(_(
-                            'Object PUT exceptions during'
-                            ' send, %(conns)s/%(nodes)s required connections'),
-                            {'conns': len(conns), 'nodes': len(nodes) / 2 + 1})
-                        return HTTPServiceUnavailable(request=req)
-                for conn in conns:
-                    if conn.queue.unfinished_tasks:
-                        conn.queue.join()
+            with time_stage(req.environ, 'put_upload'):
+                with ContextPool(len(nodes)) as pool:
+                    for conn in conns:
+                        conn.failed = False
+                        conn.queue = Queue(self.app.put_queue_depth)
+                        pool.spawn(self._send_file, conn, req.path)
+                    while True:
+                        with ChunkReadTimeout(self.app.client_timeout):
+                            try:
+                                chunk = next(data_source)
+                            except StopIteration:
+                                if chunked:
+                                    [conn.queue.put('0\r\n\r\n')
+                                     for conn in conns]
+                                break
+                        bytes_transferred += len(chunk)
+                        if bytes_transferred > MAX_FILE_SIZE:
+                            return HTTPRequestEntityTooLarge(request=req)
+                        if chunked:
+                            # framed just once; all the connections are sent
+                            # the very same string rather than copies of it
+                            chunk = '%x\r\n%s\r\n' % (len(chunk), chunk)
+                        for conn in list(conns):
+                            if not conn.failed:
+                                conn.queue.put(chunk)
+                            else:
+                                conns.remove(conn)
+                        if len(conns) <= len(nodes) / 2:
+                            self.app.logger.error(_(
+                                'Object PUT exceptions during'
+                                ' send, %(conns)s/%(nodes)s required '
+                                'connections'),
+                                {'conns': len(conns),
+                                 'nodes': len(nodes) / 2 + 1})
+                            return HTTPServiceUnavailable(request=req)
+                    for conn in conns:
+                        if conn.queue.unfinished_tasks:
+                            conn.queue.join()
             conns = [conn for conn in conns if not conn.failed]
         except ChunkReadTimeout, err:
             self.app.logger.warn(
@@ -938,29 +1261,34 @@ class ObjectController(Controller):
         reasons = []
         bodies = []
         etags = set()
-        for conn in conns:
-            try:
-                with Timeout(self.app.node_timeout):
-                    if conn.resp:
-                        response = conn.resp
-                    else:
-                        response = conn.getresponse()
-                    statuses.append(response.status)
-                    reasons.append(response.reason)
-                    bodies.append(response.read())
-                    if response.status >= HTTP_INTERNAL_SERVER_ERROR:
-                        self.error_occurred(
-                            conn.node,
-                            _('ERROR %(status)d %(body)s From Object Server '
-                              're: %(path)s') %
-                            {'status': response.status,
-                             'body': bodies[-1][:1024], 'path': req.path})
-                    elif is_success(response.status):
-                        etags.add(response.getheader('etag').strip('"'))
-            except (Exception, Timeout):
-                self.exception_occurred(
-                    conn.node, _('Object'),
-                    _('Trying to get final status of PUT to %s') % req.path)
+        final_timeout = self.app.node_timeout
+        if copy_source:
+            final_timeout = self.app.server_copy_timeout
+        with time_stage(req.environ, 'put_final_status'):
+            for conn in conns:
+                try:
+                    with Timeout(final_timeout):
+                        if conn.resp:
+                            response = conn.resp
+                        else:
+                            response = conn.getresponse()
+                        statuses.append(response.status)
+                        reasons.append(response.reason)
+                        bodies.append(response.read())
+                        if response.status >= HTTP_INTERNAL_SERVER_ERROR:
+                            self.error_occurred(
+                                conn.node,
+                                _('ERROR %(status)d %(body)s From Object '
+                                  'Server re: %(path)s') %
+                                {'status': response.status,
+                                 'body': bodies[-1][:1024], 'path': req.path})
+                        elif is_success(response.status):
+                            etags.add(response.getheader('etag').strip('"'))
+                except (Exception, Timeout):
+                    self.exception_occurred(
+                        conn.node, _('Object'),
+                        _('Trying to get final status of PUT to %s') %
+                        req.path)
         if len(etags) > 1:
             self.app.logger.error(
                 _('Object servers returned %s mismatched etags'), len(etags))
@@ -987,6 +1315,8 @@ class ObjectController(Controller):
     @delay_denial
     def DELETE(self, req):
         """HTTP DELETE request handler."""
+        if 'x-container-shard' in req.headers:
+            del req.headers['x-container-shard']
         container_info = self.container_info(self.account_name,
                                              self.container_name)
         container_partition = container_info['partition']
@@ -1070,8 +1400,10 @@ class ObjectController(Controller):
         else:
             req.headers['X-Timestamp'] = normalize_timestamp(time.time())
 
+        container_partition, containers, shard = \
+            self._container_update_target(container_info)
         headers = self._backend_requests(
-            req, len(nodes), container_partition, containers)
+            req, len(nodes), container_partition, containers, shard=shard)
         resp = self.make_requests(req, self.app.object_ring,
                                   partition, 'DELETE', req.path_info, headers)
         return resp
@@ -33,12 +33,15 @@ from time import time
 
 from eventlet import Timeout
 
+from swift.common.bufferedhttp import HTTPConnectionPool
+from swift.common.node_health import NodeHealthTable
 from swift.common.ring import Ring
 from swift.common.utils import cache_from_env, get_logger, \
     get_remote_client, split_path, config_true_value
 from swift.common.constraints import check_utf8
 from swift.proxy.controllers import AccountController, ObjectController, \
     ContainerController
+from swift.proxy.controllers.base import info_cache
 from swift.common.swob import HTTPBadRequest, HTTPForbidden, \
     HTTPMethodNotAllowed, HTTPNotFound, HTTPPreconditionFailed, \
     HTTPServerError, Request
@@ -59,6 +62,7 @@ class Application(object):
         swift_dir = conf.get('swift_dir', '/etc/swift')
         self.node_timeout = int(conf.get('node_timeout', 10))
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
+        self.hedged_read_delay = float(conf.get('hedged_read_delay', 0))
         self.client_timeout = int(conf.get('client_timeout', 60))
         self.put_queue_depth = int(conf.get('put_queue_depth', 10))
         self.object_chunk_size = int(conf.get('object_chunk_size', 65536))
@@ -71,10 +75,17 @@ class Application(object):
             int(conf.get('recheck_container_existence', 60))
         self.recheck_account_existence = \
             int(conf.get('recheck_account_existence', 60))
+        self.dlo_listing_cache_time = \
+            int(conf.get('dlo_listing_cache_time', 0))
+        info_cache.configure(int(conf.get('info_cache_size', 0)),
+                             float(conf.get('info_cache_ttl', 1)))
         self.allow_account_management = \
             config_true_value(conf.get('allow_account_management', 'no'))
         self.object_post_as_copy = \
             config_true_value(conf.get('object_post_as_copy', 'true'))
+        self.server_side_copy = \
+            config_true_value(conf.get('server_side_copy', 'false'))
+        self.server_copy_timeout = int(conf.get('server_copy_timeout', 600))
         self.resellers_conf = ConfigParser()
         self.resellers_conf.read(os.path.join(swift_dir, 'resellers.conf'))
         self.object_ring = object_ring or Ring(swift_dir, ring_name='object')
@@ -105,6 +116,7 @@ class Application(object):
             int(conf.get('rate_limit_after_segment', 10))
         self.rate_limit_segments_per_sec = \
             int(conf.get('rate_limit_segments_per_sec', 1))
+        self.segment_read_ahead = int(conf.get('segment_read_ahead', 0))
         self.log_handoffs = config_true_value(conf.get('log_handoffs', 'true'))
         self.cors_allow_origin = [
             a.strip()
@@ -112,9 +124,29 @@ class Application(object):
             if a.strip()]
         self.node_timings = {}
         self.timing_expiry = int(conf.get('timing_expiry', 300))
+        self.node_health = None
+        if conf.get('node_health_file'):
+            self.node_health = NodeHealthTable(
+                conf['node_health_file'],
+                int(conf.get('node_health_slots', 8192)),
+                logger=self.logger)
         self.sorting_method = conf.get('sorting_method', 'shuffle').lower()
+        self.node_latencies = {}
+        self.latency_ewma_alpha = float(conf.get('latency_ewma_alpha', 0.3))
+        self.latency_error_penalty = \
+            float(conf.get('latency_error_penalty', 1))
+        self.outlier_ejection_factor = \
+            float(conf.get('outlier_ejection_factor', 3))
+        self.outlier_min_latency = float(conf.get('outlier_min_latency', 0.05))
+        self.outlier_ejection_time = \
+            float(conf.get('outlier_ejection_time', 30))
         self.allow_static_large_object = config_true_value(
             conf.get('allow_static_large_object', 'true'))
+        self.backend_pool = None
+        if config_true_value(conf.get('backend_keepalive', 'no')):
+            self.backend_pool = HTTPConnectionPool(
+                int(conf.get('backend_max_idle_per_node', 4)),
+                float(conf.get('backend_idle_timeout', 15)))
 
     def get_controller(self, path):
         """
@@ -254,7 +286,9 @@ class Application(object):
         Sorts nodes in-place (and returns the sorted list) according to
         the configured strategy. The default "sorting" is to randomly
         shuffle the nodes. If the "timing" strategy is chosen, the nodes
-        are sorted according to the stored timing data.
+        are sorted according to the stored timing data. If the "latency"
+        strategy is chosen, the nodes are sorted according to their latency
+        averages and recent errors, with outliers moved to the end.
         '''
         # In the case of timing sorting, shuffling ensures that close timings
         # (ie within the rounding resolution) won't prefer one over another.
@@ -264,17 +298,168 @@ class Application(object):
             now = time()
 
             def key_func(node):
-                timing, expires = self.node_timings.get(node['ip'], (-1.0, 0))
+                if self.node_health:
+                    timing, expires = self.node_health.get_timing(node['ip'])
+                else:
+                    timing, expires = self.node_timings.get(node['ip'],
+                                                            (-1.0, 0))
                 return timing if expires > now else -1.0
             nodes.sort(key=key_func)
+        elif self.sorting_method == 'latency':
+            self.sort_nodes_by_latency(nodes)
         return nodes
 
+    def sort_nodes_by_latency(self, nodes):
+        """
+        Sorts nodes in-place by their score: the sum of their connect and
+        first byte latency averages, plus latency_error_penalty seconds for
+        each error within the last error_suppression_interval. Nodes not
+        used within timing_expiry score 0, so they are tried again.
+
+        A node scoring more than outlier_ejection_factor times the median
+        score of the nodes used within timing_expiry (and more than
+        outlier_min_latency) is ejected for outlier_ejection_time seconds:
+        ejected nodes go last, in order of their scores, and afterwards start
+        over without latency averages.
+
+        :param nodes: list of node dicts
+        """
+        now = time()
+        scored = []
+        known = []
+        for node in nodes:
+            connect_ewma, first_byte_ewma, updated, ejected_until = \
+                self.get_node_latency(node)
+            score = 0.0
+            if updated > now - self.timing_expiry:
+                score = connect_ewma + first_byte_ewma
+            errors, last_error = self.get_node_errors(node)
+            if errors and \
+                    (last_error or 0) > now - self.error_suppression_interval:
+                score += errors * self.latency_error_penalty
+            entry = [ejected_until > now, score, node]
+            if updated > now - self.timing_expiry:
+                known.append(entry)
+            scored.append(entry)
+        if self.outlier_ejection_factor and len(known) > 1:
+            median = sorted(score for _junk, score, _junk in
+                            known)[(len(known) - 1) / 2]
+            for entry in known:
+                ejected, score, node = entry
+                if not ejected and score > self.outlier_min_latency and \
+                        score > median * self.outlier_ejection_factor:
+                    # forgets its averages, so once back it is tried again
+                    self.set_node_latency(
+                        node, ejected_until=now + self.outlier_ejection_time,
+                        latency_updated=0.0)
+                    self.logger.increment('outlier_ejections')
+                    entry[0] = True
+        scored.sort(key=lambda entry: entry[:2])
+        nodes[:] = [node for _junk, _junk, node in scored]
+
     def set_node_timing(self, node, timing):
+        if self.sorting_method == 'latency':
+            self.update_node_latency(node, 'connect_ewma', timing)
         if self.sorting_method != 'timing':
             return
         now = time()
         timing = round(timing, 3)  # sort timings to the millisecond
-        self.node_timings[node['ip']] = (timing, now + self.timing_expiry)
+        if self.node_health:
+            self.node_health.set_timing(node['ip'], timing,
+                                        now + self.timing_expiry)
+        else:
+            self.node_timings[node['ip']] = (timing, now + self.timing_expiry)
+
+    def set_node_first_byte_timing(self, node, timing):
+        if self.sorting_method == 'latency':
+            self.update_node_latency(node, 'first_byte_ewma', timing)
+
+    def update_node_latency(self, node, field, timing):
+        """
+        Adds a timing to one of the latency averages of a node. Averages not
+        updated within timing_expiry start over.
+
+        :param node: node dict
+        :param field: 'connect_ewma' or 'first_byte_ewma'
+        :param timing: the timing in seconds
+        """
+        now = time()
+        connect_ewma, first_byte_ewma, updated, ejected_until = \
+            self.get_node_latency(node)
+        averages = {'connect_ewma': connect_ewma,
+                    'first_byte_ewma': first_byte_ewma}
+        if updated <= now - self.timing_expiry:
+            averages = {'connect_ewma': 0.0, 'first_byte_ewma': 0.0}
+        if averages[field]:
+            timing = self.latency_ewma_alpha * timing + \
+                (1 - self.latency_ewma_alpha) * averages[field]
+        averages[field] = timing
+        self.set_node_latency(node, latency_updated=now, **averages)
+
+    def get_node_latency(self, node):
+        """
+        Returns the latency averages of a node, from the node health table
+        shared with the other workers if there is one.
+
+        :param node: node dict
+        :returns: tuple of (connect_ewma, first_byte_ewma, latency_updated,
+                  ejected_until)
+        """
+        key = '%(ip)s:%(port)s/%(device)s' % node
+        if self.node_health:
+            return self.node_health.get_latency(key)
+        latency = self.node_latencies.get(key, {})
+        return (latency.get('connect_ewma', 0.0),
+                latency.get('first_byte_ewma', 0.0),
+                latency.get('latency_updated', 0.0),
+                latency.get('ejected_until', 0.0))
+
+    def set_node_latency(self, node, **fields):
+        """
+        Sets the latency averages of a node.
+
+        :param node: node dict
+        :param fields: any of connect_ewma, first_byte_ewma, latency_updated
+                       and ejected_until
+        """
+        key = '%(ip)s:%(port)s/%(device)s' % node
+        if self.node_health:
+            self.node_health.set_latency(key, **fields)
+        else:
+            self.node_latencies.setdefault(key, {}).update(fields)
+
+    def get_node_errors(self, node):
+        """
+        Returns the error count of a node and the time of its last error,
+        from the node health table shared with the other workers if there is
+        one, or else from the node dict itself.
+
+        :param node: node dict
+        :returns: tuple of (errors, last_error); errors is 0 or None if the
+                  node has no errors
+        """
+        if self.node_health:
+            return self.node_health.get_errors(
+                '%(ip)s:%(port)s/%(device)s' % node)
+        return node.get('errors'), node.get('last_error')
+
+    def set_node_errors(self, node, errors, last_error):
+        """
+        Sets the error count of a node and the time of its last error.
+
+        :param node: node dict
+        :param errors: error count, or None to clear the node's errors
+        :param last_error: time of the last error
+        """
+        if self.node_health:
+            self.node_health.set_errors('%(ip)s:%(port)s/%(device)s' % node,
+                                        errors or 0, last_error or 0.0)
+        elif errors is None:
+            node.pop('errors', None)
+            node.pop('last_error', None)
+        else:
+            node['errors'] = errors
+            node['last_error'] = last_error
 
 
 def app_factory(global_conf, **local_conf):
@@ -33,6 +33,17 @@ def readuntil2crlfs(fd):
     return rv
 
 
+def readchunked(fd):
+    rv = ''
+    while True:
+        size = int(fd.readline().split(';')[0], 16)
+        if not size:
+            fd.readline()
+            return rv
+        rv += fd.read(size)
+        fd.read(2)
+
+
 def connect_tcp(hostport):
     rv = socket.socket()
     rv.connect(hostport)
@@ -19,7 +19,10 @@ from urllib import unquote
 import cStringIO as StringIO
 from logging.handlers import SysLogHandler
 
+from mock import patch
+
 from test.unit import FakeLogger
+from swift.common import utils
 from swift.common.utils import get_logger
 from swift.common.middleware import proxy_logging
 from swift.common.swob import Request
@@ -519,6 +522,55 @@ class TestProxyLogging(unittest.TestCase):
         self.assertEquals(resp_body, 'FAKE APP')
         self.assertEquals(log_parts[11], str(len(resp_body)))
 
+    def test_stage_timings(self):
+        def stage_app(env, start_response):
+            with utils.time_stage(env, 'auth'):
+                pass
+            return FakeApp()(env, start_response)
+
+        app = proxy_logging.ProxyLoggingMiddleware(stage_app, {
+            'stage_timing_sample_rate': '1', 'log_stage_timings': 'yes'})
+        app.access_logger = FakeLogger()
+        req = Request.blank('/v1/a/c/o', environ={'REQUEST_METHOD': 'GET'})
+        ''.join(app(req.environ, start_response))
+        log_parts = self._log_parts(app)
+        self.assertEquals(len(log_parts), 18)
+        self.assertTrue(log_parts[17].startswith('auth:'), log_parts[17])
+        self.assertTiming('object.GET.200.stages.auth.timing', app)
+
+        # requests that aren't sampled get a hyphen
+        app = proxy_logging.ProxyLoggingMiddleware(stage_app, {
+            'log_stage_timings': 'yes'})
+        app.access_logger = FakeLogger()
+        req = Request.blank('/v1/a/c/o', environ={'REQUEST_METHOD': 'GET'})
+        ''.join(app(req.environ, start_response))
+        log_parts = self._log_parts(app)
+        self.assertEquals(len(log_parts), 18)
+        self.assertEquals(log_parts[17], '-')
+        self.assertNotTiming('object.GET.200.stages.auth.timing', app)
+
+        # the field is only added if asked for
+        app = proxy_logging.ProxyLoggingMiddleware(stage_app, {
+            'stage_timing_sample_rate': '1'})
+        app.access_logger = FakeLogger()
+        req = Request.blank('/v1/a/c/o', environ={'REQUEST_METHOD': 'GET'})
+        ''.join(app(req.environ, start_response))
+        self.assertEquals(len(self._log_parts(app)), 17)
+        self.assertTiming('object.GET.200.stages.auth.timing', app)
+
+    def test_stage_timing_sampling(self):
+        app = proxy_logging.ProxyLoggingMiddleware(FakeApp(), {
+            'stage_timing_sample_rate': '0.5'})
+        app.access_logger = FakeLogger()
+        with patch('random.random', side_effect=[0.7, 0.2]):
+            req = Request.blank('/', environ={'REQUEST_METHOD': 'GET'})
+            ''.join(app(req.environ, start_response))
+            self.assertFalse('swift.stage_timings' in req.environ)
+            req = Request.blank('/', environ={'REQUEST_METHOD': 'GET'})
+            ''.join(app(req.environ, start_response))
+            self.assertTrue(isinstance(req.environ['swift.stage_timings'],
+                                       utils.StageTimings))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -17,9 +17,12 @@ import unittest
 from unittest import TestCase
 from contextlib import contextmanager
 from posix import stat_result, statvfs_result
+from shutil import rmtree
+from tempfile import mkdtemp
 import os
 
 import swift.common.constraints
+from swift.common.profiler import SamplingProfiler
 from swift.common.swob import Request
 from swift.common.middleware import recon
 
@@ -842,6 +845,26 @@ class TestReconMiddleware(unittest.TestCase):
         resp = self.app(req.environ, start_response)
         self.assertEquals(resp, get_sockstat_resp)
 
+    def test_recon_get_profile(self):
+        testdir = mkdtemp()
+        try:
+            app = recon.ReconMiddleware(FakeApp(),
+                                        {'recon_cache_path': testdir})
+            profiler = SamplingProfiler(
+                'object-server', os.path.join(testdir, 'profile'))
+            profiler.stacks.update({'a;b': 2, 'a;c': 1})
+            profiler.dump()
+            req = Request.blank('/recon/profile',
+                                environ={'REQUEST_METHOD': 'GET'})
+            resp = app(req.environ, start_response)
+            self.assertEquals(resp, ['a;b 2\na;c 1\n'])
+            req = Request.blank('/recon/profile/object-replicator',
+                                environ={'REQUEST_METHOD': 'GET'})
+            resp = app(req.environ, start_response)
+            self.assertEquals(resp, [''])
+        finally:
+            rmtree(testdir, ignore_errors=1)
+
     def test_recon_invalid_path(self):
         req = Request.blank('/recon/invalid',
                             environ={'REQUEST_METHOD': 'GET'})
@@ -109,6 +109,33 @@ class TestRingBuilder(unittest.TestCase):
         self.assertNotEquals(r0.to_dict(), r1.to_dict())
         self.assertEquals(r1.to_dict(), r2.to_dict())
 
+    def test_rebalance_with_seed_assignments(self):
+        # The assignments a seeded rebalance makes are pinned down, so
+        # changes meant to speed up the builder can't change them unnoticed.
+        rb = ring.RingBuilder(4, 3, 1)
+        for idx, (region, zone, ip, weight) in enumerate([
+                (0, 0, '10.0.0.1', 1), (0, 0, '10.0.0.2', 2),
+                (0, 1, '10.0.1.1', 1), (1, 2, '10.1.2.1', 1),
+                (1, 2, '10.1.2.1', 1), (1, 3, '10.1.3.1', 2)]):
+            rb.add_dev({'id': idx, 'region': region, 'zone': zone,
+                        'weight': weight, 'ip': ip, 'port': 6000,
+                        'device': 'sd%d' % idx})
+        rb.rebalance(seed=1)
+        self.assertEquals(
+            [list(part2dev) for part2dev in rb._replica2part2dev],
+            [[1, 5, 5, 1, 5, 1, 1, 5, 5, 3, 4, 4, 3, 4, 3, 3],
+             [5, 1, 1, 5, 1, 5, 5, 0, 0, 1, 1, 0, 0, 1, 2, 1],
+             [4, 3, 2, 3, 2, 2, 4, 3, 4, 5, 5, 5, 5, 5, 5, 5]])
+        rb.remove_dev(1)
+        rb.set_dev_weight(3, 3)
+        rb.pretend_min_part_hours_passed()
+        rb.rebalance(seed=2)
+        self.assertEquals(
+            [list(part2dev) for part2dev in rb._replica2part2dev],
+            [[2, 5, 5, 0, 5, 3, 0, 5, 5, 3, 4, 4, 3, 4, 3, 3],
+             [5, 2, 3, 5, 3, 5, 5, 0, 0, 0, 0, 0, 0, 2, 2, 2],
+             [4, 3, 2, 3, 2, 2, 4, 3, 4, 5, 5, 5, 5, 5, 5, 5]])
+
     def test_set_replicas(self):
         rb = ring.RingBuilder(8, 3.2, 1)
         rb.devs_changed = False
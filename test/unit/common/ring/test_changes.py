@@ -0,0 +1,161 @@
+# Copyright (c) 2010-2013 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import array
+import cPickle as pickle
+import os
+import unittest
+from shutil import rmtree
+from StringIO import StringIO
+from tempfile import mkdtemp
+
+from swift.common.ring import changes, RingBuilder
+
+
+class TestChanges(unittest.TestCase):
+
+    def setUp(self):
+        self.devs = [
+            {'id': 0, 'region': 1, 'zone': 1, 'ip': '10.0.0.1', 'port': 6000,
+             'device': 'sda'},
+            {'id': 1, 'region': 1, 'zone': 1, 'ip': '10.0.0.1', 'port': 6000,
+             'device': 'sdb'},
+            {'id': 2, 'region': 1, 'zone': 2, 'ip': '10.0.0.2', 'port': 6000,
+             'device': 'sda'},
+            None,
+            {'id': 4, 'region': 2, 'zone': 3, 'ip': '10.0.0.3', 'port': 6000,
+             'device': 'sda'}]
+
+    def test_load_ring_data(self):
+        testdir = mkdtemp()
+        try:
+            builder = RingBuilder(4, 2, 1)
+            for dev in self.devs:
+                if dev:
+                    builder.add_dev(dict(dev, weight=1))
+            builder.rebalance()
+            builder_file = os.path.join(testdir, 'object.builder')
+            pickle.dump(builder.to_dict(), open(builder_file, 'wb'),
+                        protocol=2)
+            builder.get_ring().save(os.path.join(testdir, 'object.ring.gz'))
+            for name in ('object.builder', 'object.ring.gz'):
+                ring_data = changes.load_ring_data(
+                    os.path.join(testdir, name))
+                self.assertEquals(
+                    [list(part2dev)
+                     for part2dev in ring_data._replica2part2dev_id],
+                    [list(part2dev)
+                     for part2dev in builder._replica2part2dev])
+        finally:
+            rmtree(testdir, ignore_errors=1)
+
+    def test_get_part_replica_moves(self):
+        old = [array.array('H', [0, 1, 2, 0]),
+               array.array('H', [2, 2, 4, 1]),
+               array.array('H', [4, 4])]
+        # part 0 only swaps replicas around, part 1 moves a replica from
+        # device 1 to 0, part 2 gains a partial replica, part 3 is unchanged
+        new = [array.array('H', [2, 0, 2, 0]),
+               array.array('H', [4, 2, 4, 1]),
+               array.array('H', [0, 4, 0])]
+        self.assertEquals(changes.get_part_replica_moves(old, new),
+                          (2, {1: 1}, {0: 2}))
+        self.assertEquals(changes.get_part_replica_moves(new, old),
+                          (2, {0: 2}, {1: 1}))
+        self.assertEquals(changes.get_part_replica_moves(old, old),
+                          (0, {}, {}))
+        self.assertRaises(ValueError, changes.get_part_replica_moves,
+                          old, [array.array('H', [0, 1])])
+
+    def test_get_tier_moves(self):
+        tier_moves = changes.get_tier_moves({0: 2, 1: 1, 4: 5}, self.devs)
+        self.assertEquals(tier_moves[(1,)], 3)
+        self.assertEquals(tier_moves[(1, 1)], 3)
+        self.assertEquals(tier_moves[(1, 1, '10.0.0.1:6000')], 3)
+        self.assertEquals(tier_moves[(1, 1, '10.0.0.1:6000', 0)], 2)
+        self.assertEquals(tier_moves[(2,)], 5)
+        self.assertEquals(tier_moves[(2, 3, '10.0.0.3:6000', 4)], 5)
+        self.assertEquals(len(tier_moves), 9)
+
+    def test_get_dispersion(self):
+        replica2part2dev_id = [array.array('H', [0, 0, 0, 2]),
+                               array.array('H', [1, 2, 4, 4]),
+                               array.array('H', [4, 4])]
+        self.assertEquals(
+            changes.get_dispersion(replica2part2dev_id, self.devs),
+            {'region': [0, 2, 2, 0],
+             'zone': [0, 3, 1, 0],
+             'server': [0, 3, 1, 0],
+             'device': [0, 4, 0, 0]})
+
+    def test_estimate_bytes_moved(self):
+        replica2part2dev_id = [array.array('H', [0, 1, 2, 4]),
+                               array.array('H', [1, 2, 4, 0])]
+        self.assertEquals(
+            changes.estimate_bytes_moved({0: 1, 2: 2, 4: 1},
+                                         replica2part2dev_id,
+                                         {0: 1000, 2: 500}),
+            ({0: 500, 2: 500}, 1))
+
+    def test_get_disk_usage(self):
+        requested = []
+
+        def fake_urlopen(url, timeout=None):
+            requested.append(url)
+            if '10.0.0.2' in url:
+                raise IOError('connection refused')
+            return StringIO(
+                '[{"device": "sda", "mounted": true, "used": 100}, '
+                '{"device": "sdb", "mounted": false, "used": 0}, '
+                '{"device": "sdc", "mounted": true, "used": 300}]')
+
+        orig_urlopen = changes.urllib2.urlopen
+        try:
+            changes.urllib2.urlopen = fake_urlopen
+            self.assertEquals(changes.get_disk_usage(self.devs),
+                              {0: 100, 4: 100})
+        finally:
+            changes.urllib2.urlopen = orig_urlopen
+        self.assertEquals(sorted(requested),
+                          ['http://10.0.0.%d:6000/recon/diskusage' % i
+                           for i in (1, 2, 3)])
+
+    def test_simulate_rebalances(self):
+        builder = RingBuilder(6, 3, 24)
+        for dev in self.devs:
+            if dev:
+                builder.add_dev(dict(dev, weight=100))
+        builder.rebalance()
+        builder.add_dev({'region': 2, 'zone': 4, 'ip': '10.0.0.4',
+                         'port': 6000, 'device': 'sda', 'weight': 100})
+        before = builder.to_dict()
+        before_parts = [dev and dev['parts'] for dev in builder.devs]
+        before_part2dev = [part2dev[:]
+                           for part2dev in builder._replica2part2dev]
+        results = changes.simulate_rebalances(builder)
+        # nothing moves before min_part_hours have passed
+        self.assertEquals(results[0][0], 0)
+        self.assertTrue(results[1][0] > 0)
+        self.assertTrue(results[-1][1] < results[0][1])
+        self.assertTrue(len(results) <= 10)
+        self.assertEquals(builder.to_dict()['version'], before['version'])
+        self.assertEquals([dev and dev['parts'] for dev in builder.devs],
+                          before_parts)
+        self.assertEquals(builder._replica2part2dev, before_part2dev)
+        self.assertEquals(len(changes.simulate_rebalances(builder, 1)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
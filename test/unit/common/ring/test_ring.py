@@ -19,6 +19,7 @@ import os
 import sys
 import unittest
 from gzip import GzipFile
+from itertools import islice
 from shutil import rmtree
 from time import sleep, time
 
@@ -69,6 +70,40 @@ class TestRingData(unittest.TestCase):
         rd2 = ring.RingData.load(ring_fname)
         self.assert_ring_data_equal(rd, rd2)
 
+    def test_roundtrip_mapped_serialization(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring')
+        rd = ring.RingData(
+            [array.array('H', [0, 1, 0, 1]), array.array('H', [1, 1, 2, 0]),
+             array.array('H', [2, 0])],
+            [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1},
+             {'id': 2, 'zone': 2}], 30)
+        rd.save(ring_fname, mapped=True)
+        rd2 = ring.RingData.load(ring_fname)
+        self.assert_ring_data_equal(rd, rd2)
+        self.assertTrue(isinstance(rd2._replica2part2dev_id[0],
+                                   ring.ring.MappedArray))
+        # tables start on page boundaries
+        for table in rd2._replica2part2dev_id:
+            self.assertEquals(table.offset % 4096, 0)
+        self.assertEquals(list(rd2._part_dev_ids),
+                          [0, 1, 2, 1, 0xffff, 0, 0, 2, 0xffff, 1, 0, 0xffff])
+        self.assertEquals(rd2._replica2part2dev_id[1][2], 2)
+        self.assertEquals(rd2._replica2part2dev_id[1][-1], 0)
+        self.assertEquals(rd2._replica2part2dev_id[1][1:3], (1, 2))
+        self.assertRaises(IndexError, rd2._replica2part2dev_id[2].__getitem__,
+                          2)
+        # and it can be written back out gzipped
+        rd2.save(os.path.join(self.testdir, 'foo.ring.gz'))
+        self.assert_ring_data_equal(
+            rd, ring.RingData.load(os.path.join(self.testdir, 'foo.ring.gz')))
+
+    def test_mapped_serialization_too_many_devs(self):
+        rd = ring.RingData([array.array('H', [0])],
+                           [{'id': 0, 'zone': 0}] * 0xffff, 31)
+        self.assertRaises(ValueError, rd.save,
+                          os.path.join(self.testdir, 'foo.ring'), mapped=True)
+        self.assertEquals(os.listdir(self.testdir), [])
+
     def test_deterministic_serialization(self):
         """
         Two identical rings should produce identical .gz files on disk.
@@ -205,6 +240,55 @@ class TestRing(unittest.TestCase):
         part, nodes = self.ring.get_nodes('a')
         self.assertEquals(nodes, self.ring.get_part_nodes(part))
 
+    def test_part_nodes_tables(self):
+        # a partial last replica, and replicas sharing a device
+        replica2part2dev_id = [array.array('H', [0, 1, 3, 1]),
+                               array.array('H', [0, 3, 4, 1]),
+                               array.array('H', [3, 3])]
+        ring.RingData(replica2part2dev_id, self.intended_devs,
+                      self.intended_part_shift).save(self.testgz)
+        devs = self.intended_devs
+        expected = [[devs[0], devs[3]], [devs[1], devs[3]],
+                    [devs[3], devs[4]], [devs[1]]]
+        orig_max_parts = ring.ring.MAX_PART_NODES_TABLE_PARTS
+        try:
+            for max_parts in (orig_max_parts, 0):
+                ring.ring.MAX_PART_NODES_TABLE_PARTS = max_parts
+                r = ring.Ring(self.testgz)
+                self.assertEquals(r._part_nodes is None, max_parts == 0)
+                self.assertEquals([r.get_part_nodes(part)
+                                   for part in xrange(4)], expected)
+                self.assertEquals(r.get_part_nodes(4), [])
+                # callers get lists of their own
+                r.get_part_nodes(0).pop()
+                self.assertEquals(r.get_part_nodes(0), expected[0])
+        finally:
+            ring.ring.MAX_PART_NODES_TABLE_PARTS = orig_max_parts
+
+    def test_mapped_ring(self):
+        gz_ring = self.ring
+        mapped_path = os.path.join(self.testdir, 'whatever.ring')
+        ring.RingData(self.intended_replica2part2dev_id, self.intended_devs,
+                      self.intended_part_shift).save(mapped_path, mapped=True)
+        self.assertTrue(gz_ring.has_changed())
+        r = ring.Ring(self.testdir, ring_name='whatever')
+        self.assertEquals(r._ring_path, mapped_path)
+        self.assertFalse(r.has_changed())
+        self.assertEquals(r.devs, self.intended_devs)
+        self.assertEquals(r.partition_count, 4)
+        self.assertEquals(r.replica_count, 3)
+        for account in ('a', 'b', 'c', 'd'):
+            part, nodes = r.get_nodes(account)
+            self.assertEquals((part, nodes), gz_ring.get_nodes(account))
+            self.assertEquals(list(r.get_more_nodes(part)),
+                              list(gz_ring.get_more_nodes(part)))
+        # a newer gzipped ring wins over a stale mapped one
+        os.utime(mapped_path, (time() - 300, time() - 300))
+        self.assertTrue(r.has_changed())
+        r = ring.Ring(self.testdir, ring_name='whatever')
+        self.assertEquals(r._ring_path, self.testgz)
+        self.assertEquals(r._part_dev_ids, None)
+
     def test_get_nodes(self):
         # Yes, these tests are deliberately very fragile. We want to make sure
         # that if someones changes the results the ring produces, they know it.
@@ -273,6 +357,51 @@ class TestRing(unittest.TestCase):
         self.ring.devs.append(new_dev)
         self.ring._rebuild_tier_data()
 
+    def test_get_more_nodes_cache(self):
+        rb = ring.RingBuilder(8, 3, 1)
+        for dev_id in xrange(20):
+            rb.add_dev({'id': dev_id, 'region': 1 + dev_id % 2,
+                        'zone': dev_id % 5, 'weight': 1.0,
+                        'ip': '10.1.1.%d' % dev_id, 'port': 6000,
+                        'device': 'sda'})
+        rb.rebalance()
+        rb.get_ring().save(self.testgz)
+        r = ring.Ring(self.testgz)
+        uncached = list(r._get_more_nodes(3))
+        self.assertEquals(len(uncached), 17)
+        orig_depth = ring.ring.HANDOFF_CACHE_DEPTH
+        orig_size = ring.ring.HANDOFF_CACHE_SIZE
+        try:
+            ring.ring.HANDOFF_CACHE_DEPTH = 4
+            ring.ring.HANDOFF_CACHE_SIZE = 4
+            self.assertEquals(list(r.get_more_nodes(3)), uncached)
+            self.assertEquals(r._handoff_cache[3][0], tuple(uncached[:4]))
+            # the first handoffs come from the cache from now on
+            walks = []
+            orig_get_more_nodes = r._get_more_nodes
+
+            def counting_get_more_nodes(part):
+                walks.append(part)
+                return orig_get_more_nodes(part)
+
+            r._get_more_nodes = counting_get_more_nodes
+            self.assertEquals(list(islice(r.get_more_nodes(3), 4)),
+                              uncached[:4])
+            self.assertEquals(walks, [])
+            self.assertEquals(list(r.get_more_nodes(3)), uncached)
+            self.assertEquals(walks, [3])
+            # least recently used partitions are dropped
+            for part in xrange(4, 8):
+                list(islice(r.get_more_nodes(part), 1))
+            self.assert_(3 not in r._handoff_cache)
+            self.assertEquals(len(r._handoff_cache), 4)
+            # and a reloaded ring starts over
+            r._reload(force=True)
+            self.assertEquals(r._handoff_cache, {})
+        finally:
+            ring.ring.HANDOFF_CACHE_DEPTH = orig_depth
+            ring.ring.HANDOFF_CACHE_SIZE = orig_size
+
     def test_get_more_nodes(self):
         # Yes, these tests are deliberately very fragile. We want to make sure
         # that if someone changes the results the ring produces, they know it.
@@ -0,0 +1,92 @@
+# Copyright (c) 2010-2013 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cPickle as pickle
+import os
+import sys
+import unittest
+from shutil import rmtree
+from StringIO import StringIO
+from tempfile import mkdtemp
+
+from swift.common.ring import ring, RingBuilder
+
+RING_BUILDER = os.path.join(os.path.dirname(__file__), '..', '..', '..',
+                            '..', 'bin', 'swift-ring-builder')
+
+
+class TestRingBuilderCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.builder_file = os.path.join(self.testdir, 'object.builder')
+        builder = RingBuilder(4, 3, 1)
+        for dev_id in xrange(4):
+            builder.add_dev({'id': dev_id, 'region': 1, 'zone': dev_id,
+                             'ip': '10.0.0.%d' % dev_id, 'port': 6000,
+                             'device': 'sda', 'weight': 100})
+        pickle.dump(builder.to_dict(), open(self.builder_file, 'wb'),
+                    protocol=2)
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=1)
+
+    def run_command(self, *args):
+        orig_argv = sys.argv
+        orig_stdout = sys.stdout
+        sys.argv = ['swift-ring-builder', self.builder_file] + list(args)
+        sys.stdout = StringIO()
+        try:
+            execfile(RING_BUILDER, {'__name__': '__main__'})
+        except SystemExit, err:
+            return err.code, sys.stdout.getvalue()
+        finally:
+            sys.argv = orig_argv
+            sys.stdout = orig_stdout
+        self.fail('swift-ring-builder did not exit')
+
+    def test_rebalance_writes_mapped_ring(self):
+        mapped_ring_file = os.path.join(self.testdir, 'object.ring')
+        self.assertEquals(self.run_command('write_mapped_ring')[0], 0)
+        self.assertEquals(self.run_command('rebalance')[0], 0)
+        self.assertEquals(
+            ring.RingData.load(mapped_ring_file)._replica2part2dev_id,
+            RingBuilder.load(self.builder_file).get_ring().
+            _replica2part2dev_id)
+
+    def test_rebalance_mapped_ring_too_many_devices(self):
+        mapped_ring_file = os.path.join(self.testdir, 'object.ring')
+        self.assertEquals(self.run_command('write_mapped_ring')[0], 0)
+        orig_no_dev = ring.NO_DEV
+        try:
+            ring.NO_DEV = 4
+            status, output = self.run_command('rebalance')
+        finally:
+            ring.NO_DEV = orig_no_dev
+        self.assertEquals(status, 1)
+        self.assertTrue('Too many devices' in output)
+        # the gzipped ring and the builder are both saved, and the mapped
+        # ring, which would be out of date, is gone
+        self.assertFalse(os.path.exists(mapped_ring_file))
+        self.assertEquals(
+            ring.RingData.load(
+                os.path.join(self.testdir, 'object.ring.gz')).
+            _replica2part2dev_id,
+            RingBuilder.load(self.builder_file).get_ring().
+            _replica2part2dev_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
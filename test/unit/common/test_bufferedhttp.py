@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import socket
 import unittest
 
 from eventlet import spawn, Timeout, listen
@@ -97,6 +98,190 @@ class TestBufferedHTTP(unittest.TestCase):
         finally:
             bufferedhttp.HTTPSConnection = origHTTPSConnection
 
+    def test_http_connect_pool(self):
+        bindsock = listen(('127.0.0.1', 0))
+        port = bindsock.getsockname()[1]
+        accepted = []
+
+        def serve():
+            try:
+                with Timeout(3):
+                    while True:
+                        sock, addr = bindsock.accept()
+                        accepted.append(addr)
+                        fp = sock.makefile()
+                        line = fp.readline()
+                        while line:
+                            method = line.split()[0]
+                            while line and line != '\r\n':
+                                line = fp.readline()
+                            if method == 'GET':
+                                fp.write('HTTP/1.1 200 OK\r\n'
+                                         'Content-Length: 4\r\n\r\nbody')
+                            elif method == 'HEAD':
+                                fp.write('HTTP/1.1 204 No Content\r\n'
+                                         'Content-Length: 4\r\n\r\n')
+                            else:
+                                fp.write('HTTP/1.1 200 OK\r\n'
+                                         'Connection: close\r\n\r\n')
+                                fp.flush()
+                                break
+                            fp.flush()
+                            line = fp.readline()
+                        fp.close()
+                        sock.close()
+            except BaseException, err:
+                return err
+
+        event = spawn(serve)
+        pool = bufferedhttp.HTTPConnectionPool()
+        try:
+            with Timeout(3):
+                for method in ('GET', 'HEAD', 'GET'):
+                    conn = bufferedhttp.http_connect(
+                        '127.0.0.1', port, 'dev', 1, method, '/path',
+                        pool=pool)
+                    resp = conn.getresponse()
+                    body = resp.read()
+                    self.assertEquals(resp.status,
+                                      200 if method == 'GET' else 204)
+                    self.assertEquals(body, 'body' if method == 'GET' else '')
+                    # closing the old connection must not harm the pooled one
+                    conn.close()
+                    self.assertEquals(len(pool.idle[('127.0.0.1', port)]), 1)
+                self.assertEquals(len(accepted), 1)
+
+                # a response that isn't read to its end isn't pooled
+                conn = bufferedhttp.http_connect(
+                    '127.0.0.1', port, 'dev', 1, 'GET', '/path', pool=pool)
+                resp = conn.getresponse()
+                self.assertEquals(resp.read(2), 'bo')
+                self.assertEquals(pool.idle[('127.0.0.1', port)], [])
+                conn.close()
+
+                # nor is one the server closes
+                conn = bufferedhttp.http_connect(
+                    '127.0.0.1', port, 'dev', 1, 'DELETE', '/path', pool=pool)
+                resp = conn.getresponse()
+                resp.read()
+                self.assertEquals(pool.idle[('127.0.0.1', port)], [])
+                self.assertEquals(len(accepted), 2)
+        finally:
+            pool.close()
+            event.kill()
+            bindsock.close()
+
+    def test_http_connect_pool_resend(self):
+        bindsock = listen(('127.0.0.1', 0))
+        port = bindsock.getsockname()[1]
+        requests = []
+
+        def serve():
+            # answers the first request on each connection and then, like a
+            # server whose keep-alive timeout runs out, closes the connection
+            # on the next one
+            try:
+                with Timeout(3):
+                    while True:
+                        sock, addr = bindsock.accept()
+                        fp = sock.makefile()
+                        for answer in (True, False):
+                            line = fp.readline()
+                            requests.append((addr, line.split()[0]))
+                            while line and line != '\r\n':
+                                line = fp.readline()
+                            if answer:
+                                fp.write('HTTP/1.1 200 OK\r\n'
+                                         'Content-Length: 4\r\n\r\nbody')
+                                fp.flush()
+                        fp.close()
+                        sock.close()
+            except BaseException, err:
+                return err
+
+        event = spawn(serve)
+        pool = bufferedhttp.HTTPConnectionPool()
+        try:
+            with Timeout(3):
+                for method in ('GET', 'GET'):
+                    conn = bufferedhttp.http_connect(
+                        '127.0.0.1', port, 'dev', 1, method, '/path',
+                        pool=pool)
+                    resp = conn.getresponse()
+                    self.assertEquals(resp.status, 200)
+                    self.assertEquals(resp.read(), 'body')
+                # the second request went out on the reused connection, and
+                # once more on a new one when the server closed that
+                self.assertEquals([method for addr, method in requests],
+                                  ['GET', 'GET', 'GET'])
+                self.assertEquals(requests[0][0], requests[1][0])
+                self.assertNotEquals(requests[1][0], requests[2][0])
+
+                # a request whose body went out isn't sent again
+                conn = bufferedhttp.http_connect(
+                    '127.0.0.1', port, 'dev', 1, 'PUT', '/path',
+                    headers={'Content-Length': '4'}, pool=pool)
+                conn.send('body')
+                self.assertRaises((bufferedhttp.BadStatusLine, socket.error),
+                                  conn.getresponse)
+                self.assertEquals(len(requests), 4)
+        finally:
+            pool.close()
+            event.kill()
+            bindsock.close()
+
+    def test_connection_pool(self):
+        peers = []
+
+        def make_conn():
+            conn = bufferedhttp.BufferedHTTPConnection('1.2.3.4:5')
+            conn.sock, peer = socket.socketpair()
+            peers.append(peer)
+            return conn
+
+        pool = bufferedhttp.HTTPConnectionPool(max_idle_per_node=2,
+                                               idle_timeout=10)
+        try:
+            self.assertEquals(pool.get('1.2.3.4', 5), None)
+            conns = [make_conn() for _junk in xrange(3)]
+            for conn in conns:
+                pool.put(conn)
+            # only max_idle_per_node are kept
+            self.assertEquals(conns[2].sock, None)
+            self.assert_(pool.get('1.2.3.4', '5') is conns[1])
+            self.assertEquals(conns[1].pool, pool)
+            self.assert_(pool.get('1.2.3.4', 5) is conns[0])
+            self.assertEquals(pool.get('1.2.3.4', 5), None)
+
+            # connections the server closed are dropped
+            conn = make_conn()
+            pool.put(conn)
+            peers[-1].close()
+            self.assertEquals(pool.get('1.2.3.4', 5), None)
+            self.assertEquals(conn.sock, None)
+
+            # idle connections time out
+            conn = make_conn()
+            pool.put(conn)
+            idle = pool.idle[('1.2.3.4', 5)]
+            idle[0] = (idle[0][0] - 10, conn)
+            self.assertEquals(pool.get('1.2.3.4', 5), None)
+            self.assertEquals(conn.sock, None)
+
+            # and are swept even if their node isn't used again
+            conn = make_conn()
+            pool.put(conn)
+            idle = pool.idle[('1.2.3.4', 5)]
+            idle[0] = (idle[0][0] - 10, conn)
+            pool.last_sweep -= 10
+            self.assertEquals(pool.get('5.6.7.8', 5), None)
+            self.assertEquals(conn.sock, None)
+            self.assertEquals(pool.idle, {})
+        finally:
+            pool.close()
+            for peer in peers:
+                peer.close()
+
 
 if __name__ == '__main__':
     unittest.main()
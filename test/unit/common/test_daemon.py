@@ -15,10 +15,14 @@
 
 # TODO: Test kill_children signal handlers
 
+import os
+import signal
 import unittest
 from getpass import getuser
 import logging
+from shutil import rmtree
 from StringIO import StringIO
+from tempfile import mkdtemp
 from test.unit import tmpfile
 
 from swift.common import daemon, utils
@@ -80,6 +84,30 @@ class TestRunDaemon(unittest.TestCase):
         d.run(once=True)
         self.assertEquals(d.once_called, True)
 
+    def test_run_profiled(self):
+        testdir = mkdtemp()
+        orig_sigusr2 = signal.getsignal(signal.SIGUSR2)
+        ran = []
+
+        class ProfiledDaemon(MyDaemon):
+            def run_once(self):
+                ran.append(True)
+
+        try:
+            d = ProfiledDaemon({'sampling_profiler': 'yes',
+                                'log_name': 'my-daemon',
+                                'recon_cache_path': testdir})
+            d.run(once=True)
+            self.assertEquals(ran, [True])
+            # stopping the profiler dumps its samples
+            self.assertEquals(
+                os.listdir(os.path.join(testdir, 'profile')),
+                ['my-daemon-%d.folded' % os.getpid()])
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGUSR2, orig_sigusr2)
+            rmtree(testdir, ignore_errors=1)
+
     def test_run_daemon(self):
         sample_conf = """[my-daemon]
 user = %s
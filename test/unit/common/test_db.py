@@ -697,6 +697,29 @@ class TestContainerBroker(unittest.TestCase):
         broker.reclaim(normalize_timestamp(time()), time())
         broker.delete_db(normalize_timestamp(time()))
 
+    def test_reclaim_batches(self):
+        broker = ContainerBroker(':memory:', account='test_account',
+                                 container='test_container')
+        broker.initialize(normalize_timestamp('1'))
+        for name in 'abcdefg':
+            broker.put_object(name, normalize_timestamp('2'), 0,
+                              'text/plain',
+                              'd41d8cd98f00b204e9800998ecf8427e')
+            broker.delete_object(name, normalize_timestamp('3'))
+        broker.delete_object('d', normalize_timestamp('9'))
+        broker.put_object('h', normalize_timestamp('2'), 0, 'text/plain',
+                          'd41d8cd98f00b204e9800998ecf8427e')
+        orig_batch_size = swift.common.db.RECLAIM_BATCH_SIZE
+        try:
+            swift.common.db.RECLAIM_BATCH_SIZE = 2
+            self.assertEquals(
+                broker.reclaim(normalize_timestamp('5'), time()), 6)
+        finally:
+            swift.common.db.RECLAIM_BATCH_SIZE = orig_batch_size
+        with broker.get() as conn:
+            self.assertEquals([r[0] for r in conn.execute(
+                "SELECT name FROM object ORDER BY name")], ['d', 'h'])
+
     def test_delete_object(self):
         """ Test swift.common.db.ContainerBroker.delete_object """
         broker = ContainerBroker(':memory:', account='a', container='c')
@@ -1190,6 +1213,37 @@ class TestContainerBroker(unittest.TestCase):
         self.assertEquals([row[0] for row in listing],
                           ['/pets/fish/a', '/pets/fish/b'])
 
+    def test_list_objects_iter_include_deleted(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(normalize_timestamp('1'))
+        for name in ('a', 'b', 'c', 'd/1', 'e'):
+            broker.put_object(name, normalize_timestamp(1), 0, 'text/plain',
+                              'd41d8cd98f00b204e9800998ecf8427e')
+        for name in ('b', 'd/1', 'e'):
+            broker.delete_object(name, normalize_timestamp(2))
+        listing = broker.list_objects_iter(100, None, None, None, None)
+        self.assertEquals([row[0] for row in listing], ['a', 'c'])
+        listing = broker.list_objects_iter(100, None, None, None, None,
+                                           include_deleted=True)
+        self.assertEquals([(row[0], row[1], row[5]) for row in listing], [
+            ('a', normalize_timestamp(1), 0),
+            ('b', normalize_timestamp(2), 1),
+            ('c', normalize_timestamp(1), 0),
+            ('d/1', normalize_timestamp(2), 1),
+            ('e', normalize_timestamp(2), 1)])
+        # deleted objects don't count towards the limit, and are only listed
+        # up to the last of the entries
+        listing = broker.list_objects_iter(1, 'a', None, None, None,
+                                           include_deleted=True)
+        self.assertEquals([row[0] for row in listing], ['b', 'c'])
+        # nor are they listed within subdirectories
+        listing = broker.list_objects_iter(100, None, None, None, '/',
+                                           include_deleted=True)
+        self.assertEquals([row[0] for row in listing], ['a', 'b', 'c', 'e'])
+        listing = broker.list_objects_iter(100, None, None, 'd/', '/',
+                                           include_deleted=True)
+        self.assertEquals([row[0] for row in listing], ['d/1'])
+
     def test_double_check_trailing_delimiter(self):
         """ Test swift.common.db.ContainerBroker.list_objects_iter for a
             container that has an odd file with a trailing delimiter """
@@ -1306,6 +1360,115 @@ class TestContainerBroker(unittest.TestCase):
         self.assertEquals(['a', 'b', 'c'],
                           sorted([rec['name'] for rec in items]))
 
+    def test_merge_items_batch(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(normalize_timestamp('1'))
+        broker.put_object('a', normalize_timestamp(2), 0,
+                          'text/plain', 'd41d8cd98f00b204e9800998ecf8427e')
+        broker.put_object('b', normalize_timestamp(5), 0,
+                          'text/plain', 'd41d8cd98f00b204e9800998ecf8427e')
+
+        def rec(name, timestamp, deleted=0):
+            return {'name': name, 'created_at': normalize_timestamp(timestamp),
+                    'size': 0, 'content_type': 'text/plain',
+                    'etag': 'd41d8cd98f00b204e9800998ecf8427e',
+                    'deleted': deleted}
+
+        broker.merge_items([rec('a', 3), rec('b', 4), rec('c', 6),
+                            rec('c', 7, 1), rec('c', 6), rec(u'\u2603', 8),
+                            rec('\xe2\x98\x83', 9), rec('a', 1)])
+        with broker.get() as conn:
+            rows = [tuple(row) for row in conn.execute(
+                'SELECT name, created_at, deleted FROM object ORDER BY ROWID')]
+            self.assertEquals(rows, [
+                ('b', normalize_timestamp(5), 0),
+                ('a', normalize_timestamp(3), 0),
+                ('c', normalize_timestamp(7), 1),
+                ('\xe2\x98\x83', normalize_timestamp(9), 0)])
+        # the hash is the same as if each row was hashed by the triggers
+        expected = '00000000000000000000000000000000'
+        for name, created_at, deleted in rows:
+            expected = chexor(expected, name.decode('utf8'), created_at)
+        self.assertEquals(broker.get_info()['hash'], expected)
+        # and the triggers hash rows themselves again afterwards
+        with broker.get() as conn:
+            conn.execute("""
+                INSERT INTO object (name, created_at, size, content_type,
+                    etag, deleted)
+                VALUES ('d', '0000000010.00000', 0, 'text/plain', 'x', 0)
+            """)
+            self.assertEquals(conn.execute(
+                'SELECT hash FROM container_stat').fetchone()[0],
+                chexor(expected, 'd', '0000000010.00000'))
+
+    def test_batched_chexor_no_callback(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(normalize_timestamp('1'))
+        broker.put_object('a', normalize_timestamp(2), 3,
+                          'text/plain', 'd41d8cd98f00b204e9800998ecf8427e')
+        hashed = []
+
+        def counting_chexor(old, name, timestamp):
+            hashed.append(name)
+            return chexor(old, name, timestamp)
+
+        with broker.get() as conn:
+            conn.create_function('chexor', 3, counting_chexor)
+            with broker.batched_chexor(conn):
+                conn.execute('DELETE FROM object')
+                conn.executemany("""
+                    INSERT INTO object (name, created_at, size, content_type,
+                        etag, deleted)
+                    VALUES (?, '0000000003.00000', 1, 'text/plain', 'x', 0)
+                """, [('b',), ('\xe2\x98\x83',)])
+            self.assertEquals(hashed, [])
+            conn.commit()
+            # the triggers are back, and hash rows again outside a batch
+            conn.execute("""
+                INSERT INTO object (name, created_at, size, content_type,
+                    etag, deleted)
+                VALUES ('d', '0000000004.00000', 1, 'text/plain', 'x', 0)
+            """)
+            self.assertEquals(hashed, ['d'])
+            conn.commit()
+        expected = '00000000000000000000000000000000'
+        for name, timestamp in (('b', '0000000003.00000'),
+                                (u'\u2603', '0000000003.00000'),
+                                ('d', '0000000004.00000')):
+            expected = chexor(expected, name, timestamp)
+        info = broker.get_info()
+        self.assertEquals(info['hash'], expected)
+        self.assertEquals(info['object_count'], 3)
+        self.assertEquals(info['bytes_used'], 3)
+
+    def test_batched_chexor_error(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(normalize_timestamp('1'))
+        with broker.get() as conn:
+            try:
+                with broker.batched_chexor(conn):
+                    conn.execute("""
+                        INSERT INTO object (name, created_at, size,
+                            content_type, etag, deleted)
+                        VALUES ('a', '0000000002.00000', 0, 'text/plain',
+                            'x', 0)
+                    """)
+                    raise ValueError('oops')
+            except ValueError:
+                pass
+            # the block's changes are rolled back, triggers and all
+            self.assertEquals(conn.execute(
+                'SELECT COUNT(*) FROM object').fetchone()[0], 0)
+            conn.execute("""
+                INSERT INTO object (name, created_at, size, content_type,
+                    etag, deleted)
+                VALUES ('a', '0000000002.00000', 0, 'text/plain', 'x', 0)
+            """)
+            self.assertEquals(conn.execute(
+                'SELECT hash FROM container_stat').fetchone()[0],
+                chexor('00000000000000000000000000000000', 'a',
+                       '0000000002.00000'))
+
     def test_merge_items_overwrite(self):
         """test DatabaseBroker.merge_items"""
         broker1 = ContainerBroker(':memory:', account='a', container='c')
@@ -1376,6 +1539,94 @@ class TestContainerBroker(unittest.TestCase):
                 self.assertEquals(rec['created_at'], normalize_timestamp(5))
                 self.assertEquals(rec['content_type'], 'text/plain')
 
+    def test_shard_points(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(normalize_timestamp('1'))
+        self.assertEquals(broker.get_shard_points(), [])
+        broker.set_shard_points(['f', u'\u2603'.encode('utf-8')],
+                                normalize_timestamp('2'))
+        self.assertEquals(broker.get_shard_points(),
+                          ['f', u'\u2603'.encode('utf-8')])
+        self.assert_(isinstance(broker.get_shard_points()[1], str))
+
+    def test_shard_stats(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(normalize_timestamp('1'))
+        self.assertEquals(broker.get_shard_stats(), (0, 0))
+        broker.put_object('o', normalize_timestamp('2'), 10, 'text/plain',
+                          'd41d8cd98f00b204e9800998ecf8427e')
+        broker.set_shard_stats(3, 30, normalize_timestamp('3'))
+        self.assertEquals(broker.get_shard_stats(), (3, 30))
+        info = broker.get_info()
+        self.assertEquals(info['object_count'], 4)
+        self.assertEquals(info['bytes_used'], 40)
+        self.assert_('metadata' not in info)
+        info = broker.get_info(include_metadata=True)
+        self.assertEquals(info['object_count'], 4)
+        self.assert_('X-Container-Shard-Stats' in info['metadata'])
+        broker.delete_object('o', normalize_timestamp('4'))
+        self.assert_(not broker.empty())
+        broker.set_shard_stats(0, 0, normalize_timestamp('5'))
+        self.assert_(broker.empty())
+
+    def test_find_shard_points(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(normalize_timestamp('1'))
+        self.assertEquals(broker.find_shard_points(2), [])
+        for name in 'abcdefg':
+            broker.put_object(name, normalize_timestamp('2'), 0,
+                              'text/plain',
+                              'd41d8cd98f00b204e9800998ecf8427e')
+        broker.delete_object('c', normalize_timestamp('3'))
+        self.assertEquals(broker.find_shard_points(2), ['b', 'e', 'g'])
+        self.assertEquals(broker.find_shard_points(4), ['e'])
+        self.assertEquals(broker.find_shard_points(10), [])
+
+    def test_get_objects_in_range(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(normalize_timestamp('1'))
+        for name in 'abcde':
+            broker.put_object(name, normalize_timestamp('2'), 1,
+                              'text/plain',
+                              'd41d8cd98f00b204e9800998ecf8427e')
+        broker.delete_object('c', normalize_timestamp('3'))
+        objects = broker.get_objects_in_range('a', 'd', 10)
+        self.assertEquals([o['name'] for o in objects], ['b', 'c', 'd'])
+        self.assertEquals([o['deleted'] for o in objects], [0, 1, 0])
+        self.assertEquals(objects[0], {
+            'name': 'b', 'created_at': normalize_timestamp('2'), 'size': 1,
+            'content_type': 'text/plain',
+            'etag': 'd41d8cd98f00b204e9800998ecf8427e', 'deleted': 0})
+        self.assertEquals(
+            [o['name'] for o in broker.get_objects_in_range(None, 'b', 10)],
+            ['a', 'b'])
+        self.assertEquals(
+            [o['name'] for o in broker.get_objects_in_range('d', None, 10)],
+            ['e'])
+        self.assertEquals(
+            [o['name'] for o in broker.get_objects_in_range(None, None, 2)],
+            ['a', 'b'])
+
+    def test_remove_objects(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(normalize_timestamp('1'))
+        for name in 'abc':
+            broker.put_object(name, normalize_timestamp('2'), 1,
+                              'text/plain',
+                              'd41d8cd98f00b204e9800998ecf8427e')
+        objects = broker.get_objects_in_range(None, 'b', 10)
+        # a newer row for b arrives after the rows were read
+        broker.put_object('b', normalize_timestamp('3'), 2, 'text/plain',
+                          'd41d8cd98f00b204e9800998ecf8427e')
+        broker.remove_objects(objects)
+        objects = broker.get_objects_in_range(None, None, 10)
+        self.assertEquals([(o['name'], o['created_at']) for o in objects],
+                          [('b', normalize_timestamp('3')),
+                           ('c', normalize_timestamp('2'))])
+        info = broker.get_info()
+        self.assertEquals(info['object_count'], 2)
+        self.assertEquals(info['bytes_used'], 3)
+
 
 def premetadata_create_container_stat_table(self, conn, put_timestamp=None):
     """
@@ -1639,6 +1890,23 @@ class TestAccountBroker(unittest.TestCase):
         # self.assert_('z' in containers)
         # self.assert_('a' not in containers)
 
+    def test_reclaim_batches(self):
+        broker = AccountBroker(':memory:', account='test_account')
+        broker.initialize(normalize_timestamp('1'))
+        for name in 'abcde':
+            broker.put_container(name, 0, normalize_timestamp('3'), 0, 0)
+        broker.put_container('f', normalize_timestamp('2'), 0, 0, 0)
+        orig_batch_size = swift.common.db.RECLAIM_BATCH_SIZE
+        try:
+            swift.common.db.RECLAIM_BATCH_SIZE = 2
+            self.assertEquals(
+                broker.reclaim(normalize_timestamp('5'), time()), 5)
+        finally:
+            swift.common.db.RECLAIM_BATCH_SIZE = orig_batch_size
+        with broker.get() as conn:
+            self.assertEquals([r[0] for r in conn.execute(
+                "SELECT name FROM container ORDER BY name")], ['f'])
+
     def test_delete_container(self):
         """ Test swift.common.db.AccountBroker.delete_container """
         broker = AccountBroker(':memory:', account='a')
@@ -21,7 +21,7 @@ import errno
 from shutil import rmtree
 from tempfile import mkdtemp, NamedTemporaryFile
 
-from swift.common import db_replicator
+from swift.common import db_replicator, db
 from swift.common.utils import normalize_timestamp
 from swift.container import server as container_server
 
@@ -166,8 +166,10 @@ class FakeBroker:
             return self.stub_replication_info
         return {'delete_timestamp': 0, 'put_timestamp': 1, 'count': 0}
 
+    reclaimed = 0
+
     def reclaim(self, item_timestamp, sync_timestamp):
-        pass
+        return self.reclaimed
 
     def get_info(self):
         pass
@@ -276,6 +278,31 @@ class TestDBReplicator(unittest.TestCase):
         replicator._replicate_object('0', '/path/to/file', 'node_id')
         self.assertEquals([], self.delete_db_calls)
 
+    def test_replicate_object_reclaim_stats(self):
+        db_replicator.ring = FakeRingWithNodes()
+        replicator = TestReplicator({})
+        replicator.delete_db = self.stub_delete_db
+        replicator.logger = FakeLogger()
+        replicator._zero_stats()
+        try:
+            replicator.brokerclass.reclaimed = 7
+            replicator._replicate_object('0', '/path/to/file', 'node_id')
+        finally:
+            replicator.brokerclass.reclaimed = 0
+        self.assertEquals(replicator.stats['reclaimed'], 7)
+        self.assertEquals(replicator.logger.log_dict['update_stats'],
+                          [(('reclaimed', 7), {})])
+
+    def test_reclaim_batch_size_conf(self):
+        orig_batch_size = db.RECLAIM_BATCH_SIZE
+        try:
+            TestReplicator({})
+            self.assertEquals(db.RECLAIM_BATCH_SIZE, 1000)
+            TestReplicator({'reclaim_batch_size': '50'})
+            self.assertEquals(db.RECLAIM_BATCH_SIZE, 50)
+        finally:
+            db.RECLAIM_BATCH_SIZE = orig_batch_size
+
     def test_replicate_object_quarantine(self):
         replicator = TestReplicator({})
         was_db_file = replicator.brokerclass.db_file
@@ -302,6 +329,7 @@ class TestDBReplicator(unittest.TestCase):
             db_replicator.renamer = mock_renamer_error
             replicator._replicate_object('0', 'file', 'node_id')
         finally:
+            replicator.brokerclass.get_repl_missing_table = False
             replicator.brokerclass.db_file = was_db_file
             db_replicator.renamer = was_renamer
 
@@ -300,6 +300,32 @@ class TestMemcached(unittest.TestCase):
             ('some_key2', 'some_key1', 'not_exists'), 'multi_key'),
             [[4, 5, 6], [1, 2, 3], None])
 
+    def test_get_many(self):
+        memcache_client = memcached.MemcacheRing(
+            ['1.2.3.4:11211', '1.2.3.5:11211'])
+        mock1 = MockMemcached()
+        mock2 = MockMemcached()
+        memcache_client._client_cache['1.2.3.4:11211'] = [(mock1, mock1)] * 2
+        memcache_client._client_cache['1.2.3.5:11211'] = [(mock2, mock2)] * 2
+        keys = ['some_key%d' % i for i in xrange(10)]
+        for i, key in enumerate(keys):
+            memcache_client.set(key, [i])
+        # the keys are spread over both servers
+        self.assert_(mock1.cache)
+        self.assert_(mock2.cache)
+        sent = []
+        for mock in (mock1, mock2):
+            def sendall(string, mock=mock, orig=mock.sendall):
+                sent.append(string)
+                return orig(string)
+            mock.sendall = sendall
+        self.assertEquals(memcache_client.get_many(keys + ['not_exists']),
+                          [[i] for i in xrange(10)] + [None])
+        # one request per server
+        self.assertEquals(len(sent), 2)
+        self.assert_(all(string.startswith('get ') for string in sent))
+        self.assertEquals(memcache_client.get_many([]), [])
+
     def test_serialization(self):
         memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'],
                                                  allow_pickle=True)
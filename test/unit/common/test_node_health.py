@@ -0,0 +1,131 @@
+# Copyright (c) 2010-2013 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from swift.common import node_health
+from test.unit import FakeLogger
+
+
+class TestNodeHealthTable(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.path = os.path.join(self.testdir, 'health', 'proxy.health')
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=1)
+
+    def test_shared(self):
+        table1 = node_health.NodeHealthTable(self.path, slots=16)
+        table2 = node_health.NodeHealthTable(self.path, slots=16)
+        self.assertEquals(os.path.getsize(self.path),
+                          node_health.HEADER.size +
+                          node_health.SLOT.size * 16)
+        self.assertEquals(table2.get_errors('1.2.3.4:6000/sda'), (0, 0.0))
+        table1.set_errors('1.2.3.4:6000/sda', 3, 1234.5)
+        self.assertEquals(table2.get_errors('1.2.3.4:6000/sda'), (3, 1234.5))
+        self.assertEquals(table2.get_timing('1.2.3.4:6000/sda'), (0.0, 0.0))
+        table2.set_timing('1.2.3.4', 0.25, 1300.0)
+        self.assertEquals(table1.get_timing('1.2.3.4'), (0.25, 1300.0))
+        self.assertEquals(table1.get_errors('1.2.3.4'), (0, 0.0))
+        self.assertEquals(table1.get_latency('1.2.3.4:6000/sda'),
+                          (0.0, 0.0, 0.0, 0.0))
+        table1.set_latency('1.2.3.4:6000/sda', connect_ewma=0.5,
+                           latency_updated=1234.0)
+        table2.set_latency('1.2.3.4:6000/sda', ejected_until=1300.0)
+        self.assertEquals(table1.get_latency('1.2.3.4:6000/sda'),
+                          (0.5, 0.0, 1234.0, 1300.0))
+        self.assertEquals(table2.get_errors('1.2.3.4:6000/sda'), (3, 1234.5))
+        table1.set_errors('1.2.3.4:6000/sda', 0, 0.0)
+        self.assertEquals(table2.get_errors('1.2.3.4:6000/sda'), (0, 0.0))
+        # a table mapped again keeps its records
+        table1.close()
+        table1 = node_health.NodeHealthTable(self.path, slots=16)
+        self.assertEquals(table1.get_timing('1.2.3.4'), (0.25, 1300.0))
+
+    def test_full(self):
+        logger = FakeLogger()
+        table = node_health.NodeHealthTable(self.path, slots=4, logger=logger)
+        other = node_health.NodeHealthTable(self.path, slots=4)
+        for i in xrange(4):
+            table.set_errors(str(i), i + 1, 1.0)
+        self.assertEquals(logger.log_dict['warning'], [])
+        # keys without a slot are kept by the worker itself
+        table.set_errors('4', 5, 1.0)
+        table.set_timing('4', 0.5, 2.0)
+        table.set_errors('5', 6, 1.0)
+        for i in xrange(4):
+            self.assertEquals(table.get_errors(str(i)), (i + 1, 1.0))
+        self.assertEquals(table.get_errors('4'), (5, 1.0))
+        self.assertEquals(table.get_timing('4'), (0.5, 2.0))
+        self.assertEquals(table.get_errors('5'), (6, 1.0))
+        self.assertEquals(other.get_errors('4'), (0, 0.0))
+        # which is warned about once, and counted each time
+        self.assertEquals(len(logger.log_dict['warning']), 1)
+        self.assertTrue('no slot left for 4' in
+                        logger.log_dict['warning'][0][0][0] %
+                        logger.log_dict['warning'][0][0][1])
+        self.assertEquals(logger.get_increments(),
+                          ['node_health.overflows'] * 2)
+
+    def test_max_probes(self):
+        table = node_health.NodeHealthTable(self.path, slots=1024)
+        looked_at = []
+        orig_unpack_from = node_health.struct.unpack_from
+
+        def unpack_from(fmt, buf, offset=0):
+            looked_at.append(offset)
+            return orig_unpack_from(fmt, buf, offset)
+
+        # fill the table, so every slot is looked at for an unknown key
+        # were it not for MAX_PROBES
+        for offset in xrange(node_health.HEADER.size, table.size,
+                             node_health.SLOT.size):
+            node_health.SLOT.pack_into(table.map, offset, 1,
+                                       *node_health.EMPTY[1:])
+        node_health.struct.unpack_from = unpack_from
+        try:
+            self.assertEquals(table.get_errors('a'), (0, 0.0))
+        finally:
+            node_health.struct.unpack_from = orig_unpack_from
+        self.assertEquals(len(looked_at), node_health.MAX_PROBES)
+
+    def test_resized(self):
+        table1 = node_health.NodeHealthTable(self.path, slots=16)
+        table1.set_errors('a', 1, 1.0)
+        table2 = node_health.NodeHealthTable(self.path, slots=32)
+        self.assertEquals(table2.get_errors('a'), (0, 0.0))
+        # the old table is replaced, not truncated under its users
+        self.assertEquals(table1.get_errors('a'), (1, 1.0))
+        self.assertEquals(os.path.getsize(self.path),
+                          node_health.HEADER.size +
+                          node_health.SLOT.size * 32)
+
+    def test_bad_header(self):
+        table = node_health.NodeHealthTable(self.path, slots=16)
+        table.set_errors('a', 1, 1.0)
+        table.close()
+        with open(self.path, 'r+b') as fp:
+            fp.write('junk')
+        table = node_health.NodeHealthTable(self.path, slots=16)
+        self.assertEquals(table.get_errors('a'), (0, 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+# Copyright (c) 2010-2013 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import signal
+import sys
+import time
+import unittest
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from swift.common import profiler
+
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.dump_dir = os.path.join(self.testdir, 'profile')
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=1)
+
+    def test_sample(self):
+        prof = profiler.SamplingProfiler('object-server', self.dump_dir,
+                                         max_stacks=2, max_depth=3)
+
+        def inner():
+            return sys._getframe()
+
+        def outer():
+            return inner()
+
+        frame = outer()
+        prof.sample(frame)
+        prof.sample(frame)
+        code = frame.f_code
+        inner_name = '%s:%d(inner)' % (code.co_filename, code.co_firstlineno)
+        code = frame.f_back.f_code
+        outer_name = '%s:%d(outer)' % (code.co_filename, code.co_firstlineno)
+        stack = ';'.join(('[truncated]', sys._getframe().f_code.co_filename +
+                          ':%d(test_sample)' %
+                          sys._getframe().f_code.co_firstlineno,
+                          outer_name, inner_name))
+        self.assertEquals(dict(prof.stacks), {stack: 2})
+        prof.sample(frame.f_back)
+        self.assertEquals(len(prof.stacks), 2)
+        # once max_stacks are counted, other stacks go to [other]
+        prof.sample(sys._getframe())
+        prof.sample(frame)
+        self.assertEquals(len(prof.stacks), 3)
+        self.assertEquals(prof.stacks['[other]'], 1)
+        self.assertEquals(prof.stacks[stack], 3)
+
+    def test_dump_and_read(self):
+        prof = profiler.SamplingProfiler('object-server', self.dump_dir)
+        prof.stacks.update({'a;b': 2, 'a;c': 1})
+        prof.dump()
+        path = os.path.join(self.dump_dir,
+                            'object-server-%d.folded' % os.getpid())
+        self.assertEquals(open(path).read(), 'a;b 2\na;c 1\n')
+        other = profiler.SamplingProfiler('object-replicator', self.dump_dir)
+        other.stacks.update({'a;b': 3, 'd': 4})
+        other.dump()
+        self.assertEquals(profiler.read_profiles(self.dump_dir),
+                          {'a;b': 5, 'a;c': 1, 'd': 4})
+        self.assertEquals(
+            profiler.read_profiles(self.dump_dir, 'object-replicator'),
+            {'a;b': 3, 'd': 4})
+        self.assertEquals(profiler.read_profiles(self.dump_dir, 'nothing'),
+                          {})
+        self.assertEquals(
+            profiler.read_profiles(os.path.join(self.testdir, 'nothing')),
+            {})
+
+    def test_read_profiles_of_running_processes(self):
+        os.mkdir(self.dump_dir)
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        with open(os.path.join(self.dump_dir,
+                               'object-server-%d.folded' % pid), 'w') as fp:
+            fp.write('a;b 2\n')
+        with open(os.path.join(self.dump_dir,
+                               'object-server-%d.folded' % os.getpid()),
+                  'w') as fp:
+            fp.write('a;c 1\n')
+        self.assertEquals(profiler.read_profiles(self.dump_dir), {'a;c': 1})
+
+    def test_start_and_stop(self):
+        self.assertEquals(
+            profiler.start_sampling_profiler(
+                {'recon_cache_path': self.testdir}, 'object-server'),
+            None)
+        orig_sigusr2 = signal.getsignal(signal.SIGUSR2)
+        try:
+            prof = profiler.start_sampling_profiler(
+                {'recon_cache_path': self.testdir, 'sampling_profiler': 'yes',
+                 'sampling_profiler_interval': '0.001'}, 'object-server')
+            begin = time.time()
+            while not prof.stacks and time.time() - begin < 5:
+                sum(xrange(10000))
+            os.kill(os.getpid(), signal.SIGUSR2)
+            path = os.path.join(self.dump_dir,
+                                'object-server-%d.folded' % os.getpid())
+            self.assertTrue(os.path.exists(path))
+            prof.stop()
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGUSR2, orig_sigusr2)
+        self.assertTrue(any('test_start_and_stop' in stack
+                            for stack in prof.stacks))
+        samples = sum(prof.stacks.itervalues())
+        self.assertEquals(
+            sum(int(line.rsplit(' ', 1)[1]) for line in open(path)), samples)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -70,6 +70,50 @@ class TestHeaderEnvironProxy(unittest.TestCase):
             set(proxy.keys()),
             set(('Content-Length', 'Content-Type', 'Something-Else')))
 
+    def test_items(self):
+        environ = {'wsgi.input': None, 'REQUEST_METHOD': 'GET'}
+        proxy = swift.common.swob.HeaderEnvironProxy(environ)
+        proxy['Content-Length'] = 20
+        proxy['Content-Type'] = 'text/plain'
+        proxy['Something-Else'] = 'somevalue'
+        expected = {'Content-Length': '20', 'Content-Type': 'text/plain',
+                    'Something-Else': 'somevalue'}
+        self.assertEquals(dict(proxy.items()), expected)
+        self.assertEquals(dict(proxy.iteritems()), expected)
+        self.assertEquals(dict(proxy), expected)
+        self.assertEquals(set(proxy), set(expected))
+        self.assertEquals(len(proxy), 3)
+        # the headers may be changed while going through them
+        for key, value in proxy.iteritems():
+            del proxy[key]
+        self.assertEquals(environ, {'wsgi.input': None,
+                                    'REQUEST_METHOD': 'GET'})
+
+    def test_get(self):
+        environ = {}
+        proxy = swift.common.swob.HeaderEnvironProxy(environ)
+        proxy['Content-Length'] = 20
+        proxy['Something-Else'] = 'somevalue'
+        self.assertEquals(proxy.get('content-length'), '20')
+        self.assertEquals(proxy.get('something-else'), 'somevalue')
+        self.assertEquals(proxy.get('nothing'), None)
+        self.assertEquals(proxy.get('nothing', 'default'), 'default')
+
+    def test_cached_names_limited(self):
+        orig_max = swift.common.swob.MAX_CACHED_HEADERS
+        try:
+            swift.common.swob.MAX_CACHED_HEADERS = \
+                len(swift.common.swob._environ_keys)
+            environ = {}
+            proxy = swift.common.swob.HeaderEnvironProxy(environ)
+            proxy['Not-Cached-Header'] = 'value'
+            self.assertEquals(environ, {'HTTP_NOT_CACHED_HEADER': 'value'})
+            self.assertEquals(proxy.items(), [('Not-Cached-Header', 'value')])
+            self.assertFalse(
+                'Not-Cached-Header' in swift.common.swob._environ_keys)
+        finally:
+            swift.common.swob.MAX_CACHED_HEADERS = orig_max
+
 
 class TestHeaderKeyDict(unittest.TestCase):
     def test_case_insensitive(self):
@@ -94,6 +138,16 @@ class TestHeaderKeyDict(unittest.TestCase):
         headers.update([('Content-Type', 'text/plain')])
         self.assertEquals(headers['Content-Length'], '0')
         self.assertEquals(headers['Content-Type'], 'text/plain')
+        headers.update(swift.common.swob.HeaderKeyDict({'X-Size': 10}))
+        self.assertEquals(headers['x-size'], '10')
+        proxy = swift.common.swob.HeaderEnvironProxy({})
+        proxy['X-Object-Meta-Color'] = u'\u00e9'
+        headers.update(proxy)
+        self.assertEquals(headers['X-Object-Meta-Color'], '\xc3\xa9')
+        self.assertEquals(
+            dict(headers), {'content-length': '0',
+                            'content-type': 'text/plain', 'x-size': '10',
+                            'x-object-meta-color': '\xc3\xa9'})
 
     def test_get(self):
         headers = swift.common.swob.HeaderKeyDict()
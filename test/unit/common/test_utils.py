@@ -35,6 +35,7 @@ from StringIO import StringIO
 from functools import partial
 from tempfile import TemporaryFile, NamedTemporaryFile
 
+import eventlet
 from mock import patch
 
 from swift.common.exceptions import (Timeout, MessageTimeout,
@@ -647,6 +648,21 @@ class TestUtils(unittest.TestCase):
         finally:
             utils.HASH_PATH_PREFIX = _prefix
 
+    def test_shard_names(self):
+        self.assertEquals(utils.get_shard_account('AUTH_test'),
+                          '.shards_AUTH_test')
+        self.assertEquals(utils.get_shard_container('a', 'c', 3),
+                          utils.hash_path('a', 'c') + '-3')
+
+    def test_find_shard(self):
+        self.assertEquals(utils.find_shard('x', []), 0)
+        shard_points = ['f', 'p']
+        self.assertEquals(utils.find_shard('a', shard_points), 0)
+        self.assertEquals(utils.find_shard('f', shard_points), 0)
+        self.assertEquals(utils.find_shard('f0', shard_points), 1)
+        self.assertEquals(utils.find_shard('p', shard_points), 1)
+        self.assertEquals(utils.find_shard('q', shard_points), 2)
+
     def test_load_libc_function(self):
         self.assert_(callable(
             utils.load_libc_function('printf')))
@@ -1032,6 +1048,17 @@ log_name = %(yarr)s'''
         self.assertEqual(
             utils.rsync_ip('::ffff:192.0.2.128'), '[::ffff:192.0.2.128]')
 
+    def test_coalesce_chunks(self):
+        self.assertEquals(list(utils.coalesce_chunks([])), [])
+        self.assertEquals(list(utils.coalesce_chunks(['a', 'b', 'c'])),
+                          ['abc'])
+        self.assertEquals(
+            list(utils.coalesce_chunks(['ab', 'cd', 'e', 'fgh', 'i'], 4)),
+            ['abcd', 'efgh', 'i'])
+        self.assertEquals(
+            list(utils.coalesce_chunks(iter(['abcdef', 'g']), 4)),
+            ['abcdef', 'g'])
+
     def test_fallocate_reserve(self):
 
         class StatVFS(object):
@@ -1275,6 +1302,84 @@ class TestStatsdLogging(unittest.TestCase):
         self.assertTrue(payload.endswith("|@%s" % effective_sample_rate),
                        payload)
 
+    def test_buffered(self):
+        logger = utils.get_logger({
+            'log_statsd_host': 'some.host.com',
+            'log_statsd_flush_interval': '10',
+            'log_statsd_max_packet_size': '100',
+        }, 'some-name')
+        mock_socket = MockUdpSocket()
+        statsd_client = logger.logger.statsd_client
+        statsd_client._open_shared_socket = lambda *_: mock_socket
+        orig_pid = utils.StatsdClient._shared_sock_pid
+        utils.StatsdClient._shared_sock_pid = None
+        try:
+            logger.increment('tribbles')
+            logger.timing('timed', 12.5)
+            logger.increment('tribbles')
+            logger.update_stats('bytes', 1024)
+            logger.update_stats('tribbles', 3)
+            self.assertEqual(mock_socket.sent, [])
+            statsd_client.flush()
+            self.assertEqual(len(mock_socket.sent), 1)
+            payload, target = mock_socket.sent[0]
+            self.assertEqual(target, ('some.host.com', 8125))
+            lines = payload.split('\n')
+            self.assertEqual(lines[0], 'some-name.timed:12.5|ms')
+            self.assertEqual(sorted(lines[1:]),
+                             ['some-name.bytes:1024|c',
+                              'some-name.tribbles:5|c'])
+            # nothing left to send
+            statsd_client.flush()
+            self.assertEqual(len(mock_socket.sent), 1)
+
+            # a full datagram goes out right away
+            for i in xrange(5):
+                logger.timing('timed%d' % i, 1000)
+            self.assertEqual(len(mock_socket.sent), 2)
+            self.assertEqual(mock_socket.sent[1][0].split('\n'),
+                             ['some-name.timed%d:1000|ms' % i
+                              for i in xrange(4)])
+            statsd_client.flush()
+            self.assertEqual(len(mock_socket.sent), 3)
+            self.assertEqual(mock_socket.sent[2][0],
+                             'some-name.timed4:1000|ms')
+
+            # each datagram holds as many metrics as fit
+            statsd_client._max_packet_size = 1000
+            for i in xrange(10):
+                logger.timing('timed%d' % i, 1000)
+            statsd_client._max_packet_size = 100
+            statsd_client.flush()
+            self.assertEqual([len(payload.split('\n'))
+                              for payload, target in mock_socket.sent[3:]],
+                             [4, 4, 2])
+            for payload, target in mock_socket.sent:
+                self.assertTrue(len(payload) <= 100, payload)
+        finally:
+            utils.StatsdClient._shared_sock_pid = orig_pid
+
+    def test_buffered_flush_interval(self):
+        logger = utils.get_logger({
+            'log_statsd_host': 'some.host.com',
+            'log_statsd_flush_interval': '0.01',
+        }, 'some-name')
+        mock_socket = MockUdpSocket()
+        statsd_client = logger.logger.statsd_client
+        statsd_client._open_shared_socket = lambda *_: mock_socket
+        orig_pid = utils.StatsdClient._shared_sock_pid
+        utils.StatsdClient._shared_sock_pid = None
+        try:
+            logger.increment('tribbles')
+            logger.increment('tribbles')
+            self.assertEqual(mock_socket.sent, [])
+            eventlet.sleep(0.05)
+            self.assertEqual([payload for payload, target in
+                              mock_socket.sent],
+                             ['some-name.tribbles:2|c'])
+        finally:
+            utils.StatsdClient._shared_sock_pid = orig_pid
+
     def test_timing_stats(self):
         class MockController(object):
             def __init__(self, status):
@@ -1312,6 +1417,26 @@ class TestStatsdLogging(unittest.TestCase):
         self.assertEquals(mock_controller.args[0], 'METHOD.errors.timing')
         self.assert_(mock_controller.args[1] > 0)
 
+    def test_time_stage(self):
+        env = {}
+        with utils.time_stage(env, 'nothing'):
+            pass
+        self.assertEquals(env, {})
+
+        timings = utils.StageTimings()
+        env = {'swift.stage_timings': timings}
+        with patch('time.time', side_effect=[10.0, 10.25, 11.0, 11.5]):
+            with utils.time_stage(env, 'auth'):
+                pass
+            try:
+                with utils.time_stage(env, 'put_upload'):
+                    raise ValueError()
+            except ValueError:
+                pass
+        self.assertEquals(timings.stages,
+                          [('auth', 0.25), ('put_upload', 0.5)])
+        self.assertEquals(str(timings), 'auth:0.2500,put_upload:0.5000')
+
 
 class TestStatsdLoggingDelegation(unittest.TestCase):
     def setUp(self):
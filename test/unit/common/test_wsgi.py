@@ -24,8 +24,13 @@ from StringIO import StringIO
 from collections import defaultdict
 from urllib import quote
 
+import eventlet
+from eventlet import listen
+
+from test.unit import FakeLogger
 from swift.common.swob import Request
 from swift.common import wsgi
+from swift.common.utils import NullLogger
 
 
 class TestWSGI(unittest.TestCase):
@@ -266,5 +271,90 @@ class TestWSGIContext(unittest.TestCase):
         self.assertEquals(''.join(it), 'Ok\n')
 
 
+class TestSwiftHttpProtocol(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = FakeLogger()
+
+        class Protocol(wsgi.SwiftHttpProtocol):
+            max_requests = 3
+            idle_timeout = 0.1
+            logger = self.logger
+
+        def app(env, start_response):
+            start_response('200 OK', [('Content-Length', '2')])
+            return ['ok']
+
+        self.sock = listen(('127.0.0.1', 0))
+        self.server = eventlet.spawn(
+            eventlet.wsgi.server, self.sock, app, NullLogger(),
+            protocol=Protocol)
+
+    def tearDown(self):
+        self.server.kill()
+        self.sock.close()
+
+    def _connect(self):
+        sock = eventlet.connect(self.sock.getsockname())
+        return sock, sock.makefile()
+
+    def _read_response(self, fd):
+        headers = {}
+        status = fd.readline()
+        for line in iter(fd.readline, '\r\n'):
+            key, value = line.split(':', 1)
+            headers[key.lower()] = value.strip()
+        return status, headers, fd.read(int(headers['content-length']))
+
+    def test_pipelined_requests_and_request_limit(self):
+        sock, fd = self._connect()
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n' * 4)
+        fd.flush()
+        for i in xrange(2):
+            status, headers, body = self._read_response(fd)
+            self.assertEquals(status, 'HTTP/1.1 200 OK\r\n')
+            self.assertFalse('connection' in headers)
+            self.assertEquals(body, 'ok')
+        status, headers, body = self._read_response(fd)
+        self.assertEquals(headers['connection'], 'close')
+        self.assertEquals(body, 'ok')
+        # the fourth request is not served
+        self.assertEquals(fd.read(), '')
+        self.assertEquals(self.logger.get_increment_counts(),
+                          {'client_connections': 1,
+                           'client_connection_reuses': 2})
+
+    def test_idle_timeout(self):
+        sock, fd = self._connect()
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        status, headers, body = self._read_response(fd)
+        self.assertEquals(body, 'ok')
+        eventlet.sleep(0.05)
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        status, headers, body = self._read_response(fd)
+        self.assertEquals(body, 'ok')
+        with eventlet.Timeout(1):
+            self.assertEquals(fd.read(), '')
+        self.assertEquals(self.logger.get_increment_counts(),
+                          {'client_connections': 1,
+                           'client_connection_reuses': 1,
+                           'client_idle_timeouts': 1})
+
+    def test_http_1_0(self):
+        sock, fd = self._connect()
+        fd.write('GET / HTTP/1.0\r\n\r\n')
+        fd.flush()
+        status, headers, body = self._read_response(fd)
+        self.assertEquals(status, 'HTTP/1.1 200 OK\r\n')
+        self.assertEquals(headers['connection'], 'close')
+        self.assertEquals(fd.read(), '')
+        sock, fd = self._connect()
+        fd.write('GET / HTTP/1.0\r\nConnection: keep-alive\r\n\r\n')
+        fd.flush()
+        status, headers, body = self._read_response(fd)
+        self.assertEquals(headers['connection'], 'keep-alive')
+
 if __name__ == '__main__':
     unittest.main()
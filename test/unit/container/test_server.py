@@ -117,6 +117,39 @@ class TestContainerController(unittest.TestCase):
         self.assertEquals(int(response.headers['x-container-bytes-used']), 42)
         self.assertEquals(int(response.headers['x-container-object-count']), 1)
 
+    def test_HEAD_sharded(self):
+        req = Request.blank('/sda1/p/a/c', environ={'REQUEST_METHOD': 'PUT',
+            'HTTP_X_TIMESTAMP': '0'})
+        self.controller.PUT(req)
+        response = self.controller.HEAD(req)
+        self.assert_('x-container-shard-count' not in response.headers)
+        broker = self.controller._get_container_broker('sda1', 'p', 'a', 'c')
+        broker.set_shard_points(['m'], normalize_timestamp(1))
+        broker.set_shard_stats(5, 50, normalize_timestamp(1))
+        response = self.controller.HEAD(req)
+        self.assertEquals(response.headers['x-container-shard-count'], '2')
+        self.assertEquals(int(response.headers['x-container-object-count']), 5)
+        self.assertEquals(int(response.headers['x-container-bytes-used']), 50)
+        self.assert_('x-container-shard-points' not in response.headers)
+
+    def test_GET_shard_points(self):
+        req = Request.blank('/sda1/p/a/c', environ={'REQUEST_METHOD': 'PUT',
+            'HTTP_X_TIMESTAMP': '0'})
+        self.controller.PUT(req)
+        req = Request.blank('/sda1/p/a/c', environ={'REQUEST_METHOD': 'GET'},
+                            headers={'X-Container-Get-Shard-Points': 'true'})
+        resp = self.controller.GET(req)
+        self.assertEquals(resp.status_int, 200)
+        self.assertEquals(simplejson.loads(resp.body), [])
+        broker = self.controller._get_container_broker('sda1', 'p', 'a', 'c')
+        broker.set_shard_points(['g', 'm'], normalize_timestamp(1))
+        resp = self.controller.GET(req)
+        self.assertEquals(simplejson.loads(resp.body), ['g', 'm'])
+        req = Request.blank('/sda1/p/a/c', environ={'REQUEST_METHOD': 'GET'})
+        resp = self.controller.GET(req)
+        self.assertEquals(resp.status_int, 204)
+        self.assertEquals(resp.headers['x-container-shard-count'], '3')
+
     def test_HEAD_not_found(self):
         req = Request.blank('/sda1/p/a/c', environ={'REQUEST_METHOD': 'HEAD'})
         resp = self.controller.HEAD(req)
@@ -590,6 +623,96 @@ class TestContainerController(unittest.TestCase):
         resp = self.controller.GET(req)
         self.assertEquals(resp.status_int, 404)
 
+    def test_pending_flusher(self):
+        controller = container_server.ContainerController(
+            {'devices': self.testdir, 'mount_check': 'false',
+             'pending_flush_interval': '0'})
+        req = Request.blank('/sda1/p/a/c',
+            environ={'REQUEST_METHOD': 'PUT'}, headers={'X-Timestamp': '1'})
+        self.assertEquals(controller.PUT(req).status_int, 201)
+        req = Request.blank('/sda1/p/a/c/o',
+            environ={'REQUEST_METHOD': 'PUT', 'HTTP_X_TIMESTAMP': '2',
+                     'HTTP_X_SIZE': 1, 'HTTP_X_CONTENT_TYPE': 'text/plain',
+                     'HTTP_X_ETAG': 'x'})
+        self.assertEquals(controller.PUT(req).status_int, 201)
+        self.assertEquals(controller.pending_dbs, {})
+        self.assertEquals(controller.pending_flusher, None)
+
+        spawned = []
+
+        def fake_spawn(func):
+            spawned.append(func)
+            return 'flusher'
+
+        orig_spawn = container_server.spawn
+        try:
+            container_server.spawn = fake_spawn
+            req = Request.blank('/sda1/p/a/c/o',
+                environ={'REQUEST_METHOD': 'PUT', 'HTTP_X_TIMESTAMP': '3',
+                         'HTTP_X_SIZE': 1, 'HTTP_X_CONTENT_TYPE': 'text/plain',
+                         'HTTP_X_ETAG': 'x'})
+            self.assertEquals(self.controller.PUT(req).status_int, 201)
+            req = Request.blank('/sda1/p/a/c/o2',
+                environ={'REQUEST_METHOD': 'DELETE'},
+                headers={'X-Timestamp': normalize_timestamp(4)})
+            self.assertEquals(self.controller.DELETE(req).status_int, 204)
+        finally:
+            container_server.spawn = orig_spawn
+        self.assertEquals(spawned, [self.controller._run_pending_flusher])
+        broker = self.controller._get_container_broker('sda1', 'p', 'a', 'c')
+        self.assertEquals(self.controller.pending_dbs.keys(),
+                          [broker.db_file])
+        self.assert_(os.path.getsize(broker.pending_file))
+
+        # neither big nor old enough yet
+        self.controller.flush_pending()
+        self.assert_(os.path.getsize(broker.pending_file))
+        self.assertEquals(self.controller.pending_dbs.keys(),
+                          [broker.db_file])
+
+        # someone else is merging it
+        orig_commit_pending = container_server.ContainerBroker.commit_pending
+        lock_timeouts = []
+        try:
+
+            def locked(broker):
+                lock_timeouts.append(broker.pending_timeout)
+                raise container_server.LockTimeout(None, broker.pending_file)
+
+            container_server.ContainerBroker.commit_pending = locked
+            self.controller.pending_flush_size = 1
+            self.controller.pending_flush_lock_timeout = 0.25
+            self.controller.flush_pending()
+        finally:
+            container_server.ContainerBroker.commit_pending = \
+                orig_commit_pending
+        self.assertEquals(lock_timeouts, [0.25])
+        self.assertEquals(self.controller.pending_dbs.keys(),
+                          [broker.db_file])
+
+        self.controller.pending_flush_size = 16384
+        self.controller.pending_flush_age = 0
+        self.controller.flush_pending()
+        self.assertEquals(os.path.getsize(broker.pending_file), 0)
+        self.assertEquals(self.controller.pending_dbs, {})
+        with broker.get() as conn:
+            self.assertEquals([tuple(row) for row in conn.execute(
+                'SELECT name, created_at FROM object ORDER BY name')],
+                [('o', normalize_timestamp(3)),
+                 ('o2', normalize_timestamp(4))])
+
+        # containers gone from disk are forgotten
+        self.controller.pending_dbs['/does/not/exist.db'] = 0
+        self.controller.flush_pending()
+        self.assertEquals(self.controller.pending_dbs, {})
+
+        # the flusher stops when there is nothing left to flush
+        self.controller.pending_flush_interval = 0.01
+        self.controller.pending_dbs['/does/not/exist.db'] = 0
+        self.controller._run_pending_flusher()
+        self.assertEquals(self.controller.pending_dbs, {})
+        self.assertEquals(self.controller.pending_flusher, None)
+
     def test_DELETE_account_update(self):
         bindsock = listen(('127.0.0.1', 0))
 
@@ -873,6 +996,74 @@ class TestContainerController(unittest.TestCase):
         self.assertEquals(eval(resp.body), json_body)
         self.assertEquals(resp.charset, 'utf-8')
 
+    def test_GET_json_list_deleted(self):
+        req = Request.blank('/sda1/p/a/c', environ={
+            'REQUEST_METHOD': 'PUT', 'HTTP_X_TIMESTAMP': '0'})
+        self.controller.PUT(req)
+        for name, method, timestamp in (('0', 'PUT', '1'),
+                                        ('1', 'PUT', '1'),
+                                        ('1', 'DELETE', '2.5')):
+            req = Request.blank('/sda1/p/a/c/%s' % name, environ={
+                'REQUEST_METHOD': method, 'HTTP_X_TIMESTAMP': timestamp,
+                'HTTP_X_CONTENT_TYPE': 'text/plain', 'HTTP_X_ETAG': 'x',
+                'HTTP_X_SIZE': 0})
+            self.controller.__call__(req.environ, lambda *args: None)
+        req = Request.blank('/sda1/p/a/c?format=json',
+                            headers={'X-Container-List-Deleted': 'true'})
+        resp = self.controller.GET(req)
+        self.assertEquals(simplejson.loads(resp.body), [
+            {'name': '0', 'hash': 'x', 'bytes': 0,
+             'content_type': 'text/plain',
+             'last_modified': '1970-01-01T00:00:01.000000'},
+            {'name': '1', 'deleted': 1,
+             'last_modified': '1970-01-01T00:00:02.500000'}])
+        # only for JSON listings
+        req = Request.blank('/sda1/p/a/c',
+                            headers={'X-Container-List-Deleted': 'true'})
+        resp = self.controller.GET(req)
+        self.assertEquals(resp.body, '0\n')
+
+    def test_GET_json_streamed(self):
+        req = Request.blank('/sda1/p/a/jsonc', environ={
+            'REQUEST_METHOD': 'PUT', 'HTTP_X_TIMESTAMP': '0'})
+        resp = self.controller.PUT(req)
+        for i in xrange(3):
+            req = Request.blank('/sda1/p/a/jsonc/%s' % i, environ={
+                'REQUEST_METHOD': 'PUT', 'HTTP_X_TIMESTAMP': '1',
+                'HTTP_X_CONTENT_TYPE': 'text/plain', 'HTTP_X_ETAG': 'x',
+                'HTTP_X_SIZE': 0})
+            resp = self.controller.PUT(req)
+            self.assertEquals(resp.status_int, 201)
+        req = Request.blank('/sda1/p/a/jsonc?format=json',
+                            environ={'REQUEST_METHOD': 'GET'})
+        resp = self.controller.GET(req)
+        self.assertEquals(resp.status_int, 200)
+        self.assertEquals(resp.content_length, None)
+        self.assertFalse(isinstance(resp.app_iter, (list, tuple)))
+        self.assertEquals([o['name'] for o in simplejson.loads(resp.body)],
+                          ['0', '1', '2'])
+
+    def test_timestamp_to_last_modified(self):
+        self.assertEquals(
+            container_server.timestamp_to_last_modified('0000000001.00000'),
+            '1970-01-01T00:00:01.000000')
+        self.assertEquals(
+            container_server.timestamp_to_last_modified('1.5'),
+            '1970-01-01T00:00:01.500000')
+        self.assertEquals(
+            container_server.timestamp_to_last_modified('1364489812'),
+            '2013-03-28T16:56:52.000000')
+        cache = {}
+        self.assertEquals(
+            container_server.timestamp_to_last_modified('1364489812.12345',
+                                                        cache),
+            '2013-03-28T16:56:52.123450')
+        self.assertEquals(cache, {'1364489812': '2013-03-28T16:56:52'})
+        self.assertEquals(
+            container_server.timestamp_to_last_modified('1364489812.00001',
+                                                        cache),
+            '2013-03-28T16:56:52.000010')
+
     def test_GET_xml(self):
         # make a container
         req = Request.blank('/sda1/p/a/xmlc', environ={'REQUEST_METHOD': 'PUT',
@@ -0,0 +1,216 @@
+# Copyright (c) 2010-2013 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from test.unit import FakeLogger, fake_http_connect
+from swift.container import sharder
+from swift.common import utils
+from swift.common.db import ContainerBroker
+from swift.common.utils import normalize_timestamp
+
+
+utils.HASH_PATH_SUFFIX = 'endcap'
+utils.HASH_PATH_PREFIX = 'endcap'
+
+
+class FakeRing(object):
+
+    def __init__(self):
+        self.devs = [{'ip': '10.0.0.%s' % x, 'port': 1000 + x, 'device': 'sda'}
+                     for x in xrange(3)]
+
+    def get_nodes(self, account, container=None, obj=None):
+        return 1, list(self.devs)
+
+
+class FakeResponse(object):
+
+    def __init__(self, status):
+        self.status = status
+
+
+class FakeReplConnection(object):
+
+    status = 202
+    merged = []
+
+    def __init__(self, node, partition, hash_, logger):
+        self.node = node
+        self.hash_ = hash_
+
+    def replicate(self, *args):
+        self.merged.append((self.node, self.hash_, args))
+        return FakeResponse(self.status)
+
+
+class TestContainerSharder(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = ContainerBroker(':memory:', account='a', container='c')
+        self.broker.initialize(normalize_timestamp('1'))
+        for name in 'abcde':
+            self.broker.put_object(name, normalize_timestamp('2'), 10,
+                                   'text/plain',
+                                   'd41d8cd98f00b204e9800998ecf8427e')
+        self.cs = sharder.ContainerSharder(
+            {'shard_container_size': '4'}, container_ring=FakeRing())
+        self.cs.logger = FakeLogger()
+        self.cs._myips = ['10.0.0.0']
+        self.cs._myport = 1000
+        FakeReplConnection.status = 202
+        FakeReplConnection.merged = []
+        self.orig_ContainerBroker = sharder.ContainerBroker
+        self.orig_http_connect = sharder.http_connect
+        self.orig_ReplConnection = sharder.ReplConnection
+        self.orig_direct_head_container = sharder.direct_head_container
+        sharder.ContainerBroker = lambda path: self.broker
+        sharder.ReplConnection = FakeReplConnection
+        self.heads = []
+
+        def fake_direct_head_container(node, part, account, container,
+                                       **kwargs):
+            self.heads.append((account, container))
+            return {'x-container-object-count': '2',
+                    'x-container-bytes-used': '20'}
+
+        sharder.direct_head_container = fake_direct_head_container
+
+    def tearDown(self):
+        sharder.ContainerBroker = self.orig_ContainerBroker
+        sharder.http_connect = self.orig_http_connect
+        sharder.ReplConnection = self.orig_ReplConnection
+        sharder.direct_head_container = self.orig_direct_head_container
+
+    def test_init(self):
+        cs = sharder.ContainerSharder({}, container_ring=FakeRing())
+        self.assertEquals(cs.shard_container_size, 1000000)
+        self.assertEquals(cs.shard_batch_size, 1000)
+        self.assertEquals(cs.interval, 1800)
+
+    def test_container_shard_not_db(self):
+        self.cs.container_shard('isa.notdb')
+        self.assertEquals(self.broker.get_shard_points(), [])
+        self.assertEquals(self.cs.container_failures, 0)
+
+    def test_container_shard_not_my_db(self):
+        self.cs._myips = ['10.0.0.9']
+        self.cs.container_shard('isa.db')
+        self.assertEquals(self.broker.get_shard_points(), [])
+        self.assertEquals(FakeReplConnection.merged, [])
+
+    def test_container_shard_small(self):
+        self.cs.shard_container_size = 10
+        self.cs.container_shard('isa.db')
+        self.assertEquals(self.broker.get_shard_points(), [])
+        self.assertEquals(FakeReplConnection.merged, [])
+
+    def test_container_shard_only_first_node_shards(self):
+        self.cs._myips = ['10.0.0.1']
+        self.cs._myport = 1001
+        self.cs.container_shard('isa.db')
+        self.assertEquals(self.broker.get_shard_points(), [])
+
+    def test_container_shard_skips_shards(self):
+        self.broker.account = '.shards_a'
+        with self.broker.get() as conn:
+            conn.execute("UPDATE container_stat SET account = '.shards_a'")
+            conn.commit()
+        self.cs.container_shard('isa.db')
+        self.assertEquals(self.broker.get_shard_points(), [])
+
+    def test_container_shard(self):
+        puts = []
+
+        def fake_connect(*args, **kwargs):
+            puts.append(args)
+            return fake_http_connect(201)(*args, **kwargs)
+
+        sharder.http_connect = fake_connect
+        self.cs.container_shard('isa.db')
+        self.assertEquals(self.cs.container_failures, 0)
+        self.assertEquals(self.cs.containers_sharded, 1)
+        self.assertEquals(self.broker.get_shard_points(), ['b', 'd'])
+        shard_paths = ['/.shards_a/%s' % utils.get_shard_container('a', 'c', i)
+                       for i in xrange(3)]
+        self.assertEquals(len(puts), 9)
+        self.assertEquals(sorted(set(p[5] for p in puts)), sorted(shard_paths))
+        self.assertEquals(set(p[4] for p in puts), set(['PUT']))
+        merged = {}
+        for node, hsh, args in FakeReplConnection.merged:
+            self.assertEquals(args[0], 'merge_items')
+            self.assertEquals(args[2], None)
+            merged.setdefault(hsh, set()).update(o['name'] for o in args[1])
+        self.assertEquals(len(FakeReplConnection.merged), 9)
+        self.assertEquals(merged, {
+            utils.hash_path('.shards_a',
+                            utils.get_shard_container('a', 'c', 0)):
+            set(['a', 'b']),
+            utils.hash_path('.shards_a',
+                            utils.get_shard_container('a', 'c', 1)):
+            set(['c', 'd']),
+            utils.hash_path('.shards_a',
+                            utils.get_shard_container('a', 'c', 2)):
+            set(['e'])})
+        self.assertEquals(self.broker.get_objects_in_range(None, None, 10),
+                          [])
+        self.assertEquals(self.cs.objects_moved, 5)
+        self.assertEquals(len(self.heads), 3)
+        self.assertEquals(self.broker.get_shard_stats(), (6, 60))
+        info = self.broker.get_info()
+        self.assertEquals(info['object_count'], 6)
+        self.assertEquals(info['bytes_used'], 60)
+
+        # rows arriving at the root later on are moved on the next pass
+        self.broker.put_object('f', normalize_timestamp('3'), 10,
+                               'text/plain',
+                               'd41d8cd98f00b204e9800998ecf8427e')
+        puts[:] = []
+        FakeReplConnection.merged = []
+        self.cs.container_shard('isa.db')
+        self.assertEquals(puts, [])
+        self.assertEquals(len(FakeReplConnection.merged), 3)
+        self.assertEquals(self.broker.get_objects_in_range(None, None, 10),
+                          [])
+
+    def test_container_shard_create_fails(self):
+        sharder.http_connect = fake_http_connect(201, 500, 500)
+        self.cs.container_shard('isa.db')
+        self.assertEquals(self.cs.container_failures, 1)
+        self.assertEquals(self.broker.get_shard_points(), [])
+        self.assertEquals(FakeReplConnection.merged, [])
+
+    def test_container_shard_move_fails(self):
+        self.broker.set_shard_points(['b', 'd'], normalize_timestamp('3'))
+        FakeReplConnection.status = 500
+        self.cs.container_shard('isa.db')
+        self.assertEquals(self.cs.container_failures, 1)
+        self.assertEquals(len(FakeReplConnection.merged), 3)
+        self.assertEquals(
+            len(self.broker.get_objects_in_range(None, None, 10)), 5)
+        self.assertEquals(self.heads, [])
+
+    def test_container_shard_batches(self):
+        self.broker.set_shard_points(['d'], normalize_timestamp('3'))
+        self.cs.shard_batch_size = 3
+        self.cs.container_shard('isa.db')
+        self.assertEquals([len(args[1]) for node, hsh, args
+                           in FakeReplConnection.merged],
+                          [3, 3, 3, 1, 1, 1, 1, 1, 1])
+        self.assertEquals(self.cs.objects_moved, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
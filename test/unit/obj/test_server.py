@@ -762,6 +762,113 @@ class TestObjectController(unittest.TestCase):
                            'X-Object-Meta-1': 'One',
                            'X-Object-Meta-Two': 'Two'})
 
+    def test_PUT_copy_source_local(self):
+        req = Request.blank('/sda1/p/a/c/o', environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'X-Timestamp': normalize_timestamp(time()),
+                                     'Content-Type': 'text/plain'})
+        req.body = 'VERIFY'
+        resp = self.object_controller.PUT(req)
+        self.assertEquals(resp.status_int, 201)
+        timestamp = normalize_timestamp(time())
+        headers = {'X-Timestamp': timestamp,
+                   'Content-Type': 'text/plain',
+                   'Content-Length': '0',
+                   'ETag': '0b4c12d7e0a73840c1c4f148fda3b037',
+                   'X-Object-Meta-Copied': 'yes',
+                   'X-Copy-Source-Partition': 'p',
+                   'X-Copy-Source-Path': '/a/c/o',
+                   'X-Copy-Source-Local-Device': 'sda1'}
+        req = Request.blank('/sda1/q/a/c2/o2',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers=headers)
+        resp = self.object_controller.PUT(req)
+        self.assertEquals(resp.status_int, 201)
+        objfile = os.path.join(self.testdir, 'sda1',
+            storage_directory(object_server.DATADIR, 'q',
+                              hash_path('a', 'c2', 'o2')),
+            timestamp + '.data')
+        self.assertEquals(open(objfile).read(), 'VERIFY')
+        self.assertEquals(pickle.loads(getxattr(objfile,
+                            object_server.METADATA_KEY)),
+                          {'X-Timestamp': timestamp,
+                           'Content-Length': '6',
+                           'ETag': '0b4c12d7e0a73840c1c4f148fda3b037',
+                           'Content-Type': 'text/plain',
+                           'name': '/a/c2/o2',
+                           'X-Object-Meta-Copied': 'yes'})
+        # a replica with another ETag isn't copied
+        headers['ETag'] = 'b381a4c5dab1eaa1eb9711fa647cd039'
+        req = Request.blank('/sda1/q/a/c2/o3',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers=headers)
+        resp = self.object_controller.PUT(req)
+        self.assertEquals(resp.status_int, 404)
+        headers['X-Copy-Source-Local-Device'] = '..'
+        req = Request.blank('/sda1/q/a/c2/o3',
+                            environ={'REQUEST_METHOD': 'PUT'},
+                            headers=headers)
+        resp = self.object_controller.PUT(req)
+        self.assertEquals(resp.status_int, 400)
+
+    def test_PUT_copy_source_remote(self):
+        requested = []
+
+        def fake_http_connect(ipaddr, port, device, partition, method, path,
+                              headers=None):
+            requested.append((ipaddr, port, device, partition, method, path,
+                              headers.get('If-Match')))
+
+            class FakeConn(object):
+
+                def __init__(self, status, body):
+                    self.status = status
+                    self.body = StringIO(body)
+
+                def getresponse(self):
+                    return self
+
+                def getheader(self, name):
+                    return {'content-length': str(self.body.len)}[name]
+
+                def read(self, amt=None):
+                    return self.body.read(amt)
+
+                def close(self):
+                    pass
+
+            if ipaddr == '1.2.3.4':
+                return FakeConn(412, '')
+            return FakeConn(200, 'VERIFY')
+
+        timestamp = normalize_timestamp(time())
+        req = Request.blank(
+            '/sda1/p/a/c/o', environ={'REQUEST_METHOD': 'PUT'},
+            headers={'X-Timestamp': timestamp,
+                     'Content-Type': 'text/plain',
+                     'Content-Length': '0',
+                     'ETag': '0b4c12d7e0a73840c1c4f148fda3b037',
+                     'X-Copy-Source-Partition': '123',
+                     'X-Copy-Source-Path': '/a/c/%C3%A9',
+                     'X-Copy-Source-Hosts': '1.2.3.4:6000,5.6.7.8:6000',
+                     'X-Copy-Source-Devices': 'sdb1,sdc1'})
+        orig_http_connect = object_server.http_connect
+        try:
+            object_server.http_connect = fake_http_connect
+            resp = self.object_controller.PUT(req)
+        finally:
+            object_server.http_connect = orig_http_connect
+        self.assertEquals(resp.status_int, 201)
+        self.assertEquals(requested, [
+            ('1.2.3.4', '6000', 'sdb1', '123', 'GET', '/a/c/\xc3\xa9',
+             '0b4c12d7e0a73840c1c4f148fda3b037'),
+            ('5.6.7.8', '6000', 'sdc1', '123', 'GET', '/a/c/\xc3\xa9',
+             '0b4c12d7e0a73840c1c4f148fda3b037')])
+        objfile = os.path.join(self.testdir, 'sda1',
+            storage_directory(object_server.DATADIR, 'p',
+                              hash_path('a', 'c', 'o')),
+            timestamp + '.data')
+        self.assertEquals(open(objfile).read(), 'VERIFY')
+
     def test_PUT_container_connection(self):
 
         def mock_http_connect(response, with_exc=False):
@@ -1636,6 +1743,56 @@ class TestObjectController(unittest.TestCase):
             '/a/c/o', {'x-timestamp': '1', 'x-out': 'set'}])
 
 
+    def test_container_update_to_shard(self):
+        given_args = []
+
+        def fake_async_update(*args):
+            given_args.append(args)
+
+        self.object_controller.async_update = fake_async_update
+        headers_in = {'X-Container-Host': '1.2.3.4:5,6.7.8.9:10',
+                      'X-Container-Device': 'sdb1,sdc1',
+                      'X-Container-Partition': '20',
+                      'X-Container-Shard': '.shards_a/c%20s-1'}
+        self.object_controller.container_update(
+            'PUT', 'a', 'c', 'o', headers_in, {'x-timestamp': '1'}, 'sda1')
+        self.assertEquals(given_args, [
+            ('PUT', '.shards_a', 'c s-1', 'o', '1.2.3.4:5', '20', 'sdb1',
+             {'x-timestamp': '1'}, 'sda1'),
+            ('PUT', '.shards_a', 'c s-1', 'o', '6.7.8.9:10', '20', 'sdc1',
+             {'x-timestamp': '1'}, 'sda1')])
+        # a shard outside of the object's account gets no update
+        del given_args[:]
+        for shard in ('.expiring_objects/c', 'b/c', 'a', 'a/', '/c',
+                      'a/c/d'):
+            headers_in['X-Container-Shard'] = shard
+            self.object_controller.container_update(
+                'PUT', 'a', 'c', 'o', headers_in, {'x-timestamp': '1'},
+                'sda1')
+        self.assertEquals(given_args, [])
+
+    def test_bad_x_container_shard(self):
+        for shard in ('.expiring_objects/c', '.shards_b/c', 'a', 'a/',
+                      '%2Fc', 'a/c/d'):
+            for method in ('PUT', 'DELETE'):
+                req = Request.blank(
+                    '/sda1/p/a/c/o', environ={'REQUEST_METHOD': method},
+                    headers={'X-Timestamp': normalize_timestamp(time()),
+                             'Content-Type': 'application/octet-stream',
+                             'Content-Length': '0',
+                             'X-Container-Shard': shard})
+                resp = req.get_response(self.object_controller)
+                self.assertEquals(resp.status_int, 400)
+        for shard in ('a/c', '.shards_a/c%20s-1'):
+            req = Request.blank(
+                '/sda1/p/a/c/o', environ={'REQUEST_METHOD': 'PUT'},
+                headers={'X-Timestamp': normalize_timestamp(time()),
+                         'Content-Type': 'application/octet-stream',
+                         'Content-Length': '0',
+                         'X-Container-Shard': shard})
+            resp = req.get_response(self.object_controller)
+            self.assertEquals(resp.status_int, 201)
+
     def test_updating_multiple_delete_at_container_servers(self):
         self.object_controller.expiring_objects_account = 'exp'
         self.object_controller.expiring_objects_container_divisor = 60
@@ -13,12 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
 import unittest
 
 import swift.proxy.controllers.base
 from swift.proxy.controllers.base import headers_to_container_info, \
     headers_to_account_info, get_container_info, get_container_memcache_key, \
-    get_account_info, get_account_memcache_key
+    get_account_info, get_account_memcache_key, InfoCache, info_cache
 from swift.common.swob import Request
 from swift.common.utils import split_path
 
@@ -49,6 +50,121 @@ class FakeCache(object):
         return self.val
 
 
+class FakeMemcache(object):
+    def __init__(self):
+        self.store = {}
+        self.calls = []
+
+    def get(self, key):
+        self.calls.append(('get', key))
+        return self.store.get(key)
+
+    def set(self, key, value, time=0):
+        self.calls.append(('set', key, time))
+        self.store[key] = value
+
+    def delete(self, key):
+        self.calls.append(('delete', key))
+        self.store.pop(key, None)
+
+
+class TestInfoCache(unittest.TestCase):
+    def test_disabled(self):
+        memcache = FakeMemcache()
+        cache = InfoCache()
+        cache.set(memcache, 'key', {'status': 200}, time=60)
+        self.assertEquals(cache.get(memcache, 'key'), {'status': 200})
+        self.assertEquals(cache.get(memcache, 'key'), {'status': 200})
+        self.assertEquals(memcache.calls, [('set', 'key', 60),
+                                           ('get', 'key'), ('get', 'key')])
+        self.assertEquals(cache.entries, {})
+
+    def test_get_set_delete(self):
+        memcache = FakeMemcache()
+        memcache.store['key'] = {'status': 404}
+        cache = InfoCache(10, 60)
+        self.assertEquals(cache.get(memcache, 'key'), {'status': 404})
+        value = cache.get(memcache, 'key')
+        self.assertEquals(value, {'status': 404})
+        self.assertEquals(memcache.calls, [('get', 'key')])
+        # callers get copies they can change
+        value['status'] = 200
+        self.assertEquals(cache.get(memcache, 'key'), {'status': 404})
+        # misses are not kept
+        self.assertEquals(cache.get(memcache, 'other'), None)
+        self.assertEquals(cache.get(memcache, 'other'), None)
+        self.assertEquals(memcache.calls[1:], [('get', 'other')] * 2)
+
+        cache.set(memcache, 'key', {'status': 200}, time=60)
+        self.assertEquals(memcache.store['key'], {'status': 200})
+        del memcache.calls[:]
+        self.assertEquals(cache.get(memcache, 'key'), {'status': 200})
+        self.assertEquals(memcache.calls, [])
+        cache.delete(memcache, 'key')
+        self.assertEquals(cache.get(memcache, 'key'), None)
+        self.assertEquals(memcache.calls, [('delete', 'key'), ('get', 'key')])
+
+    def test_ttl(self):
+        memcache = FakeMemcache()
+        cache = InfoCache(10, 60)
+        cache.set(memcache, 'key', {'status': 404}, time=6)
+        self.assertEquals(cache.entries['key'][0] - cache.entries['key'][2],
+                          6)
+        cache.entries['key'][0] = time.time() - 1
+        memcache.store['key'] = {'status': 200}
+        self.assertEquals(cache.get(memcache, 'key'), {'status': 200})
+        self.assertEquals(memcache.calls[-1], ('get', 'key'))
+
+    def test_lru(self):
+        memcache = FakeMemcache()
+        cache = InfoCache(4, 60)
+        for i in xrange(4):
+            cache.set(memcache, str(i), i, time=60)
+            cache.entries[str(i)][2] -= 10 - i
+        cache.get(memcache, '0')
+        cache.set(memcache, '4', 4, time=60)
+        self.assertEquals(sorted(cache.entries), ['0', '2', '3', '4'])
+        cache.entries['2'][0] = cache.entries['3'][0] = 0
+        cache.set(memcache, '5', 5, time=60)
+        self.assertEquals(sorted(cache.entries), ['0', '4', '5'])
+
+    def test_get_many(self):
+        memcache = FakeMemcache()
+        memcache.store['a'] = {'status': 200}
+        memcache.store['b'] = 404
+        cache = InfoCache(10, 60)
+        self.assertEquals(cache.get(memcache, 'a'), {'status': 200})
+        self.assertEquals(cache.get_many(memcache, ['a', 'b', 'c']),
+                          [{'status': 200}, 404, None])
+        # the client has no get_many, so the keys are looked up one by one
+        self.assertEquals(memcache.calls, [('get', 'a'), ('get', 'b'),
+                                           ('get', 'c')])
+        del memcache.calls[:]
+
+        def get_many(keys):
+            memcache.calls.append(('get_many', keys))
+            return [memcache.store.get(key) for key in keys]
+
+        memcache.get_many = get_many
+        self.assertEquals(cache.get_many(memcache, ['a', 'b', 'c', 'd']),
+                          [{'status': 200}, 404, None, None])
+        self.assertEquals(memcache.calls, [('get_many', ['c', 'd'])])
+        del memcache.calls[:]
+        self.assertEquals(cache.get_many(memcache, ['a', 'b']),
+                          [{'status': 200}, 404])
+        self.assertEquals(memcache.calls, [])
+
+    def test_peek(self):
+        memcache = FakeMemcache()
+        memcache.store['a'] = {'status': 200}
+        cache = InfoCache(10, 60)
+        self.assertEquals(cache.peek('a'), (False, None))
+        cache.get(memcache, 'a')
+        del memcache.calls[:]
+        self.assertEquals(cache.peek('a'), (True, {'status': 200}))
+        self.assertEquals(memcache.calls, [])
+
+
 class TestFuncs(unittest.TestCase):
     def test_get_container_info_no_cache(self):
         swift.proxy.controllers.base.make_pre_authed_request = FakeRequest
@@ -70,6 +186,22 @@ class TestFuncs(unittest.TestCase):
         self.assertEquals(resp['object_count'], 10)
         self.assertEquals(resp['status'], 404)
 
+    def test_get_container_info_info_cache(self):
+        swift.proxy.controllers.base.make_pre_authed_request = FakeRequest
+        memcache = FakeMemcache()
+        memcache.store[get_container_memcache_key('account', 'cont')] = \
+            {'status': 200, 'bytes': 3333}
+        info_cache.configure(10, 60)
+        try:
+            for _junk in xrange(3):
+                req = Request.blank("/v1/account/cont",
+                                    environ={'swift.cache': memcache})
+                resp = get_container_info(req.environ, 'xxx')
+                self.assertEquals(resp['bytes'], 3333)
+            self.assertEquals(len(memcache.calls), 1)
+        finally:
+            info_cache.configure(0, 1)
+
     def test_get_container_info_env(self):
         cache_key = get_container_memcache_key("account", "cont")
         env_key = 'swift.%s' % cache_key
@@ -129,9 +261,11 @@ class TestFuncs(unittest.TestCase):
             'x-container-write': 'writevalue',
             'x-container-sync-key': 'keyvalue',
             'x-container-meta-access-control-allow-origin': 'here',
+            'x-put-timestamp': '1361577600.00000',
         }
         resp = headers_to_container_info(headers.items(), 200)
         self.assertEquals(resp['read_acl'], 'readvalue')
+        self.assertEquals(resp['put_timestamp'], '1361577600.00000')
         self.assertEquals(resp['write_acl'], 'writevalue')
         self.assertEquals(resp['cors']['allow_origin'], 'here')
 
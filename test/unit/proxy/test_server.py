@@ -24,6 +24,7 @@ import signal
 from contextlib import contextmanager
 from gzip import GzipFile
 from shutil import rmtree
+from StringIO import StringIO
 import time
 from urllib import quote
 from hashlib import md5
@@ -33,7 +34,8 @@ import random
 from eventlet import sleep, spawn, wsgi, listen
 import simplejson
 
-from test.unit import connect_tcp, readuntil2crlfs, FakeLogger, fake_http_connect
+from test.unit import connect_tcp, readuntil2crlfs, readchunked, FakeLogger, \
+    fake_http_connect
 from swift.proxy import server as proxy_server
 from swift.account import server as account_server
 from swift.container import server as container_server
@@ -555,6 +557,24 @@ class TestController(unittest.TestCase):
             test(404, 507, 503)
             test(503, 503, 503)
 
+    def test_shard_points(self):
+        with save_globals():
+            set_http_connect(200, body='["m"]')
+            self.assertEquals(self.controller.shard_points('a', 'c'), ['m'])
+            self.assertEquals(self.memcache.get('shard_points/a/c'), [u'm'])
+            # served from memcache now
+            set_http_connect(503, 503, 503)
+            self.assertEquals(self.controller.shard_points('a', 'c'), ['m'])
+            self.memcache.store.clear()
+            self.assertEquals(self.controller.shard_points('a', 'c'), None)
+            self.assertEquals(self.memcache.keys(), [])
+            # replicas that have not heard about the sharding yet are skipped
+            set_http_connect(200, 200, body_iter=['[]', '["m"]'])
+            self.assertEquals(self.controller.shard_points('a', 'c'), ['m'])
+            self.memcache.store.clear()
+            set_http_connect(200, 200, 200, body='[]')
+            self.assertEquals(self.controller.shard_points('a', 'c'), [])
+
 
 class TestProxyServer(unittest.TestCase):
 
@@ -694,6 +714,95 @@ class TestProxyServer(unittest.TestCase):
         finally:
             proxy_server.shuffle = random.shuffle
 
+    def test_node_latency(self):
+        baseapp = proxy_server.Application(
+            {'sorting_method': 'latency', 'latency_ewma_alpha': '0.5',
+             'latency_error_penalty': '2'}, FakeMemcache(),
+            container_ring=FakeRing(), object_ring=FakeRing(),
+            account_ring=FakeRing(), logger=FakeLogger())
+        nodes = [{'ip': '10.0.0.%d' % i, 'port': 6000, 'device': 'sda'}
+                 for i in xrange(4)]
+        baseapp.set_node_timing(nodes[0], 0.1)
+        baseapp.set_node_timing(nodes[0], 0.3)
+        baseapp.set_node_first_byte_timing(nodes[0], 0.05)
+        self.assertEquals(baseapp.get_node_latency(nodes[0])[:2],
+                          (0.2, 0.05))
+        baseapp.set_node_timing(nodes[1], 0.15)
+        baseapp.set_node_timing(nodes[2], 0.05)
+        baseapp.set_node_first_byte_timing(nodes[2], 0.05)
+        # unused nodes are tried first, then the fastest
+        self.assertEquals(baseapp.sort_nodes(list(nodes)),
+                          [nodes[3], nodes[2], nodes[1], nodes[0]])
+        self.assertEquals(baseapp.logger.get_increments(), [])
+
+        # recent errors count against a node
+        baseapp.set_node_errors(nodes[3], 1, time.time())
+        self.assertEquals(baseapp.sort_nodes(list(nodes)),
+                          [nodes[2], nodes[1], nodes[0], nodes[3]])
+        baseapp.set_node_errors(nodes[3], None, None)
+
+        # averages expire
+        baseapp.set_node_latency(nodes[1], latency_updated=time.time() -
+                                 baseapp.timing_expiry - 1)
+        self.assertEquals(
+            sorted(baseapp.sort_nodes(list(nodes))[:2]),
+            [nodes[1], nodes[3]])
+
+        # outliers are ejected and go last until the ejection is over
+        baseapp.set_node_timing(nodes[1], 0.1)
+        baseapp.set_node_timing(nodes[3], 0.1)
+        baseapp.set_node_first_byte_timing(nodes[0], 2)
+        self.assertEquals(baseapp.sort_nodes(list(nodes))[-1], nodes[0])
+        self.assertEquals(baseapp.logger.get_increments(),
+                          ['outlier_ejections'])
+        self.assertEquals(baseapp.sort_nodes(list(nodes))[-1], nodes[0])
+        self.assertEquals(baseapp.logger.get_increments(),
+                          ['outlier_ejections'])
+        baseapp.set_node_latency(nodes[0], ejected_until=time.time() - 1)
+        self.assertEquals(baseapp.sort_nodes(list(nodes))[0], nodes[0])
+
+        baseapp.outlier_ejection_factor = 0
+        baseapp.set_node_timing(nodes[0], 5)
+        self.assertEquals(baseapp.sort_nodes(list(nodes))[-1], nodes[0])
+        self.assertEquals(baseapp.logger.get_increments(),
+                          ['outlier_ejections'])
+
+    def test_backend_keepalive(self):
+        baseapp = proxy_server.Application({}, FakeMemcache(),
+                                           container_ring=FakeRing(),
+                                           object_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        self.assertEquals(baseapp.backend_pool, None)
+        baseapp = proxy_server.Application(
+            {'backend_keepalive': 'yes', 'backend_max_idle_per_node': '2',
+             'backend_idle_timeout': '5'}, FakeMemcache(),
+            container_ring=FakeRing(), object_ring=FakeRing(),
+            account_ring=FakeRing())
+        self.assertEquals(baseapp.backend_pool.max_idle_per_node, 2)
+        self.assertEquals(baseapp.backend_pool.idle_timeout, 5.0)
+
+        calls = []
+
+        def fake_connect(ipaddr, port, device, partition, method, path,
+                         headers=None, query_string=None, **kwargs):
+            calls.append((headers, kwargs))
+
+        node = {'ip': '1.2.3.4', 'port': 6000, 'device': 'sda'}
+        orig_http_connect = swift.proxy.controllers.base.http_connect
+        swift.proxy.controllers.base.http_connect = fake_connect
+        try:
+            controller = swift.proxy.controllers.base.Controller(baseapp)
+            controller._connect_node(node, 1, 'HEAD', '/a',
+                                     {'Connection': 'close', 'X-Foo': 'bar'})
+            self.assertEquals(calls[-1], ({'X-Foo': 'bar'},
+                                          {'pool': baseapp.backend_pool}))
+            baseapp.backend_pool = None
+            controller._connect_node(node, 1, 'HEAD', '/a', {'X-Foo': 'bar'})
+            self.assertEquals(calls[-1], ({'X-Foo': 'bar',
+                                           'Connection': 'close'}, {}))
+        finally:
+            swift.proxy.controllers.base.http_connect = orig_http_connect
+
 
 class TestObjectController(unittest.TestCase):
 
@@ -985,6 +1094,129 @@ class TestObjectController(unittest.TestCase):
                 swift.proxy.controllers.obj.CONTAINER_LISTING_LIMIT = \
                     _orig_container_listing_limit
 
+    def test_GET_manifest_cached_listing(self):
+        listing = [{"hash": "454dfc73af632012ce3e6217dc464241",
+                    "last_modified": "2012-11-08T04:05:37.866820",
+                    "bytes": 2,
+                    "name": "seg01",
+                    "content_type": "application/octet-stream"},
+                   {"hash": "474bab96c67528d42d5c0c52b35228eb",
+                    "last_modified": "2012-11-08T04:05:37.846710",
+                    "bytes": 2,
+                    "name": "seg02",
+                    "content_type": "application/octet-stream"}]
+        with save_globals():
+            self.app.dlo_listing_cache_time = 60
+            self.app.memcache.store = {}
+            try:
+                controller = proxy_server.ObjectController(
+                    self.app, 'a', 'c', 'manifest')
+                requested = []
+
+                def capture_requested_paths(ipaddr, port, device, partition,
+                                            method, path, headers=None,
+                                            query_string=None):
+                    requested.append([method, path])
+
+                set_http_connect(
+                    200, 200, 200, 200, 200, 200, 200, 200,
+                    headers={"X-Object-Manifest": "segments/seg",
+                             "X-Container-Object-Count": "2"},
+                    body_iter=('', '', '', '', simplejson.dumps(listing),
+                               '[]', 'Aa', 'Bb'),
+                    give_connect=capture_requested_paths)
+                resp = controller.GET(Request.blank('/a/c/manifest'))
+                self.assertEqual(resp.body, 'AaBb')
+                self.assertEqual(requested[3:5], [['HEAD', '/a/segments'],
+                                                  ['GET', '/a/segments']])
+                cache_key = 'dlo_listing/a/segments/seg'
+                self.assert_(cache_key in self.app.memcache.store)
+
+                # the listing comes from memcache the next time
+                del requested[:]
+                set_http_connect(
+                    200, 200, 200,
+                    headers={"X-Object-Manifest": "segments/seg"},
+                    body_iter=('', 'Aa', 'Bb'),
+                    give_connect=capture_requested_paths)
+                resp = controller.GET(Request.blank('/a/c/manifest'))
+                self.assertEqual(resp.body, 'AaBb')
+                self.assertEqual(resp.content_length, 4)
+                self.assertEqual(requested,
+                                 [['GET', '/a/c/manifest'],
+                                  ['GET', '/a/segments/seg01'],
+                                  ['GET', '/a/segments/seg02']])
+
+                # unless the manifest changed
+                del requested[:]
+                set_http_connect(
+                    200, 200, 200, 200, 200,
+                    headers={"X-Object-Manifest": "segments/seg"},
+                    body_iter=('', simplejson.dumps(listing), '[]', 'Aa',
+                               'Bb'),
+                    timestamps=('2', '2', '2', '2', '2'),
+                    give_connect=capture_requested_paths)
+                resp = controller.GET(Request.blank('/a/c/manifest'))
+                self.assertEqual(resp.body, 'AaBb')
+                self.assertEqual(requested[1], ['GET', '/a/segments'])
+
+                # or the segment container changed, as when a segment is
+                # added after the manifest
+                listing.append(
+                    {"hash": "e9a5f4a5ba1f3ae3ba9b5b3cb62d3ee3",
+                     "last_modified": "2012-11-08T04:05:37.846710",
+                     "bytes": 2, "name": "seg03",
+                     "content_type": "application/octet-stream"})
+                container_key = get_container_memcache_key('a', 'segments')
+                self.app.memcache.store[container_key]['object_count'] = '3'
+                del requested[:]
+                set_http_connect(
+                    200, 200, 200, 200, 200, 200,
+                    headers={"X-Object-Manifest": "segments/seg"},
+                    body_iter=('', simplejson.dumps(listing), '[]', 'Aa',
+                               'Bb', 'Cc'),
+                    timestamps=('2', '2', '2', '2', '2', '2'),
+                    give_connect=capture_requested_paths)
+                resp = controller.GET(Request.blank('/a/c/manifest'))
+                self.assertEqual(resp.body, 'AaBbCc')
+                self.assertEqual(resp.content_length, 6)
+                self.assertEqual(requested[1], ['GET', '/a/segments'])
+                self.assertEqual(
+                    len(self.app.memcache.store[cache_key]['listing']), 3)
+
+                # a segment that is gone drops the cached listing
+                set_http_connect(
+                    200, 404,
+                    headers={"X-Object-Manifest": "segments/seg"},
+                    body_iter=('', ''),
+                    timestamps=('2', '2'))
+                resp = controller.GET(Request.blank('/a/c/manifest'))
+                self.assertRaises(Exception, lambda: resp.body)
+                self.assert_(cache_key not in self.app.memcache.store)
+
+                # and so does a segment that changed size
+                listing.pop()
+                self.app.memcache.store[container_key]['object_count'] = '2'
+                set_http_connect(
+                    200, 200, 200, 200, 200,
+                    headers={"X-Object-Manifest": "segments/seg"},
+                    body_iter=('', simplejson.dumps(listing), '[]', 'Aa',
+                               'Bb'),
+                    timestamps=('2', '2', '2', '2', '2'))
+                resp = controller.GET(Request.blank('/a/c/manifest'))
+                self.assertEqual(resp.body, 'AaBb')
+                self.assert_(cache_key in self.app.memcache.store)
+                set_http_connect(
+                    200, 200, 200,
+                    headers={"X-Object-Manifest": "segments/seg"},
+                    body_iter=('', 'Aa', 'Bbb'),
+                    timestamps=('2', '2', '2'))
+                resp = controller.GET(Request.blank('/a/c/manifest'))
+                self.assertRaises(Exception, lambda: resp.body)
+                self.assert_(cache_key not in self.app.memcache.store)
+            finally:
+                self.app.dlo_listing_cache_time = 0
+
     def test_GET_manifest_slo(self):
         listing = [{"hash": "98568d540134639be4655198a36614a4",
                     "last_modified": "2012-11-08T04:05:37.866820",
@@ -1314,6 +1546,45 @@ class TestObjectController(unittest.TestCase):
             test_status_map((200, 200, 201, -1, -1), 503)
             test_status_map((200, 200, 503, 503, -1), 503)
 
+    def test_PUT_chunked_sends_shared_chunks(self):
+        with save_globals():
+            controller = proxy_server.ObjectController(self.app, 'account',
+                                                       'container', 'object')
+            fake_connect = fake_http_connect(200, 200, 201, 201, 201)
+            sent = []
+
+            def connect(*args, **kwargs):
+                conn = fake_connect(*args, **kwargs)
+                conn.send = lambda data: sent.append((conn, data))
+                return conn
+
+            swift.proxy.controllers.base.http_connect = connect
+            swift.proxy.controllers.obj.http_connect = connect
+            self.app.memcache.store = {}
+            req = Request.blank('/a/c/o', environ={'REQUEST_METHOD': 'PUT'},
+                                headers={'Transfer-Encoding': 'chunked',
+                                         'Content-Type': 'foo/bar'})
+            req.body_file = StringIO('abcdefg')
+            self.app.update_request(req)
+            orig_client_chunk_size = self.app.client_chunk_size
+            try:
+                self.app.client_chunk_size = 3
+                res = controller.PUT(req)
+            finally:
+                self.app.client_chunk_size = orig_client_chunk_size
+            self.assertEquals(res.status_int, 201)
+            conns = set(conn for conn, data in sent)
+            self.assertEquals(len(conns), 3)
+            sent_by_conn = [[data for sent_conn, data in sent
+                             if sent_conn is conn] for conn in conns]
+            for conn_sent in sent_by_conn:
+                self.assertEquals(
+                    conn_sent, ['3\r\nabc\r\n', '3\r\ndef\r\n',
+                                '1\r\ng\r\n', '0\r\n\r\n'])
+            # every connection got the same framed strings, not copies
+            for chunks in zip(*sent_by_conn):
+                self.assertTrue(chunks[0] is chunks[1] is chunks[2])
+
     def test_PUT_max_size(self):
         with save_globals():
             set_http_connect(201, 201, 201)
@@ -1776,6 +2047,62 @@ class TestObjectController(unittest.TestCase):
                 got_exc = True
             self.assert_(got_exc)
 
+    def test_hedged_read(self):
+        with save_globals():
+            nodes = [{'ip': '10.0.0.%d' % i, 'port': 6000, 'device': 'sda'}
+                     for i in xrange(3)]
+            connects = []
+            stalled = {'10.0.0.0': 0.3, '10.0.0.1': 0.05, '10.0.0.2': 0}
+            codes = {'10.0.0.0': 200, '10.0.0.1': 200, '10.0.0.2': 404}
+
+            def fake_connect(ipaddr, port, device, partition, method, path,
+                             headers=None, query_string=None):
+                connects.append(ipaddr)
+                sleep(stalled[ipaddr])
+                return fake_http_connect(codes[ipaddr])(
+                    ipaddr, port, device, partition, method, path)
+
+            swift.proxy.controllers.base.http_connect = fake_connect
+            self.app.conn_timeout = 2
+            self.app.logger = FakeLogger()
+            controller = proxy_server.ObjectController(self.app, 'a', 'c',
+                                                       'o')
+            req = Request.blank('/a/c/o', environ={'REQUEST_METHOD': 'HEAD'})
+
+            # without hedging the stalled node is waited for
+            resp = controller.GETorHEAD_base(req, 'Object', 1, nodes,
+                                             '/a/c/o', 3)
+            self.assertEquals(resp.status_int, 200)
+            self.assertEquals(connects, ['10.0.0.0'])
+
+            # with hedging the next node answers first
+            connects[:] = []
+            self.app.hedged_read_delay = 0.01
+            start = time.time()
+            resp = controller.GETorHEAD_base(req, 'Object', 1, nodes,
+                                             '/a/c/o', 3)
+            self.assertEquals(resp.status_int, 200)
+            self.assertEquals(connects, ['10.0.0.0', '10.0.0.1', '10.0.0.2'])
+            self.assert_(time.time() - start < 0.25)
+            self.assertEquals(self.app.logger.get_increment_counts(),
+                              {'hedged_reads': 2})
+
+            # no more requests than attempts are sent
+            connects[:] = []
+            resp = controller.GETorHEAD_base(req, 'Object', 1, nodes,
+                                             '/a/c/o', 1)
+            self.assertEquals(resp.status_int, 200)
+            self.assertEquals(connects, ['10.0.0.0'])
+
+            # x-newest still asks the nodes one after another
+            connects[:] = []
+            stalled['10.0.0.0'] = 0
+            req.headers['x-newest'] = 'true'
+            resp = controller.GETorHEAD_base(req, 'Object', 1, nodes,
+                                             '/a/c/o', 3)
+            self.assertEquals(resp.status_int, 200)
+            self.assertEquals(connects, ['10.0.0.0', '10.0.0.1', '10.0.0.2'])
+
     def test_node_write_timeout(self):
         with save_globals():
             self.app.account_ring.get_nodes('account')
@@ -1957,6 +2284,42 @@ class TestObjectController(unittest.TestCase):
                               (200, 200, 200, 204, 204, 204), 503,
                               raise_exc=True)
 
+    def test_shared_error_limiting(self):
+        testdir = mkdtemp()
+        try:
+            conf = {'node_health_file': os.path.join(testdir, 'health'),
+                    'node_health_slots': '64'}
+            app1 = proxy_server.Application(conf, FakeMemcache(),
+                                            account_ring=FakeRing(),
+                                            container_ring=FakeRing(),
+                                            object_ring=FakeRing())
+            app2 = proxy_server.Application(conf, FakeMemcache(),
+                                            account_ring=FakeRing(),
+                                            container_ring=FakeRing(),
+                                            object_ring=FakeRing())
+            controller1 = proxy_server.ObjectController(app1, 'a', 'c', 'o')
+            controller2 = proxy_server.ObjectController(app2, 'a', 'c', 'o')
+            node = {'ip': '1.2.3.4', 'port': 6000, 'device': 'sda'}
+            controller1.error_increment(node)
+            self.assertEquals(app2.get_node_errors(node)[0], 1)
+            self.assertFalse(controller2.error_limited(dict(node)))
+            controller1.error_limit(node)
+            self.assert_(controller2.error_limited(dict(node)))
+            # nothing is kept on the node dicts themselves
+            self.assertEquals(node, {'ip': '1.2.3.4', 'port': 6000,
+                                     'device': 'sda'})
+            app2.error_suppression_interval = -300
+            self.assertFalse(controller2.error_limited(dict(node)))
+            self.assertEquals(app1.get_node_errors(node), (0, 0.0))
+
+            app1.sorting_method = app2.sorting_method = 'timing'
+            app1.set_node_timing({'ip': '1.2.3.4'}, 0.5)
+            nodes = [{'ip': '1.2.3.4'}, {'ip': '1.2.3.5'}]
+            self.assertEquals(app2.sort_nodes(nodes),
+                              [{'ip': '1.2.3.5'}, {'ip': '1.2.3.4'}])
+        finally:
+            rmtree(testdir)
+
     def test_acc_or_con_missing_returns_404(self):
         with save_globals():
             self.app.memcache = FakeMemcacheReturnsNone()
@@ -2451,6 +2814,24 @@ class TestObjectController(unittest.TestCase):
             resp = controller.COPY(req)
             self.assertEquals(resp.status_int, 413)
 
+    def test_COPY_stage_timings(self):
+        with save_globals():
+            controller = proxy_server.ObjectController(self.app, 'a', 'c', 'o')
+            timings = utils.StageTimings()
+            req = Request.blank('/a/c/o', environ={
+                'REQUEST_METHOD': 'COPY', 'swift.stage_timings': timings},
+                headers={'Destination': 'c/o'})
+            req.account = 'a'
+            set_http_connect(200, 200, 200, 200, 200, 200, 200, 201, 201, 201)
+            #                acct cont acct cont objc objc objc obj  obj  obj
+            self.app.memcache.store = {}
+            resp = controller.COPY(req)
+            self.assertEquals(resp.status_int, 201)
+            # the source GET is one stage of the PUT, not stages of its own
+            self.assertEquals([stage for stage, seconds in timings.stages], [
+                'container_info', 'copy_source', 'put_connect', 'put_upload',
+                'put_final_status'])
+
     def test_COPY_newest(self):
         with save_globals():
             controller = proxy_server.ObjectController(self.app, 'a', 'c', 'o')
@@ -2468,6 +2849,79 @@ class TestObjectController(unittest.TestCase):
             self.assertEquals(resp.headers['x-copied-from-last-modified'],
                               '3')
 
+    def test_COPY_server_side(self):
+        with save_globals():
+            self.app.server_side_copy = True
+            controller = proxy_server.ObjectController(self.app, 'a', 'c', 'o')
+            req = Request.blank('/a/c/o', environ={'REQUEST_METHOD': 'COPY'},
+                                headers={'Destination': '/c/o2',
+                                         'X-Copy-Source-Path': '/b/c/o'})
+            req.account = 'a'
+            requests = []
+
+            def capture(ipaddr, port, device, partition, method, path,
+                        headers=None, query_string=None):
+                requests.append((method, ipaddr, headers))
+
+            etag = '"0b4c12d7e0a73840c1c4f148fda3b037"'
+            set_http_connect(200, 200, 200, 200, 200, 201, 201, 201,
+                             #act cont objc objc objc obj  obj  obj
+                             etags=[None, None, etag, etag, etag, None, None,
+                                    None],
+                             give_connect=capture)
+            self.app.memcache.store = {}
+            resp = controller.COPY(req)
+            self.assertEquals(resp.status_int, 201)
+            self.assertEquals(resp.headers['x-copied-from'], 'c/o')
+            # the source is only HEADed, the object servers copy the data
+            self.assertEquals([method for method, ipaddr, headers
+                               in requests[2:]], ['HEAD'] * 3 + ['PUT'] * 3)
+            for method, ipaddr, headers in requests[5:]:
+                self.assertEquals(headers['Content-Length'], '0')
+                self.assertEquals(headers['Expect'], '100-continue')
+                self.assertEquals(headers['Etag'],
+                                  '0b4c12d7e0a73840c1c4f148fda3b037')
+                self.assertEquals(headers['X-Copy-Source-Partition'], '1')
+                self.assertEquals(headers['X-Copy-Source-Path'], '/a/c/o')
+                # the other object servers hold the other replicas
+                index = int(ipaddr.rsplit('.', 1)[1])
+                self.assertEquals(headers['X-Copy-Source-Local-Device'],
+                                  'sd' + 'abc'[index])
+                self.assertEquals(
+                    headers['X-Copy-Source-Hosts'],
+                    ','.join('10.0.0.%d:%d' % (i, 1000 + i)
+                             for i in xrange(3) if i != index))
+                self.assertEquals(
+                    headers['X-Copy-Source-Devices'],
+                    ','.join('sd' + 'abc'[i] for i in xrange(3) if i != index))
+
+    def test_COPY_server_side_large_object(self):
+        with save_globals():
+            self.app.server_side_copy = True
+            controller = proxy_server.ObjectController(self.app, 'a', 'c', 'o')
+            req = Request.blank('/a/c/o', environ={'REQUEST_METHOD': 'COPY'},
+                                headers={'Destination': '/c/o2'})
+            req.account = 'a'
+            requests = []
+
+            def capture(ipaddr, port, device, partition, method, path,
+                        headers=None, query_string=None):
+                requests.append((method, headers))
+
+            set_http_connect(200, 200, 200, 200, 200, 200, 200, 200, 201, 201,
+                             #act cont objc objc objc objc objc objc obj  obj
+                             201, headers={'X-Static-Large-Object': 'True'},
+                             #obj
+                             give_connect=capture)
+            self.app.memcache.store = {}
+            resp = controller.COPY(req)
+            self.assertEquals(resp.status_int, 201)
+            # a large object is put together by the proxy, so it is streamed
+            self.assertEquals([method for method, headers in requests[2:]],
+                              ['HEAD'] * 3 + ['GET'] * 3 + ['PUT'] * 3)
+            for method, headers in requests[8:]:
+                self.assertFalse('X-Copy-Source-Path' in headers)
+
     def test_chunked_put(self):
 
         class ChunkedFile():
@@ -2657,7 +3111,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEquals(headers[:len(exp)], exp)
-        containers = fd.read().split('\n')
+        containers = readchunked(fd).split('\n')
         self.assert_(ustr in containers)
         # List account with ustr container (test json)
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
@@ -2669,7 +3123,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEquals(headers[:len(exp)], exp)
-        listing = simplejson.loads(fd.read())
+        listing = simplejson.loads(readchunked(fd))
         self.assert_(ustr.decode('utf8') in [l['name'] for l in listing])
         # List account with ustr container (test xml)
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
@@ -2681,7 +3135,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEquals(headers[:len(exp)], exp)
-        self.assert_('<name>%s</name>' % ustr in fd.read())
+        self.assert_('<name>%s</name>' % ustr in readchunked(fd))
         # Create ustr object with ustr metadata in ustr container
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
         fd = sock.makefile()
@@ -2704,7 +3158,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEquals(headers[:len(exp)], exp)
-        objects = fd.read().split('\n')
+        objects = readchunked(fd).split('\n')
         self.assert_(ustr in objects)
         # List ustr container with ustr object (test json)
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
@@ -2717,7 +3171,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEquals(headers[:len(exp)], exp)
-        listing = simplejson.loads(fd.read())
+        listing = simplejson.loads(readchunked(fd))
         self.assertEquals(listing[0]['name'], ustr.decode('utf8'))
         # List ustr container with ustr object (test xml)
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
@@ -2730,7 +3184,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEquals(headers[:len(exp)], exp)
-        self.assert_('<name>%s</name>' % ustr in fd.read())
+        self.assert_('<name>%s</name>' % ustr in readchunked(fd))
         # Retrieve ustr object with ustr metadata
         sock = connect_tcp(('localhost', prolis.getsockname()[1]))
         fd = sock.makefile()
@@ -2855,7 +3309,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEquals(headers[:len(exp)], exp)
-        body = fd.read()
+        body = readchunked(fd)
         versions = [x for x in body.split('\n') if x]
         self.assertEquals(len(versions), versions_to_create - 1)
         # copy a version and make sure the version info is stripped
@@ -2935,7 +3389,10 @@ class TestObjectController(unittest.TestCase):
             headers = readuntil2crlfs(fd)
             exp = 'HTTP/1.1 2'  # 2xx series response
             self.assertEquals(headers[:len(exp)], exp)
-            body = fd.read()
+            if 'Transfer-Encoding: chunked' in headers:
+                body = readchunked(fd)
+            else:
+                body = fd.read()
             versions = [x for x in body.split('\n') if x]
             self.assertEquals(len(versions), segment - 1)
         # there is now one segment left (in the manifest)
@@ -3045,7 +3502,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 2'  # 2xx series response
         self.assertEquals(headers[:len(exp)], exp)
-        body = fd.read()
+        body = readchunked(fd)
         versions = [x for x in body.split('\n') if x]
         self.assertEquals(len(versions), 1)
 
@@ -3255,7 +3712,7 @@ class TestObjectController(unittest.TestCase):
         headers = readuntil2crlfs(fd)
         exp = 'HTTP/1.1 200'
         self.assertEquals(headers[:len(exp)], exp)
-        body = fd.read()
+        body = readchunked(fd)
         self.assertEquals(
             body,
             'object name/0\n'
@@ -4219,6 +4676,59 @@ class TestObjectController(unittest.TestCase):
                  'X-Delete-At-Partition': 1,
                  'X-Delete-At-Device': 'sdc'}])
 
+    def test_container_update_target_sharded(self):
+        controller = proxy_server.ObjectController(self.app, 'a', 'c', 'o')
+        info = {'partition': 5, 'nodes': ['node'], 'shard_count': 0}
+        self.assertEquals(controller._container_update_target(info),
+                          (5, ['node'], None))
+        info['shard_count'] = 2
+        controller.shard_points = lambda account, container: ['p']
+        part, nodes, shard = controller._container_update_target(info)
+        self.assertEquals(shard, '.shards_a/%s' %
+                          utils.get_shard_container('a', 'c', 0))
+        self.assertEquals((part, nodes), self.app.container_ring.get_nodes(
+            '.shards_a', utils.get_shard_container('a', 'c', 0)))
+        controller.object_name = 'z'
+        part, nodes, shard = controller._container_update_target(info)
+        self.assertEquals(shard, '.shards_a/%s' %
+                          utils.get_shard_container('a', 'c', 1))
+        # shard points unavailable; the root takes the update
+        controller.shard_points = lambda account, container: None
+        self.assertEquals(controller._container_update_target(info),
+                          (5, ['node'], None))
+
+    def test_PUT_x_container_shard(self):
+        req = Request.blank('/a/c/o', environ={'REQUEST_METHOD': 'PUT'},
+                            headers={'Content-Type': 'application/stuff',
+                                     'Content-Length': 0})
+        controller = proxy_server.ObjectController(self.app, 'a', 'c', 'o')
+        controller.shard_points = lambda account, container: ['p']
+        seen_headers = self._gather_x_container_headers(
+            controller.PUT, req,
+            200, 200, 201, 201, 201,   # HEAD HEAD PUT PUT PUT
+            header_list=('X-Container-Shard',),
+            headers={'x-container-shard-count': '2'})
+        shard = '.shards_a/%s' % utils.get_shard_container('a', 'c', 0)
+        self.assertEqual(seen_headers, [{'X-Container-Shard': shard}] * 3)
+
+    def test_client_x_container_shard_removed(self):
+        self.app.object_post_as_copy = False
+        for method, statuses in (('PUT', (200, 200, 201, 201, 201)),
+                                 ('POST', (200, 200, 202, 202, 202)),
+                                 ('DELETE', (200, 200, 204, 204, 204))):
+            self.app.memcache.store = {}
+            req = Request.blank(
+                '/a/c/o', environ={'REQUEST_METHOD': method},
+                headers={'Content-Type': 'application/stuff',
+                         'Content-Length': 0,
+                         'X-Container-Shard': '.expiring_objects/c'})
+            controller = proxy_server.ObjectController(self.app, 'a', 'c',
+                                                       'o')
+            seen_headers = self._gather_x_container_headers(
+                getattr(controller, method), req, *statuses,
+                header_list=('X-Container-Shard',))
+            self.assertEqual(seen_headers, [{'X-Container-Shard': None}] * 3)
+
 
 class TestContainerController(unittest.TestCase):
     "Test swift.proxy_server.ContainerController"
@@ -4251,6 +4761,92 @@ class TestContainerController(unittest.TestCase):
             res = method(req)
             self.assertEquals(res.status_int, expected)
 
+    def test_info_cache(self):
+        app = proxy_server.Application({'info_cache_size': '10',
+                                        'info_cache_ttl': '60'},
+                                       FakeMemcache(),
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing(),
+                                       object_ring=FakeRing())
+        try:
+            with save_globals():
+                controller = proxy_server.ContainerController(app, 'a', 'c')
+                set_http_connect(200, 200)
+                info = controller.container_info('a', 'c')
+                self.assertEquals(info['status'], 200)
+                # answered from the worker's memory from now on
+                app.memcache.store = {}
+                set_http_connect()
+                info = controller.container_info('a', 'c')
+                self.assertEquals(info['status'], 200)
+                self.assertEquals(controller.account_info('a')[2], 12345)
+                # until the proxy changes the container
+                set_http_connect(200, 201, 201, 201)
+                req = Request.blank('/a/c',
+                                    environ={'REQUEST_METHOD': 'POST'})
+                self.assertEquals(controller.POST(req).status_int, 201)
+                set_http_connect(404, 404, 404)
+                info = controller.container_info('a', 'c')
+                self.assertEquals(info['status'], 404)
+                # not found is kept too
+                set_http_connect()
+                info = controller.container_info('a', 'c')
+                self.assertEquals(info['nodes'], None)
+        finally:
+            proxy_server.Application(None, FakeMemcache(),
+                                     account_ring=FakeRing(),
+                                     container_ring=FakeRing(),
+                                     object_ring=FakeRing())
+
+    def test_info_single_cache_round_trip(self):
+        memcache = FakeMemcache()
+        lookups = []
+
+        def get_many(keys):
+            lookups.append(keys)
+            return [memcache.store.get(key) for key in keys]
+
+        def get(key):
+            lookups.append([key])
+            return memcache.store.get(key)
+
+        memcache.get_many = get_many
+        memcache.get = get
+        app = proxy_server.Application(None, memcache,
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing(),
+                                       object_ring=FakeRing())
+        with save_globals():
+            controller = proxy_server.ContainerController(app, 'a', 'c')
+            set_http_connect(200, 200)
+            info = controller.container_info('a', 'c')
+            self.assertEquals(info['status'], 200)
+            # both keys are looked up at once; the account info came along
+            self.assertEquals(lookups, [['container/a/c', 'account/a']])
+            self.assertEquals(controller.prefetched_info, {})
+            # the account info of a container cache hit isn't kept for later
+            del lookups[:]
+            controller = proxy_server.ContainerController(app, 'a', 'c')
+            set_http_connect()
+            info = controller.container_info('a', 'c')
+            self.assertEquals(info['status'], 200)
+            self.assertEquals(controller.prefetched_info, {})
+            self.assertEquals(controller.account_info('a')[2], 12345)
+            self.assertEquals(lookups, [['container/a/c', 'account/a'],
+                                        ['account/a']])
+            # nor is it fetched at all when the container info is in memory
+            del lookups[:]
+            info_cache = swift.proxy.controllers.base.info_cache
+            info_cache.configure(10, 10)
+            try:
+                controller.container_info('a', 'c')
+                del lookups[:]
+                info = controller.container_info('a', 'c')
+                self.assertEquals(info['status'], 200)
+                self.assertEquals(lookups, [])
+            finally:
+                info_cache.configure(0, 1)
+
     def test_HEAD(self):
         with save_globals():
             controller = proxy_server.ContainerController(self.app, 'account',
@@ -4676,6 +5272,202 @@ class TestContainerController(unittest.TestCase):
             self.assertEquals(res.content_length, 0)
             self.assertTrue('transfer-encoding' not in res.headers)
 
+    def _sharded_listing(self, query_string, root_resp=None, listings=None):
+        def obj(name, last_modified='2013-01-01T00:00:01.000000'):
+            return {'name': name, 'hash': 'x', 'bytes': 1,
+                    'content_type': 'text/plain',
+                    'last_modified': last_modified}
+
+        if listings is None:
+            listings = {
+                'c': [obj(u'c', '2013-01-01T00:00:02.000000')],
+                utils.get_shard_container('a', 'c', 0): [obj(u'a'),
+                                                         obj(u'c')],
+                utils.get_shard_container('a', 'c', 1): [obj(u'g'),
+                                                         obj(u'h')]}
+        calls = []
+
+        def fake_get_listing(req, account, container, params):
+            calls.append((account, container, params))
+            marker = params.get('marker', '')
+            return [row for row in listings[container]
+                    if row['name'] > marker][:params['limit']]
+
+        controller = proxy_server.ContainerController(self.app, 'a', 'c')
+        controller.shard_points = lambda account, container: ['f']
+        controller._get_listing = fake_get_listing
+        req = Request.blank('/a/c?' + query_string)
+        if root_resp is None:
+            root_resp = Response(body='c\n', content_type='text/plain')
+        resp = controller._sharded_listing(
+            req, root_resp, root_resp.content_type == 'application/json')
+        return resp, calls
+
+    def test_GET_sharded_listing(self):
+        resp, calls = self._sharded_listing('format=json')
+        self.assertEquals(resp.status_int, 200)
+        self.assertEquals(resp.content_type, 'application/json')
+        listing = simplejson.loads(resp.body)
+        self.assertEquals([row['name'] for row in listing],
+                          ['a', 'c', 'g', 'h'])
+        # the root's newer row wins
+        self.assertEquals(listing[1]['last_modified'],
+                          '2013-01-01T00:00:02.000000')
+        self.assertEquals([call[:2] for call in calls], [
+            ('a', 'c'),
+            ('.shards_a', utils.get_shard_container('a', 'c', 0)),
+            ('.shards_a', utils.get_shard_container('a', 'c', 1))])
+        # the next shard starts where the previous one left off
+        self.assertEquals(calls[2][2]['marker'], 'c')
+
+        resp, calls = self._sharded_listing('')
+        self.assertEquals(resp.body, 'a\nc\ng\nh\n')
+        self.assertEquals(resp.content_type, 'text/plain')
+
+        resp, calls = self._sharded_listing('format=xml')
+        self.assert_(resp.body.startswith(
+            '<?xml version="1.0" encoding="UTF-8"?>\n<container name="c">'
+            '<object><name>a</name><hash>x</hash><bytes>1</bytes>'
+            '<content_type>text/plain</content_type>'))
+        self.assertEquals(resp.body.count('<object>'), 4)
+
+    def test_GET_sharded_listing_reuses_root_json(self):
+        root_resp = Response(body='[]', content_type='application/json')
+        resp, calls = self._sharded_listing('format=json', root_resp)
+        self.assertEquals([call[1] for call in calls], [
+            utils.get_shard_container('a', 'c', 0),
+            utils.get_shard_container('a', 'c', 1)])
+        self.assertEquals([row['name'] for row in simplejson.loads(resp.body)],
+                          ['a', 'c', 'g', 'h'])
+
+    def test_GET_sharded_listing_newest_row(self):
+        def row(name, last_modified, deleted=False):
+            row = {'name': name, 'last_modified': last_modified}
+            if deleted:
+                row['deleted'] = 1
+            else:
+                row.update(hash='x', bytes=1, content_type='text/plain')
+            return row
+
+        old = '2013-01-01T00:00:01.000000'
+        new = '2013-01-01T00:00:02.000000'
+        listings = {
+            'c': [row(u'a', old), row(u'b', new), row(u'c', old),
+                  row(u'g', old)],
+            utils.get_shard_container('a', 'c', 0): [
+                row(u'a', new, True), row(u'b', old), row(u'c', new)],
+            utils.get_shard_container('a', 'c', 1): [row(u'g', new, True)]}
+        root_resp = Response(body=simplejson.dumps(listings['c']),
+                             content_type='application/json')
+        resp, calls = self._sharded_listing('', root_resp, listings)
+        # the moved and deleted 'a' and 'g' are gone, the root's newer 'b'
+        # wins, and the root listing is only read once
+        self.assertEquals(resp.body, 'b\nc\n')
+        self.assertEquals(len(calls), 2)
+
+        # past the end of a full page of the shards, the root's rows can't
+        # be told apart from ones moved into later shards
+        listings['c'] = [row(u'x', old)]
+        listings[utils.get_shard_container('a', 'c', 0)] = [
+            row(u'b', old), row(u'c', old)]
+        listings[utils.get_shard_container('a', 'c', 1)] = [row(u'x', new)]
+        resp, calls = self._sharded_listing('limit=2', listings=listings)
+        self.assertEquals(resp.body, 'b\nc\n')
+        self.assertEquals(len(calls), 2)
+
+    def test_GET_sharded_listing_params(self):
+        resp, calls = self._sharded_listing('limit=2')
+        self.assertEquals(resp.body, 'a\nc\n')
+        self.assertEquals(len(calls), 2)
+        resp, calls = self._sharded_listing('marker=f')
+        self.assertEquals(resp.body, 'g\nh\n')
+        self.assertEquals([call[1] for call in calls[1:]],
+                          [utils.get_shard_container('a', 'c', 1)])
+        resp, calls = self._sharded_listing('end_marker=d')
+        self.assertEquals(len(calls), 2)
+        resp, calls = self._sharded_listing('prefix=g')
+        self.assertEquals([call[1] for call in calls[1:]],
+                          [utils.get_shard_container('a', 'c', 1)])
+
+    def test_GET_sharded_container(self):
+        with save_globals():
+            set_http_connect(200, 200, body='[]',
+                             headers={'x-container-shard-count': '2',
+                                      'content-type': 'application/json'})
+            controller = proxy_server.ContainerController(self.app, 'a', 'c')
+            controller.shard_points = lambda account, container: ['f']
+            controller._get_listing = lambda *args: [
+                {'name': u'x', 'hash': 'x', 'bytes': 1,
+                 'content_type': 'text/plain',
+                 'last_modified': '2013-01-01T00:00:01.000000'}]
+            req = Request.blank('/a/c?format=json')
+            self.app.update_request(req)
+            res = controller.GET(req)
+            self.assertEquals(res.status_int, 200)
+            self.assertEquals(
+                [row['name'] for row in simplejson.loads(res.body)], ['x'])
+
+    def test_GET_known_sharded_container(self):
+        backend_requests = []
+
+        def capture(ipaddr, port, device, partition, method, path,
+                    headers=None, query_string=None):
+            backend_requests.append((query_string, headers))
+
+        with save_globals():
+            root_listing = [
+                {'name': u'x', 'hash': 'x', 'bytes': 1,
+                 'content_type': 'text/plain',
+                 'last_modified': '2013-01-01T00:00:01.000000'},
+                {'name': u'y', 'deleted': 1,
+                 'last_modified': '2013-01-01T00:00:01.000000'}]
+            set_http_connect(200, 200, body=simplejson.dumps(root_listing),
+                             headers={'x-container-shard-count': '2',
+                                      'content-type': 'application/json'},
+                             give_connect=capture)
+            self.app.memcache.store = {}
+            self.app.memcache.set(get_container_memcache_key('a', 'c'),
+                                  {'status': 200, 'shard_count': 2})
+            controller = proxy_server.ContainerController(self.app, 'a', 'c')
+            controller.shard_points = lambda account, container: ['f']
+            controller._get_listing = lambda *args: []
+            req = Request.blank('/a/c', headers={
+                'X-Container-List-Deleted': 'true'})
+            self.app.update_request(req)
+            res = controller.GET(req)
+            self.assertEquals(res.status_int, 200)
+            self.assertEquals(res.body, 'x\n')
+            # the root is listed once, in JSON with its deleted objects
+            self.assertEquals(len(backend_requests), 2)
+            self.assertTrue('format=json' in backend_requests[1][0])
+            self.assertEquals(
+                backend_requests[1][1]['X-Container-List-Deleted'], 'true')
+
+            # the client can't ask for deleted objects by itself
+            backend_requests[:] = []
+            self.app.memcache.store = {}
+            set_http_connect(200, 200, body='x\n', give_connect=capture)
+            req = Request.blank('/a/c', headers={
+                'X-Container-List-Deleted': 'true'})
+            self.app.update_request(req)
+            res = controller.GET(req)
+            self.assertEquals(res.body, 'x\n')
+            self.assertFalse('format=json' in
+                             (backend_requests[1][0] or ''))
+            self.assertFalse('X-Container-List-Deleted' in
+                             backend_requests[1][1])
+
+    def test_GET_sharded_listing_errors(self):
+        controller = proxy_server.ContainerController(self.app, 'a', 'c')
+        controller.shard_points = lambda account, container: None
+        req = Request.blank('/a/c')
+        resp = controller._sharded_listing(req, Response(body='c\n'))
+        self.assertEquals(resp.status_int, 503)
+        controller.shard_points = lambda account, container: ['f']
+        controller._get_listing = lambda *args: None
+        resp = controller._sharded_listing(req, Response(body='c\n'))
+        self.assertEquals(resp.status_int, 503)
+
     def test_GET_calls_authorize(self):
         called = [False]
 
@@ -5358,6 +6150,7 @@ class FakeObjectController(object):
         self.node_timeout = 1
         self.rate_limit_after_segment = 3
         self.rate_limit_segments_per_sec = 2
+        self.segment_read_ahead = 0
 
     def exception(self, *args):
         self.exception_args = args
@@ -5507,6 +6300,99 @@ class TestSegmentedIterable(unittest.TestCase):
         finally:
             swift.proxy.controllers.obj.sleep = orig_sleep
 
+    def test_load_next_segment_read_ahead(self):
+        paths = []
+        orig_GETorHEAD_base = self.controller.GETorHEAD_base
+
+        def local_GETorHEAD_base(*args):
+            paths.append(args[4])
+            return orig_GETorHEAD_base(*args)
+
+        self.controller.GETorHEAD_base = local_GETorHEAD_base
+        self.controller.segment_read_ahead = 2
+        self.controller.rate_limit_after_segment = 10
+        segit = SegmentedIterable(
+            self.controller, 'lc', [{'name': 'o%d' % i} for i in xrange(1, 6)])
+        segit._load_next_segment()
+        self.assertEquals(paths, ['/a/lc/o1'])
+        self.assertEquals([d['name'] for d, getter in segit.prefetched],
+                          ['o2', 'o3'])
+        # the next segments are requested while the current one streams
+        sleep(0)
+        self.assertEquals(paths, ['/a/lc/o1', '/a/lc/o2', '/a/lc/o3'])
+        self.assertEquals(''.join(segit.segment_iter), '1')
+        segit._load_next_segment()
+        self.assertEquals(''.join(segit.segment_iter), '22')
+        self.assertEquals([d['name'] for d, getter in segit.prefetched],
+                          ['o3', 'o4'])
+        segit.response = Stub()
+        self.assertEquals(''.join(segit), '333444455555')
+        self.assertEquals(segit.prefetched, [])
+        self.assertEquals(paths, ['/a/lc/o%d' % i for i in xrange(1, 6)])
+
+    def test_load_next_segment_read_ahead_rate_limiting(self):
+        sleep_calls = []
+
+        def _stub_sleep(sleepy_time):
+            sleep_calls.append(sleepy_time)
+        orig_sleep = swift.proxy.controllers.obj.sleep
+        try:
+            swift.proxy.controllers.obj.sleep = _stub_sleep
+            self.controller.segment_read_ahead = 3
+            self.controller.rate_limit_after_segment = 2
+            segit = SegmentedIterable(
+                self.controller, 'lc', [
+                    {'name': 'o1'}, {'name': 'o2'}, {'name': 'o3'},
+                    {'name': 'o4'}])
+            segit._load_next_segment()
+            # reading ahead never waits for the rate limit
+            self.assertEquals([d['name'] for d, getter in segit.prefetched],
+                              ['o2'])
+            segit._load_next_segment()
+            self.assertEquals(segit.prefetched, [])
+            self.assertEquals(sleep_calls, [])
+            segit._load_next_segment()
+            self.assertEquals(self.controller.GETorHEAD_base_args[4],
+                              '/a/lc/o3')
+            self.assertAlmostEqual(0.5, sleep_calls[0], places=2)
+        finally:
+            swift.proxy.controllers.obj.sleep = orig_sleep
+
+    def test_app_iter_range_read_ahead(self):
+        paths = []
+        orig_GETorHEAD_base = self.controller.GETorHEAD_base
+
+        def local_GETorHEAD_base(*args):
+            paths.append(args[4])
+            return orig_GETorHEAD_base(*args)
+
+        self.controller.GETorHEAD_base = local_GETorHEAD_base
+        self.controller.segment_read_ahead = 3
+        self.controller.rate_limit_after_segment = 10
+        listing = [{'name': 'o1', 'bytes': 1}, {'name': 'o2', 'bytes': 2},
+                   {'name': 'o3', 'bytes': 3}, {'name': 'o4', 'bytes': 4},
+                   {'name': 'o5', 'bytes': 5}]
+
+        # the read ahead starts at the first segment of the range
+        segit = SegmentedIterable(self.controller, 'lc', listing)
+        segit.response = Stub()
+        self.assertEquals(''.join(segit.app_iter_range(3, None)),
+                          '333444455555')
+        self.assertEquals(paths, ['/a/lc/o3', '/a/lc/o4', '/a/lc/o5'])
+
+        # and does not go past its end
+        del paths[:]
+        segit = SegmentedIterable(self.controller, 'lc', listing)
+        segit.response = Stub()
+        self.assertEquals(''.join(segit.app_iter_range(4, 8)), '3344')
+        self.assertEquals(paths, ['/a/lc/o3', '/a/lc/o4'])
+
+        del paths[:]
+        segit = SegmentedIterable(self.controller, 'lc', listing)
+        segit.response = Stub()
+        self.assertEquals(''.join(segit.app_iter_range(None, 2)), '12')
+        self.assertEquals(paths, ['/a/lc/o1', '/a/lc/o2'])
+
     def test_load_next_segment_with_two_segments_skip_first(self):
         segit = SegmentedIterable(self.controller, 'lc', [{'name':
                                   'o1'}, {'name': 'o2'}])
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2013 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Times RingBuilder.rebalance on a synthetic ring.
+
+The ring is built with a fixed seed, balanced, and then rebalanced after
+removing some devices, adding as many new ones and reweighting a few others,
+as happens when failed drives are swapped out. The checksum printed at the end
+covers the resulting partition assignments, so runs of different versions of
+the builder can be checked to produce the same ring as well as timed against
+each other::
+
+    python tools/ring_builder_benchmark.py --part-power 18 --devices 2000
+    git checkout <older version>
+    python tools/ring_builder_benchmark.py --part-power 18 --devices 2000
+"""
+
+import random
+import sys
+from hashlib import md5
+from optparse import OptionParser
+from os.path import abspath, dirname, join
+from time import time
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+from swift.common.ring import RingBuilder
+
+
+def build(options):
+    random.seed(options.seed)
+    builder = RingBuilder(options.part_power, options.replicas, 1)
+    for dev_id in xrange(options.devices):
+        zone = dev_id % options.zones
+        server = dev_id / options.zones % options.servers_per_zone
+        builder.add_dev({
+            'id': dev_id, 'region': zone % options.regions + 1,
+            'zone': zone, 'ip': '10.%d.%d.1' % (zone, server),
+            'port': 6000, 'device': 'sd%d' % dev_id,
+            'weight': random.choice((100, 100, 200, 300))})
+    return builder
+
+
+def change(builder, options):
+    """
+    Swaps out options.changes devices and reweights as many others.
+    """
+    rand = random.Random(options.seed)
+    dev_ids = [dev['id'] for dev in builder.devs if dev]
+    changed = rand.sample(dev_ids, 2 * options.changes)
+    for dev_id in changed[:options.changes]:
+        dev = builder.devs[dev_id]
+        builder.remove_dev(dev_id)
+        builder.add_dev({
+            'region': dev['region'], 'zone': dev['zone'], 'ip': dev['ip'],
+            'port': dev['port'], 'device': dev['device'] + 'n',
+            'weight': dev['weight']})
+    for dev_id in changed[options.changes:]:
+        builder.set_dev_weight(dev_id, builder.devs[dev_id]['weight'] * 1.5)
+    builder.pretend_min_part_hours_passed()
+
+
+def checksum(builder):
+    digest = md5()
+    for part2dev in builder._replica2part2dev:
+        digest.update(part2dev.tostring())
+    return digest.hexdigest()
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--part-power', type='int', default=16)
+    parser.add_option('--replicas', type='float', default=3)
+    parser.add_option('--devices', type='int', default=1000)
+    parser.add_option('--regions', type='int', default=2)
+    parser.add_option('--zones', type='int', default=8)
+    parser.add_option('--servers-per-zone', type='int', default=10)
+    parser.add_option('--changes', type='int', default=10,
+                      help='number of devices to swap out and to reweight')
+    parser.add_option('--seed', type='int', default=1)
+    options, args = parser.parse_args()
+
+    builder = build(options)
+    begin = time()
+    builder.rebalance(seed=options.seed)
+    print 'initial balance: %.2fs' % (time() - begin)
+
+    change(builder, options)
+    begin = time()
+    parts, balance = builder.rebalance(seed=options.seed)
+    print 'rebalance: %.2fs, %d partitions moved, balance %.2f' % (
+        time() - begin, parts, balance)
+    print 'checksum: %s' % checksum(builder)
+
+
+if __name__ == '__main__':
+    main()
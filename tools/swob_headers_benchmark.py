@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# Copyright (c) 2010-2013 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Times the swob header work the proxy does for each small request: looking up
+request headers, copying them for the backend requests of the object servers,
+and building and sending out a response. Run it before and after a change to
+swob to compare::
+
+    python tools/swob_headers_benchmark.py --requests 20000
+    git checkout <older version>
+    python tools/swob_headers_benchmark.py --requests 20000
+"""
+
+import sys
+from optparse import OptionParser
+from os.path import abspath, dirname, join
+from time import time
+
+sys.path.insert(0, abspath(join(dirname(__file__), '..')))
+
+from swift.common.swob import HeaderKeyDict, Request, Response
+
+# what a client typically sends along with an object GET or PUT
+CLIENT_HEADERS = {
+    'Host': 'swift.example.com',
+    'User-Agent': 'python-swiftclient-1.3.0',
+    'Accept-Encoding': 'identity',
+    'X-Auth-Token': 'AUTH_tk0123456789abcdef0123456789abcdef',
+    'Content-Type': 'application/octet-stream',
+    'Content-Length': '4096',
+    'Etag': '0123456789abcdef0123456789abcdef',
+    'X-Object-Meta-Color': 'blue',
+    'X-Object-Meta-Mtime': '1364406418.52',
+    'X-Timestamp': '1364406418.52391',
+}
+# the other keys a WSGI server and the proxy middleware put in the environ
+ENVIRON = {
+    'SERVER_NAME': 'swift.example.com', 'SERVER_PORT': '8080',
+    'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '10.0.0.1',
+    'REMOTE_PORT': '51234', 'SCRIPT_NAME': '', 'GATEWAY_INTERFACE': 'CGI/1.1',
+    'wsgi.url_scheme': 'http', 'wsgi.multithread': True,
+    'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    'swift.trans_id': 'tx0123456789abcdef01234567890abcdef',
+    'swift.authorize': None, 'swift.cache': None, 'REMOTE_USER': 'test,',
+}
+
+
+def request_headers(req):
+    for name in ('X-Newest', 'Range', 'If-Match', 'If-None-Match',
+                 'Content-Type', 'Content-Length', 'X-Timestamp',
+                 'X-Delete-At', 'X-Copy-From', 'Transfer-Encoding'):
+        req.headers.get(name)
+        name in req.headers
+
+
+def backend_headers(req, replicas):
+    headers = [dict(req.headers.iteritems()) for _junk in xrange(replicas)]
+    for header in headers:
+        header['Connection'] = 'close'
+        header['X-Container-Partition'] = '1234'
+    # and one copy more for each connection to a node
+    for header in headers:
+        dict(header)
+
+
+def response(req):
+    resp = Response(request=req, status=201, headers={
+        'Content-Type': 'text/html; charset=UTF-8',
+        'Etag': '0123456789abcdef0123456789abcdef',
+        'Last-Modified': 'Wed, 27 Mar 2013 17:46:58 GMT',
+        'X-Trans-Id': 'tx0123456789abcdef01234567890abcdef'})
+    resp.headers.update(HeaderKeyDict(req.headers))
+    ''.join(resp(req.environ, lambda status, headers: None))
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--requests', type='int', default=10000)
+    parser.add_option('--replicas', type='int', default=3)
+    options, args = parser.parse_args()
+
+    reqs = [Request.blank('/v1/a/c/o%d' % i, environ=dict(ENVIRON),
+                          headers=CLIENT_HEADERS)
+            for i in xrange(options.requests)]
+    total = 0
+    for name, func in (
+            ('request headers', request_headers),
+            ('backend headers',
+             lambda req: backend_headers(req, options.replicas)),
+            ('response', response)):
+        begin = time()
+        for req in reqs:
+            func(req)
+        elapsed = time() - begin
+        total += elapsed
+        print '%s: %.2fs, %.1fus per request' % (
+            name, elapsed, elapsed * 1000000 / options.requests)
+    print 'total: %.2fs' % total
+
+
+if __name__ == '__main__':
+    main()